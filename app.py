@@ -4,12 +4,38 @@ utilizando as regras do arquivo limpezaservicos.mdc e a API do Gemini.
 """
 
 import os
+import asyncio
+import atexit
+import contextvars
+import itertools
 import json
-import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context, url_for
 from dotenv import load_dotenv
-from google import genai
+from google.genai import types
+
+from backends_llm import BackendGemini, BackendLocal
+from cache_contexto import CacheContexto
+from cache_respostas import CacheRespostas, gerar_chave
+from coalescencia import Coalescencia
+from compilador_prompts import VARIANTES as VARIANTES_PROMPT, CompiladorPrompts
+from documentos_longos import anotar_trecho, dividir_em_trechos, mesclar_resultados
+from especulacao import CopiaDescartada, Especulacao, copia_descartada
+from extrator_json import ExtratorJSONIncremental, extrair_objeto
+from fila_jobs import CONCLUIDO, ERRO, FilaJobs
+from limitador_taxa import FilaEsgotada, LimitadorTaxa
+from metricas import RegistroMetricas
+from normalizacao_entrada import normalizar_entrada
+from orcamento_tokens import OrcamentoExcedido, OrcamentoTokens, estimar_tokens
+from registro_prompts import RegistroPrompts
+from reparo_resposta import VALOR_TRUNCADO, RespostaInvalida, converter_valor, reparar_json, validar_campos
+from resiliencia import Disjuntor, ModeloIndisponivel, Resiliencia
+from roteador_modelos import RoteadorModelos
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -18,69 +44,551 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
 
-if not GEMINI_API_KEY:
+# Backend do modelo: 'gemini' (API real) ou 'local' (substituto para testes de carga)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+
+if not GEMINI_API_KEY and LLM_BACKEND == 'gemini':
     print("AVISO: GEMINI_API_KEY não encontrada no arquivo .env")
 
-client = None
-if GEMINI_API_KEY:
-    client = genai.Client(api_key=GEMINI_API_KEY)
+
+def criar_backend(nome=None):
+    """Cria o backend do modelo configurado em LLM_BACKEND"""
+    nome = nome or LLM_BACKEND
+    if nome == 'local':
+        resposta = None
+        arquivo_resposta = os.getenv('LLM_LOCAL_RESPOSTA')
+        if arquivo_resposta:
+            with open(arquivo_resposta, 'r', encoding='utf-8') as f:
+                resposta = f.read()
+        semente = os.getenv('LLM_LOCAL_SEMENTE')
+        return BackendLocal(
+            latencia=float(os.getenv('LLM_LOCAL_LATENCIA', '0.5')),
+            jitter=float(os.getenv('LLM_LOCAL_JITTER', '0.0')),
+            taxa_falha=float(os.getenv('LLM_LOCAL_TAXA_FALHA', '0.0')),
+            resposta=resposta,
+            semente=int(semente) if semente else None,
+            cache_contexto=os.getenv('LLM_LOCAL_CACHE_CONTEXTO', '0') == '1',
+            taxa_lentidao=float(os.getenv('LLM_LOCAL_TAXA_LENTIDAO', '0.0')),
+            fator_lentidao=float(os.getenv('LLM_LOCAL_FATOR_LENTIDAO', '10')),
+        )
+    if nome == 'gemini':
+        return BackendGemini(GEMINI_API_KEY)
+    raise ValueError(f"LLM_BACKEND desconhecido: {nome}")
+
+
+backend_llm = criar_backend()
 
 # Cria a aplicação Flask
 app = Flask(__name__)
 
-# Caminho do arquivo de regras
+# Diretório dos templates de prompt
+BASE_DIR = Path(__file__).resolve().parent
+PROMPTS_DIR = BASE_DIR / 'prompts'
+
+# Templates carregados uma única vez; relidos apenas quando o arquivo muda
+registro_prompts = RegistroPrompts(PROMPTS_DIR)
+registro_prompts.carregar_todos()
+
+# Templates analisados uma vez por versão, com as variantes das regras prontas
+# ('completo' ou 'compacto', sem exemplos em blocos de código)
+PROMPT_VARIANTE = os.getenv('PROMPT_VARIANTE', 'completo')
+if PROMPT_VARIANTE not in VARIANTES_PROMPT:
+    raise ValueError(f"PROMPT_VARIANTE deve ser um de {', '.join(VARIANTES_PROMPT)}")
+compilador_prompts = CompiladorPrompts(registro_prompts)
+
+# Cache persistente de resultados (desative com CACHE_RESPOSTAS=0)
+CACHE_RESPOSTAS = os.getenv('CACHE_RESPOSTAS', '1') != '0'
+CACHE_RESPOSTAS_ARQUIVO = os.getenv('CACHE_RESPOSTAS_ARQUIVO', str(BASE_DIR / 'cache_respostas.sqlite3'))
+CACHE_RESPOSTAS_TTL = int(os.getenv('CACHE_RESPOSTAS_TTL', str(7 * 24 * 3600)))
+CACHE_RESPOSTAS_MAX = int(os.getenv('CACHE_RESPOSTAS_MAX', '5000'))
+
+cache_respostas = None
+if CACHE_RESPOSTAS:
+    cache_respostas = CacheRespostas(
+        CACHE_RESPOSTAS_ARQUIVO,
+        ttl_segundos=CACHE_RESPOSTAS_TTL,
+        max_entradas=CACHE_RESPOSTAS_MAX,
+    )
+
+# Resiliência das chamadas ao modelo: prazo total por chamada (com retentativas),
+# retentativas com espera exponencial para erros transitórios (429, 5xx, timeout)
+# e disjuntor que falha imediatamente após falhas consecutivas
+GEMINI_PRAZO = float(os.getenv('GEMINI_PRAZO', '60'))
+GEMINI_TENTATIVAS = int(os.getenv('GEMINI_TENTATIVAS', '3'))
+GEMINI_ESPERA_BASE = float(os.getenv('GEMINI_ESPERA_BASE', '0.5'))
+GEMINI_ESPERA_MAXIMA = float(os.getenv('GEMINI_ESPERA_MAXIMA', '8'))
+GEMINI_CIRCUITO_FALHAS = int(os.getenv('GEMINI_CIRCUITO_FALHAS', '5'))
+GEMINI_CIRCUITO_ABERTO = float(os.getenv('GEMINI_CIRCUITO_ABERTO', '30'))
+
+# Um conjunto (prazo, retentativas, disjuntor) por modelo
+resiliencias = {}
+_lock_resiliencias = threading.Lock()
+
+
+def resiliencia_modelo(modelo):
+    """Camada de resiliência do modelo, criada no primeiro uso"""
+    with _lock_resiliencias:
+        if modelo not in resiliencias:
+            resiliencias[modelo] = Resiliencia(
+                tentativas=GEMINI_TENTATIVAS,
+                espera_base=GEMINI_ESPERA_BASE,
+                espera_maxima=GEMINI_ESPERA_MAXIMA,
+                prazo=GEMINI_PRAZO,
+                disjuntor=Disjuntor(GEMINI_CIRCUITO_FALHAS, GEMINI_CIRCUITO_ABERTO),
+            )
+        return resiliencias[modelo]
+
+
+# Roteamento entre modelos: entradas pequenas vão para o modelo leve (se
+# configurado), as demais para GEMINI_MODEL; o de fallback é usado quando os
+# anteriores estão indisponíveis ou com muitos erros/latência alta
+GEMINI_MODELO_LEVE = os.getenv('GEMINI_MODELO_LEVE', '')
+GEMINI_MODELO_FALLBACK = os.getenv('GEMINI_MODELO_FALLBACK', '')
+GEMINI_MODELO_LEVE_MAX_TOKENS_SERVICO = int(os.getenv('GEMINI_MODELO_LEVE_MAX_TOKENS_SERVICO', '4000'))
+GEMINI_MODELO_LEVE_MAX_TOKENS_INFORMACAO = int(os.getenv('GEMINI_MODELO_LEVE_MAX_TOKENS_INFORMACAO', '8000'))
+
+roteador_modelos = RoteadorModelos(
+    GEMINI_MODEL,
+    leve=GEMINI_MODELO_LEVE,
+    fallback=GEMINI_MODELO_FALLBACK,
+    limites_leve={
+        'servico': GEMINI_MODELO_LEVE_MAX_TOKENS_SERVICO,
+        'informacao': GEMINI_MODELO_LEVE_MAX_TOKENS_INFORMACAO,
+    },
+    disponivel=lambda modelo: resiliencia_modelo(modelo).disjuntor.estado != Disjuntor.ABERTO,
+)
+for _modelo in roteador_modelos.modelos:
+    resiliencia_modelo(_modelo)
+
+
+def estatisticas_resiliencia():
+    """Estatísticas da resiliência por modelo"""
+    with _lock_resiliencias:
+        modelos = dict(resiliencias)
+    return {modelo: camada.estatisticas() for modelo, camada in modelos.items()}
+
+# Limite de chamadas ao modelo por minuto, compartilhado entre threads e processos
+# (0 desativa). Sem ficha disponível, a chamada aguarda na fila; o tráfego
+# interativo tem prioridade e uma reserva do balde em relação aos lotes
+GEMINI_LIMITE_POR_MINUTO = float(os.getenv('GEMINI_LIMITE_POR_MINUTO', '0'))
+GEMINI_LIMITE_RAJADA = float(os.getenv('GEMINI_LIMITE_RAJADA', '0'))
+GEMINI_LIMITE_RESERVA_INTERATIVO = float(os.getenv('GEMINI_LIMITE_RESERVA_INTERATIVO', '0.25'))
+GEMINI_LIMITE_ESPERA_MAXIMA = float(os.getenv('GEMINI_LIMITE_ESPERA_MAXIMA', '120'))
+GEMINI_LIMITE_ARQUIVO = os.getenv('GEMINI_LIMITE_ARQUIVO', str(BASE_DIR / 'limite_taxa.sqlite3'))
+
+limitador_taxa = None
+if GEMINI_LIMITE_POR_MINUTO > 0:
+    limitador_taxa = LimitadorTaxa(
+        GEMINI_LIMITE_ARQUIVO,
+        por_minuto=GEMINI_LIMITE_POR_MINUTO,
+        rajada=GEMINI_LIMITE_RAJADA or None,
+        reserva_interativo=GEMINI_LIMITE_RESERVA_INTERATIVO,
+    )
+
+# Requisições especulativas: se o modelo não respondeu após o percentil de latência
+# recente, uma segunda chamada idêntica é disparada e vale a primeira resposta.
+# O orçamento limita as chamadas extras a uma fração das chamadas feitas
+GEMINI_ESPECULACAO = os.getenv('GEMINI_ESPECULACAO', '0') == '1'
+GEMINI_ESPECULACAO_PERCENTIL = float(os.getenv('GEMINI_ESPECULACAO_PERCENTIL', '95'))
+GEMINI_ESPECULACAO_ORCAMENTO = float(os.getenv('GEMINI_ESPECULACAO_ORCAMENTO', '0.05'))
+GEMINI_ESPECULACAO_MIN_AMOSTRAS = int(os.getenv('GEMINI_ESPECULACAO_MIN_AMOSTRAS', '20'))
+GEMINI_ESPECULACAO_THREADS = int(os.getenv('GEMINI_ESPECULACAO_THREADS', '16'))
+
+especulacao = None
+if GEMINI_ESPECULACAO:
+    especulacao = Especulacao(
+        percentil=GEMINI_ESPECULACAO_PERCENTIL,
+        orcamento=GEMINI_ESPECULACAO_ORCAMENTO,
+        min_amostras=GEMINI_ESPECULACAO_MIN_AMOSTRAS,
+        max_threads=GEMINI_ESPECULACAO_THREADS,
+    )
+
+# Classe de prioridade das chamadas feitas no contexto atual ('interativo' ou 'lote')
+prioridade_chamada = contextvars.ContextVar('prioridade_chamada', default='interativo')
+
+# Modelos que responderam às chamadas da requisição atual (conjunto compartilhado com
+# as cópias do contexto usadas pelos grupos de campos; None fora de um pipeline)
+modelos_resposta = contextvars.ContextVar('modelos_resposta', default=None)
+
+# Requisições idênticas simultâneas aguardam a primeira e compartilham o resultado (0 desativa)
+COALESCER_REQUISICOES = os.getenv('COALESCER_REQUISICOES', '1') != '0'
+coalescencia = Coalescencia() if COALESCER_REQUISICOES else None
+
+# Cache de contexto: as regras de cada tipo ficam registradas no provedor e só o
+# texto de entrada + instruções são enviados a cada chamada (1 ativa). Cada processo
+# registra os próprios caches, cobrados por armazenamento; são removidos ao encerrar
+GEMINI_CACHE_CONTEXTO = os.getenv('GEMINI_CACHE_CONTEXTO', '0') == '1'
+GEMINI_CACHE_CONTEXTO_TTL = int(os.getenv('GEMINI_CACHE_CONTEXTO_TTL', '3600'))
+GEMINI_CACHE_CONTEXTO_TIMEOUT = float(os.getenv('GEMINI_CACHE_CONTEXTO_TIMEOUT', '10'))
+
+cache_contexto = (
+    CacheContexto(backend_llm, GEMINI_CACHE_CONTEXTO_TTL, GEMINI_CACHE_CONTEXTO_TIMEOUT)
+    if GEMINI_CACHE_CONTEXTO else None
+)
+if cache_contexto is not None:
+    atexit.register(cache_contexto.limpar)
+
+# Structured output: o modelo devolve JSON conforme um esquema com os campos do tipo
+GEMINI_SAIDA_ESTRUTURADA = os.getenv('GEMINI_SAIDA_ESTRUTURADA', '0') == '1'
 
+# Processamento em lote: concorrência máxima de chamadas ao Gemini e tamanho do lote
+LOTE_MAX_CONCORRENCIA = int(os.getenv('LOTE_MAX_CONCORRENCIA', '8'))
+LOTE_MAX_ITENS = int(os.getenv('LOTE_MAX_ITENS', '500'))
 
+# Pool compartilhado entre requisições, para limitar o total de chamadas simultâneas
+executor_lote = ThreadPoolExecutor(max_workers=LOTE_MAX_CONCORRENCIA, thread_name_prefix='lote')
+
+# Textos muito longos são divididos em trechos processados em paralelo e mesclados
+# (modo 'longo'); acima de DOCUMENTO_LONGO_CARACTERES isso é automático (0 desativa)
+DOCUMENTO_LONGO_CARACTERES = int(os.getenv('DOCUMENTO_LONGO_CARACTERES', '40000'))
+DOCUMENTO_LONGO_TRECHO = int(os.getenv('DOCUMENTO_LONGO_TRECHO', '12000'))
+# Cada trecho é uma chamada ao modelo: limite da soma dos prompts estimados de todos os trechos (0 desativa)
+DOCUMENTO_LONGO_ORCAMENTO_TOKENS = int(os.getenv('DOCUMENTO_LONGO_ORCAMENTO_TOKENS', '64000'))
+
+# Pool próprio para os trechos: itens de lote (já no executor_lote) podem ser textos longos
+executor_trechos = ThreadPoolExecutor(max_workers=LOTE_MAX_CONCORRENCIA, thread_name_prefix='trechos')
+
+# Geração paralela por grupos de campos (modo 'paralelo'): cada grupo é gerado em
+# uma chamada própria, com só as regras dos seus campos, e os resultados são
+# reunidos. Grupos separados por ';' e campos por ','. GERACAO_PARALELA=1 usa
+# o modo por padrão
+GRUPOS_CAMPOS_SERVICO = os.getenv(
+    'GRUPOS_CAMPOS_SERVICO',
+    'descricao_resumida,descricao_completa;'
+    'servico_nao_cobre,tempo_atendimento,custo,resultado_solicitacao;'
+    'documentos_necessarios,instrucoes_solicitante;'
+    'canais_digitais,canais_presenciais,legislacao_relacionada'
+)
+GERACAO_PARALELA = os.getenv('GERACAO_PARALELA', '0') == '1'
+
+# Pool próprio para os grupos: o fluxo pode já estar rodando em executor_lote ou executor_trechos
+executor_campos = ThreadPoolExecutor(max_workers=LOTE_MAX_CONCORRENCIA * 4, thread_name_prefix='campos')
+
+# Normalização do texto de entrada antes do prompt e da chave de cache: remove
+# HTML, colapsa espaços e descarta parágrafos repetidos. Quase iguais só com
+# ENTRADA_LIMIAR_SEMELHANCA < 1 (desativado por padrão) e nunca se os números diferem.
+# Parágrafos menores que ENTRADA_DEDUP_MIN_CARACTERES nunca são descartados
+ENTRADA_NORMALIZAR = os.getenv('ENTRADA_NORMALIZAR', '1') != '0'
+ENTRADA_LIMIAR_SEMELHANCA = float(os.getenv('ENTRADA_LIMIAR_SEMELHANCA', '1'))
+ENTRADA_DEDUP_MIN_CARACTERES = int(os.getenv('ENTRADA_DEDUP_MIN_CARACTERES', '40'))
+
+# JSON malformado na resposta é reparado localmente (reparo_resposta.py); só
+# quando o reparo não basta a chamada é refeita, até RESPOSTA_REGENERACOES vezes
+RESPOSTA_REGENERACOES = int(os.getenv('RESPOSTA_REGENERACOES', '1'))
+
+# Orçamento de tokens do prompt (regras + texto de entrada) por tipo; 0 desativa o limite
+ORCAMENTO_TOKENS_SERVICO = int(os.getenv('ORCAMENTO_TOKENS_SERVICO', '32000'))
+ORCAMENTO_TOKENS_INFORMACAO = int(os.getenv('ORCAMENTO_TOKENS_INFORMACAO', '32000'))
+
+orcamento_tokens = OrcamentoTokens(
+    {'servico': ORCAMENTO_TOKENS_SERVICO, 'informacao': ORCAMENTO_TOKENS_INFORMACAO},
+    limite_padrao=ORCAMENTO_TOKENS_SERVICO,
+)
+
+# Métricas expostas em /metrics (formato Prometheus)
+metricas = RegistroMetricas()
+metrica_etapa = metricas.histograma(
+    'servicosclean_etapa_segundos',
+    'Duração de cada etapa do processamento, em segundos',
+    ('etapa', 'tipo', 'modelo')
+)
+metrica_requisicoes = metricas.contador(
+    'servicosclean_requisicoes_total',
+    'Requisições atendidas por rota, tipo e status HTTP',
+    ('rota', 'tipo', 'status')
+)
+metrica_requisicoes_em_andamento = metricas.gauge(
+    'servicosclean_requisicoes_em_andamento',
+    'Requisições sendo atendidas no momento',
+    ('rota',)
+)
+metrica_chamadas_em_andamento = metricas.gauge(
+    'servicosclean_chamadas_modelo_em_andamento',
+    'Chamadas ao modelo aguardando resposta',
+    ('modelo',)
+)
+metrica_tokens_prompt = metricas.histograma(
+    'servicosclean_prompt_tokens_estimados',
+    'Tamanho estimado do prompt, em tokens, antes da chamada ao modelo',
+    ('tipo',),
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+)
+metrica_orcamento_excedido = metricas.contador(
+    'servicosclean_orcamento_excedido_total',
+    'Entradas recusadas por ultrapassarem o orçamento de tokens',
+    ('tipo',)
+)
+metrica_trechos = metricas.histograma(
+    'servicosclean_documento_longo_trechos',
+    'Quantidade de trechos em que cada texto longo foi dividido',
+    ('tipo',),
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32)
+)
+metrica_espera_limite = metricas.histograma(
+    'servicosclean_limite_taxa_espera_segundos',
+    'Tempo de espera na fila do limitador de taxa antes da chamada ao modelo',
+    ('classe',),
+    buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+metrica_fallback_modelo = metricas.contador(
+    'servicosclean_fallback_modelo_total',
+    'Chamadas repassadas ao próximo modelo candidato por indisponibilidade do anterior',
+    ('tipo', 'modelo')
+)
+metrica_grupos_campos = metricas.histograma(
+    'servicosclean_grupos_campos',
+    'Chamadas paralelas (grupos de campos) por requisição no modo paralelo',
+    ('tipo',),
+    buckets=(1, 2, 3, 4, 6, 8, 12)
+)
+metrica_campos_reprocessados = metricas.contador(
+    'servicosclean_campos_reprocessados_total',
+    'Campos regenerados individualmente (reprocessamento parcial em /processar)',
+    ('tipo', 'campo')
+)
+metrica_entrada_caracteres_removidos = metricas.contador(
+    'servicosclean_entrada_caracteres_removidos_total',
+    'Caracteres removidos do texto de entrada pela normalização',
+    ('tipo',)
+)
+metrica_entrada_tokens_economizados = metricas.contador(
+    'servicosclean_entrada_tokens_economizados_total',
+    'Tokens estimados economizados no prompt pela normalização da entrada',
+    ('tipo',)
+)
+metrica_entrada_paragrafos_removidos = metricas.contador(
+    'servicosclean_entrada_paragrafos_removidos_total',
+    'Parágrafos descartados da entrada por serem repetidos (duplicado) ou quase iguais (semelhante)',
+    ('tipo', 'motivo')
+)
+metrica_reparos_json = metricas.contador(
+    'servicosclean_reparos_json_total',
+    'Reparos aplicados localmente ao JSON da resposta do modelo',
+    ('tipo', 'reparo')
+)
+metrica_regeneracoes_evitadas = metricas.contador(
+    'servicosclean_regeneracoes_evitadas_total',
+    'Respostas com JSON malformado aproveitadas pelo reparo local, sem nova chamada ao modelo',
+    ('tipo',)
+)
+metrica_regeneracoes = metricas.contador(
+    'servicosclean_regeneracoes_total',
+    'Chamadas refeitas porque o JSON da resposta não pôde ser reparado',
+    ('tipo',)
+)
+metrica_campos_corrigidos = metricas.contador(
+    'servicosclean_campos_corrigidos_total',
+    'Campos do resultado fora do esquema (ausentes ou de outro tipo) corrigidos na validação',
+    ('tipo', 'correcao')
+)
+metrica_tokens = metricas.contador(
+    'servicosclean_tokens_total',
+    'Tokens consumidos nas chamadas ao modelo',
+    ('tipo', 'modelo', 'direcao')
+)
+
+# Campos esperados na resposta de cada tipo
+CAMPOS_INFORMACAO = ['o_que_e', 'como_funciona', 'publico_alvo', 'informacoes_importantes']
+CAMPOS_SERVICO = [
+    'descricao_resumida', 'descricao_completa', 'servico_nao_cobre',
+    'tempo_atendimento', 'custo', 'resultado_solicitacao',
+    'documentos_necessarios', 'instrucoes_solicitante',
+    'canais_digitais', 'canais_presenciais', 'legislacao_relacionada'
+]
+
+
+def ler_grupos_campos(configuracao, campos):
+    """
+    Lê os grupos da configuração ('a,b;c,d'). Campos desconhecidos geram
+    erro e campos fora de todos os grupos formam um grupo final.
+    """
+    grupos = [[c.strip() for c in grupo.split(',') if c.strip()] for grupo in configuracao.split(';')]
+    grupos = [g for g in grupos if g]
+    desconhecidos = [c for g in grupos for c in g if c not in campos]
+    if desconhecidos:
+        raise ValueError(f"Campos desconhecidos em GRUPOS_CAMPOS_SERVICO: {', '.join(desconhecidos)}")
+    restantes = [c for c in campos if not any(c in g for g in grupos)]
+    return grupos + [restantes] if restantes else grupos
+
+
+# Só o template de serviço tem regras por campo (o de informação vai inteiro)
+GRUPOS_CAMPOS = {'servico': ler_grupos_campos(GRUPOS_CAMPOS_SERVICO, CAMPOS_SERVICO)}
+
+
+# Descrição em texto das chaves esperadas (modo sem esquema de resposta)
+FORMATO_SAIDA = {
+    'informacao': """Retorne APENAS um JSON com os seguintes campos (use os nomes exatos das chaves):
+
+- `o_que_e`: string (Markdown)
+- `como_funciona`: string (Markdown)
+- `publico_alvo`: string (Markdown)
+- `informacoes_importantes`: string (Markdown)
+
+Se uma informação não estiver disponível, retorne string vazia.""",
+    'servico': """Retorne APENAS um JSON com os seguintes campos:
+- `descricao_resumida`
+- `descricao_completa`
+- `servico_nao_cobre`
+- `tempo_atendimento`
+- `custo`
+- `resultado_solicitacao`
+- `documentos_necessarios`
+- `instrucoes_solicitante`
+- `canais_digitais`
+- `canais_presenciais`
+- `legislacao_relacionada`""",
+}
+
+# Instrução usada quando as chaves vão no esquema de resposta
+SAIDA_ESTRUTURADA = "Preencha todos os campos do esquema de resposta. Se uma informação não estiver disponível, use string vazia."
 
 
 def carregar_prompt_arquivo(tipo):
     """
     Carrega o prompt do arquivo .md correspondente na pasta prompts/
+    (servido já compilado, na variante de PROMPT_VARIANTE)
     """
     try:
-        arquivo = Path(f'prompts/{tipo}.md')
-        if not arquivo.exists():
-            raise FileNotFoundError(f"Arquivo de prompt não encontrado: {arquivo}")
-            
-        with open(arquivo, 'r', encoding='utf-8') as f:
-            return f.read().strip()
+        return compilador_prompts.regras(tipo, PROMPT_VARIANTE)
     except Exception as e:
         raise Exception(f"Erro ao carregar prompt de {tipo}: {str(e)}")
 
 
-def criar_prompt(tipo, texto_entrada):
+def hash_regras(tipo):
+    """Hash das regras enviadas ao modelo (template e variante atuais)"""
+    return compilador_prompts.hash(tipo, PROMPT_VARIANTE)
+
+
+def criar_prompt(tipo, texto_entrada, estruturado=False):
     """
     Cria o prompt apropriado com base no tipo (servico ou informacao).
     Lê o arquivo de template em prompts/{tipo}.md e injeta o texto de entrada.
+    Com `estruturado=True` as chaves do JSON não são descritas no texto, pois
+    vão no esquema de resposta enviado ao modelo.
     """
-    regras = carregar_prompt_arquivo(tipo)
-    
-    if tipo == 'informacao':
-        prompt = f"""{regras}
+    prefixo, sufixo = partes_prompt(tipo, texto_entrada, estruturado)
+    return prefixo + sufixo
+
+
+def formato_saida_campos(campos):
+    """Descrição das chaves esperadas quando só parte dos campos é gerada"""
+    linhas = '\n'.join(f"- `{c}`" for c in campos)
+    return f"Retorne APENAS um JSON com os seguintes campos:\n{linhas}"
+
+
+def criar_prompt_parcial(tipo, texto_entrada, campos, anteriores, estruturado=False):
+    """
+    Cria o prompt que regenera apenas `campos`: leva só as regras gerais e as
+    seções desses campos do template, e os valores atuais dos demais campos
+    como referência (para não repetir conteúdo que já está em outro campo).
+    """
+    return criar_prompt_campos(tipo, texto_entrada, campos, estruturado, anteriores)
+
+
+def criar_prompt_campos(tipo, texto_entrada, campos, estruturado=False, anteriores=None):
+    """
+    Cria o prompt que gera apenas `campos`, com as regras gerais e as seções
+    desses campos. Sem `anteriores`, é a geração de um grupo de campos
+    (modo paralelo); com eles, o reprocessamento de campos.
+    """
+    anteriores = anteriores or {}
+    with medir_etapa('carregar_prompt', tipo):
+        regras = compilador_prompts.regras_campos(tipo, campos, PROMPT_VARIANTE)
+    formato_saida = SAIDA_ESTRUTURADA if estruturado else formato_saida_campos(campos)
+
+    referencias = '\n\n'.join(
+        f"### `{campo}`\n\n{valor}"
+        for campo, valor in anteriores.items()
+        if campo not in campos and isinstance(valor, str) and valor.strip()
+    )
+    rejeitados = '\n\n'.join(
+        f"### `{campo}`\n\n{anteriores[campo]}"
+        for campo in campos
+        if isinstance(anteriores.get(campo), str) and anteriores[campo].strip()
+    )
+
+    if anteriores:
+        cabecalho = (
+            "## REPROCESSAMENTO DE CAMPOS\n\n"
+            "Gere novamente apenas os campos pedidos nas instruções de saída, seguindo as regras acima."
+        )
+    else:
+        cabecalho = (
+            "## GERAÇÃO POR GRUPO DE CAMPOS\n\n"
+            "Gere apenas os campos pedidos nas instruções de saída, seguindo as regras acima. "
+            "Os demais campos são gerados separadamente: não antecipe o conteúdo deles."
+        )
+
+    prompt = f"""{regras}
 
 ---
 
-## Conteúdo a Processar
+{cabecalho}
+
+---
+
+## {'Conteúdo' if tipo == 'informacao' else 'Serviço'} a Processar
 
 **Texto de entrada:**
 
 {texto_entrada}
+"""
+    if referencias:
+        prompt += f"""
+---
+
+## Campos já aprovados (apenas referência; não os repita nem mova conteúdo deles)
+
+{referencias}
+"""
+    if rejeitados:
+        prompt += f"""
+---
+
+## Versão anterior dos campos a refazer (não aprovada pelo editor)
 
+{rejeitados}
+"""
+    prompt += f"""
 ---
 
 ## Instruções de Saída
 
-Retorne APENAS um JSON com os seguintes campos (use os nomes exatos das chaves):
+{formato_saida}
+"""
+    return prompt
 
-- `o_que_e`: string (Markdown)
-- `como_funciona`: string (Markdown)
-- `publico_alvo`: string (Markdown)
-- `informacoes_importantes`: string (Markdown)
 
-Se uma informação não estiver disponível, retorne string vazia.
+def partes_prompt(tipo, texto_entrada, estruturado=False):
+    """
+    Divide o prompt em (prefixo, sufixo): o prefixo (regras do template e
+    cabeçalhos) é igual em todas as requisições do tipo; o sufixo traz o
+    texto de entrada e as instruções de saída.
+    """
+    with medir_etapa('carregar_prompt', tipo):
+        regras = carregar_prompt_arquivo(tipo)
+    formato_saida = SAIDA_ESTRUTURADA if estruturado else FORMATO_SAIDA[tipo_prompt(tipo)]
+    
+    if tipo == 'informacao':
+        prefixo = f"""{regras}
+
+---
+
+## Conteúdo a Processar
+
+**Texto de entrada:**
+
+"""
+        sufixo = f"""{texto_entrada}
+
+---
+
+## Instruções de Saída
+
+{formato_saida}
 """
     else: # tipo == 'servico' (padrão)
-        prompt = f"""{regras}
+        prefixo = f"""{regras}
 
 ---
 
@@ -94,7 +602,8 @@ Siga a estrutura definida nas regras acima para padronizar o serviço.
 
 **Texto de entrada (texto livre):**
 
-{texto_entrada}
+"""
+        sufixo = f"""{texto_entrada}
 
 ---
 
@@ -104,55 +613,1186 @@ Analise o texto livre acima e extraia/processe as informações para criar uma d
 
 Siga TODAS as regras especificadas.
 
-Retorne APENAS um JSON com os seguintes campos:
-- `descricao_resumida`
-- `descricao_completa`
-- `servico_nao_cobre`
-- `tempo_atendimento`
-- `custo`
-- `resultado_solicitacao`
-- `documentos_necessarios`
-- `instrucoes_solicitante`
-- `canais_digitais`
-- `canais_presenciais`
-- `legislacao_relacionada`
+{formato_saida}
 """
-    return prompt
+    return prefixo, sufixo
 
 
-def processar_com_gemini(prompt):
+def preparar_prompt(tipo, texto_entrada, estruturado=False, modelo=None):
+    """
+    Monta o que é enviado ao modelo: (sufixo, nome do cache de contexto) se o
+    prefixo estiver registrado no provedor, ou (prompt completo, None).
     """
-    Processa o prompt usando a API do Gemini.
+    prefixo, sufixo = partes_prompt(tipo, texto_entrada, estruturado)
+    if cache_contexto is not None:
+        contexto = cache_contexto.obter(tipo, modelo or GEMINI_MODEL, hash_regras(tipo), prefixo)
+        if contexto is not None:
+            return sufixo, contexto
+    return prefixo + sufixo, None
+
+
+def extrair_json(texto_resposta):
+    """
+    Extrai e decodifica o objeto JSON contido no texto de resposta do modelo
+    (primeiro objeto de nível superior, ignorando cercas ```json e texto ao redor).
     """
     try:
-        if not client:
-            raise ValueError("Cliente Gemini não configurado (verifique GEMINI_API_KEY)")
-        
-        # Utiliza o modelo definido na variável de ambiente
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=prompt
-        )
-        
-        texto_resposta = response.text.strip()
-        
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', texto_resposta, re.DOTALL)
-        if json_match:
-            texto_resposta = json_match.group(1)
-        else:
-            json_match = re.search(r'\{.*?\}', texto_resposta, re.DOTALL)
-            if json_match:
-                texto_resposta = json_match.group(0)
-        
-        resultado = json.loads(texto_resposta)
-        return resultado
-        
+        return extrair_objeto(texto_resposta)
     except json.JSONDecodeError as e:
-        # Se falhar o parse, tenta retornar um erro estruturado ou o texto cru em um campo 'erro_parse'
-        raise Exception(f"Erro ao fazer parse do JSON: {str(e)}")
+        raise RespostaInvalida(f"Erro ao fazer parse do JSON: {str(e)}")
+
+
+def processar_com_gemini(prompt, esquema=None, backend=None, tipo=None, contexto=None, modelo=None):
+    """
+    Processa o prompt usando o backend do modelo (Gemini por padrão).
+    Com `esquema`, o modelo devolve JSON diretamente (structured output).
+    `backend` permite usar outro backend (ex.: BackendLocal em testes).
+    `tipo` é usado apenas nos rótulos das métricas.
+    Com `contexto` (cache de contexto do prefixo), `prompt` é só o sufixo.
+    A chamada tem prazo, retentativas e disjuntor; indisponibilidade do modelo
+    é lançada como ModeloIndisponivel.
+    """
+    backend = backend or backend_llm
+    modelo = modelo or GEMINI_MODEL
+    inicio = time.perf_counter()
+    try:
+        with medir_etapa('chamada_modelo', tipo, modelo), \
+                metrica_chamadas_em_andamento.em_andamento(modelo=modelo):
+            resposta = resiliencia_modelo(modelo).executar(
+                lambda timeout: gerar_com_especulacao(backend, prompt, modelo, esquema, contexto, tipo, timeout)
+            )
+
+    except FilaEsgotada:
+        # Espera na fila do limitador de taxa: o modelo não falhou
+        raise
+
+    except ModeloIndisponivel:
+        roteador_modelos.registrar(modelo, tipo_prompt(tipo), time.perf_counter() - inicio, False)
+        raise
+
+    except Exception as e:
+        prefixo = descartar_contexto(contexto, e)
+        if prefixo is not None:
+            return processar_com_gemini(prefixo + prompt, esquema, backend, tipo, modelo=modelo)
+        raise Exception(f"Erro ao processar com Gemini: {str(e)}")
+
+    registrar_resposta_modelo(modelo, tipo, inicio)
+    registrar_tokens(resposta, tipo)
+    with medir_etapa('extracao_json', tipo, modelo):
+        return decodificar_resposta(resposta.texto, esquema, tipo)
+
+
+async def processar_com_gemini_async(prompt, esquema=None, backend=None, tipo=None, contexto=None, modelo=None):
+    """
+    Versão assíncrona de processar_com_gemini, que não bloqueia a thread
+    enquanto aguarda o modelo.
+    """
+    backend = backend or backend_llm
+    modelo = modelo or GEMINI_MODEL
+
+    async def gerar_uma(timeout):
+        timeout = await aguardar_cota_async(timeout)
+        return await backend.gerar_async(prompt, modelo, esquema, contexto, timeout)
+
+    async def gerar(timeout):
+        if especulacao is None:
+            return await gerar_uma(timeout)
+        return await especulacao.executar_async(chave_especulacao(modelo, tipo), gerar_uma, timeout)
+
+    inicio = time.perf_counter()
+    try:
+        with medir_etapa('chamada_modelo', tipo, modelo), \
+                metrica_chamadas_em_andamento.em_andamento(modelo=modelo):
+            resposta = await resiliencia_modelo(modelo).executar_async(gerar)
+
+    except FilaEsgotada:
+        # Espera na fila do limitador de taxa: o modelo não falhou
+        raise
+
+    except ModeloIndisponivel:
+        roteador_modelos.registrar(modelo, tipo_prompt(tipo), time.perf_counter() - inicio, False)
+        raise
+
+    except Exception as e:
+        prefixo = descartar_contexto(contexto, e)
+        if prefixo is not None:
+            return await processar_com_gemini_async(prefixo + prompt, esquema, backend, tipo, modelo=modelo)
+        raise Exception(f"Erro ao processar com Gemini: {str(e)}")
+
+    registrar_resposta_modelo(modelo, tipo, inicio)
+    registrar_tokens(resposta, tipo)
+    with medir_etapa('extracao_json', tipo, modelo):
+        return decodificar_resposta(resposta.texto, esquema, tipo)
+
+
+def processar_com_gemini_stream(prompt, esquema=None, backend=None, tipo=None, contexto=None, modelo=None):
+    """
+    Gera os trechos de texto da resposta do modelo à medida que ele os produz.
+    Retentativas só acontecem antes do primeiro trecho.
+    """
+    backend = backend or backend_llm
+    modelo = modelo or GEMINI_MODEL
+    iniciado = False
+    inicio = time.perf_counter()
+    try:
+        with medir_etapa('chamada_modelo', tipo, modelo), \
+                metrica_chamadas_em_andamento.em_andamento(modelo=modelo):
+            trechos = resiliencia_modelo(modelo).executar(
+                lambda timeout: iniciar_stream(
+                    backend.gerar_stream(prompt, modelo, esquema, contexto, aguardar_cota(timeout))
+                )
+            )
+            for trecho in trechos:
+                iniciado = True
+                yield trecho
+
+    except GeneratorExit:
+        # O consumidor para de ler ao fechar o JSON: conta como chamada concluída
+        if iniciado:
+            registrar_resposta_modelo(modelo, tipo, inicio)
+        raise
+
+    except FilaEsgotada:
+        # Espera na fila do limitador de taxa: o modelo não falhou
+        raise
+
+    except ModeloIndisponivel:
+        roteador_modelos.registrar(modelo, tipo_prompt(tipo), time.perf_counter() - inicio, False)
+        raise
+
     except Exception as e:
+        prefixo = descartar_contexto(contexto, e)
+        if prefixo is not None and not iniciado:
+            yield from processar_com_gemini_stream(prefixo + prompt, esquema, backend, tipo, modelo=modelo)
+            return
         raise Exception(f"Erro ao processar com Gemini: {str(e)}")
 
+    registrar_resposta_modelo(modelo, tipo, inicio)
+
+
+def registrar_resposta_modelo(modelo, tipo, inicio):
+    """Registra a chamada bem-sucedida no roteador e o modelo que respondeu à requisição"""
+    roteador_modelos.registrar(modelo, tipo_prompt(tipo), time.perf_counter() - inicio, True)
+    modelos = modelos_resposta.get()
+    if modelos is not None:
+        modelos.add(modelo)
+
+
+@contextmanager
+def registro_modelos_resposta():
+    """Coleta, no conjunto retornado, os modelos que responderam dentro do bloco"""
+    modelos = set()
+    marca = modelos_resposta.set(modelos)
+    try:
+        yield modelos
+    finally:
+        modelos_resposta.reset(marca)
+
+
+def pode_gravar_cache(modelos):
+    """
+    O cache de respostas é indexado por GEMINI_MODEL: respostas dadas pelo
+    modelo leve ou pelo de fallback não são gravadas, para não serem servidas
+    depois como saída do modelo principal.
+    """
+    return modelos <= {GEMINI_MODEL}
+
+
+def com_regeneracao(tipo, chamar, regeneracoes=None):
+    """
+    Executa chamar() e a refaz (até `regeneracoes` vezes, por padrão
+    RESPOSTA_REGENERACOES) quando o JSON da resposta não pôde ser reparado.
+    """
+    if regeneracoes is None:
+        regeneracoes = RESPOSTA_REGENERACOES
+    for tentativa in itertools.count():
+        try:
+            return chamar()
+        except RespostaInvalida:
+            if tentativa >= regeneracoes:
+                raise
+            metrica_regeneracoes.inc(tipo=tipo_prompt(tipo))
+
+
+async def com_regeneracao_async(tipo, chamar):
+    """Versão assíncrona de com_regeneracao; chamar() retorna uma corrotina"""
+    for tentativa in itertools.count():
+        try:
+            return await chamar()
+        except RespostaInvalida:
+            if tentativa >= RESPOSTA_REGENERACOES:
+                raise
+            metrica_regeneracoes.inc(tipo=tipo_prompt(tipo))
+
+
+def chamar_modelo(tipo, texto_entrada, estruturado, tokens_prompt, prompt_pronto=None, esquema=None,
+                  regeneracoes=None):
+    """
+    Chama os modelos candidatos do roteador, em ordem, até um responder:
+    indisponibilidade de um modelo (circuito aberto, tentativas ou prazo
+    esgotados) passa a chamada ao próximo. Retorna o resultado decodificado.
+    Com `prompt_pronto` (e `esquema`), envia esse prompt em vez do prompt
+    completo do tipo. `regeneracoes` limita as novas chamadas por JSON
+    irreparável (padrão RESPOSTA_REGENERACOES).
+    """
+    if prompt_pronto is None and estruturado:
+        esquema = esquema_resposta(tipo)
+    candidatos = roteador_modelos.candidatos(tipo_prompt(tipo), tokens_prompt)
+    for posicao, modelo in enumerate(candidatos, 1):
+        if prompt_pronto is not None:
+            prompt, contexto = prompt_pronto, None
+        else:
+            # Cria o prompt apropriado (só o sufixo, se as regras estiverem no cache de contexto do modelo)
+            with medir_etapa('criar_prompt', tipo):
+                prompt, contexto = preparar_prompt(tipo, texto_entrada, estruturado, modelo)
+        try:
+            return com_regeneracao(
+                tipo, lambda: processar_com_gemini(prompt, esquema, tipo=tipo, contexto=contexto, modelo=modelo),
+                regeneracoes,
+            )
+        except FilaEsgotada:
+            # A fila do limitador é a mesma para todos os modelos: trocar de modelo não ajuda
+            raise
+        except ModeloIndisponivel:
+            if posicao == len(candidatos):
+                raise
+            metrica_fallback_modelo.inc(tipo=tipo_prompt(tipo), modelo=modelo)
+
+
+async def chamar_modelo_async(tipo, texto_entrada, estruturado, tokens_prompt, prompt_pronto=None, esquema=None):
+    """Versão assíncrona de chamar_modelo"""
+    if prompt_pronto is None and estruturado:
+        esquema = esquema_resposta(tipo)
+    candidatos = roteador_modelos.candidatos(tipo_prompt(tipo), tokens_prompt)
+    for posicao, modelo in enumerate(candidatos, 1):
+        if prompt_pronto is not None:
+            prompt, contexto = prompt_pronto, None
+        else:
+            with medir_etapa('criar_prompt', tipo):
+                # O registro do cache de contexto pode chamar o provedor: roda fora do event loop
+                prompt, contexto = await asyncio.to_thread(preparar_prompt, tipo, texto_entrada, estruturado, modelo)
+        try:
+            return await com_regeneracao_async(
+                tipo, lambda: processar_com_gemini_async(prompt, esquema, tipo=tipo, contexto=contexto, modelo=modelo)
+            )
+        except FilaEsgotada:
+            # A fila do limitador é a mesma para todos os modelos: trocar de modelo não ajuda
+            raise
+        except ModeloIndisponivel:
+            if posicao == len(candidatos):
+                raise
+            metrica_fallback_modelo.inc(tipo=tipo_prompt(tipo), modelo=modelo)
+
+
+def chamar_modelo_stream(tipo, texto_entrada, estruturado, tokens_prompt):
+    """
+    Versão em streaming de chamar_modelo. A indisponibilidade só é detectada
+    antes do primeiro trecho, então a troca de modelo nunca mistura respostas.
+    """
+    candidatos = roteador_modelos.candidatos(tipo_prompt(tipo), tokens_prompt)
+    for posicao, modelo in enumerate(candidatos, 1):
+        with medir_etapa('criar_prompt', tipo):
+            prompt, contexto = preparar_prompt(tipo, texto_entrada, estruturado, modelo)
+        try:
+            yield from processar_com_gemini_stream(
+                prompt, esquema_resposta(tipo) if estruturado else None, tipo=tipo, contexto=contexto, modelo=modelo
+            )
+            return
+        except FilaEsgotada:
+            # A fila do limitador é a mesma para todos os modelos: trocar de modelo não ajuda
+            raise
+        except ModeloIndisponivel:
+            if posicao == len(candidatos):
+                raise
+            metrica_fallback_modelo.inc(tipo=tipo_prompt(tipo), modelo=modelo)
+
+
+def gerar_com_especulacao(backend, prompt, modelo, esquema, contexto, tipo, timeout):
+    """
+    Uma tentativa de chamada ao backend; com a especulação ativa, uma cópia
+    é disparada se a resposta demorar além do percentil de latência recente.
+    Cada cópia aguarda a própria vaga no limitador de taxa e desiste, sem
+    chamar o modelo, se a outra já tiver respondido nesse meio tempo.
+    """
+    def gerar(restante):
+        restante = aguardar_cota(restante)
+        if copia_descartada():
+            raise CopiaDescartada('A outra cópia da chamada já respondeu')
+        return backend.gerar(prompt, modelo, esquema, contexto, restante)
+
+    if especulacao is None:
+        return gerar(timeout)
+    return especulacao.executar(chave_especulacao(modelo, tipo), gerar, timeout)
+
+
+def chave_especulacao(modelo, tipo):
+    """Latências são acompanhadas por modelo e tipo de prompt"""
+    return f'{modelo}/{tipo_prompt(tipo)}'
+
+
+def aguardar_cota(timeout):
+    """
+    Aguarda vaga no limitador de taxa (na classe de prioridade atual) e
+    retorna o que resta do timeout da chamada.
+    """
+    if limitador_taxa is None:
+        return timeout
+    classe = prioridade_chamada.get()
+    espera = limitador_taxa.adquirir(classe, espera_maxima_cota(timeout))
+    metrica_espera_limite.observar(espera, classe=classe)
+    return None if timeout is None else max(0.001, timeout - espera)
+
+
+async def aguardar_cota_async(timeout):
+    """Versão assíncrona de aguardar_cota"""
+    if limitador_taxa is None:
+        return timeout
+    classe = prioridade_chamada.get()
+    espera = await limitador_taxa.adquirir_async(classe, espera_maxima_cota(timeout))
+    metrica_espera_limite.observar(espera, classe=classe)
+    return None if timeout is None else max(0.001, timeout - espera)
+
+
+def espera_maxima_cota(timeout):
+    """A espera na fila não pode passar do prazo da chamada nem de GEMINI_LIMITE_ESPERA_MAXIMA"""
+    limites = [t for t in (timeout, GEMINI_LIMITE_ESPERA_MAXIMA) if t]
+    return min(limites) if limites else None
+
+
+def iniciar_stream(trechos):
+    """
+    Obtém o primeiro trecho do fluxo, onde aparecem os erros da chamada, e
+    devolve o fluxo completo
+    """
+    primeiro = next(trechos, None)
+    return iter(()) if primeiro is None else itertools.chain([primeiro], trechos)
+
+
+def descartar_contexto(contexto, erro):
+    """
+    Se a chamada com cache de contexto falhou porque o cache não é mais
+    válido no provedor (expirado/removido), descarta o registro local (a
+    próxima chamada o recria) e retorna o prefixo, para que a chamada seja
+    repetida com o prompt completo. Retorna None nos demais casos.
+    """
+    if contexto is not None and cache_contexto is not None and getattr(erro, 'codigo', None) in (400, 403, 404):
+        return cache_contexto.descartar(contexto)
+    return None
+
+
+def medir_etapa(etapa, tipo, modelo=None):
+    """Mede a duração de uma etapa no histograma de etapas (por tipo e modelo)"""
+    return metrica_etapa.medir(etapa=etapa, tipo=tipo_prompt(tipo) if tipo else '', modelo=modelo or GEMINI_MODEL)
+
+
+def registrar_tokens(resposta, tipo):
+    """Soma os tokens de entrada/saída informados pelo backend"""
+    rotulo_tipo = tipo_prompt(tipo) if tipo else ''
+    if resposta.tokens_entrada:
+        metrica_tokens.inc(resposta.tokens_entrada, tipo=rotulo_tipo, modelo=resposta.modelo, direcao='entrada')
+    if resposta.tokens_saida:
+        metrica_tokens.inc(resposta.tokens_saida, tipo=rotulo_tipo, modelo=resposta.modelo, direcao='saida')
+    if resposta.tokens_cache:
+        metrica_tokens.inc(resposta.tokens_cache, tipo=rotulo_tipo, modelo=resposta.modelo, direcao='cache')
+
+
+def tipo_prompt(tipo):
+    """Tipo de prompt efetivo (qualquer tipo diferente de informacao usa o de serviço)"""
+    return 'informacao' if tipo == 'informacao' else 'servico'
+
+
+def campos_do_tipo(tipo):
+    """Lista de campos esperados na resposta do tipo"""
+    return CAMPOS_INFORMACAO if tipo == 'informacao' else CAMPOS_SERVICO
+
+
+def esquema_resposta(tipo):
+    """
+    Esquema de resposta (structured output) com os mesmos campos que
+    /processar normaliza para o tipo: todos strings e obrigatórios.
+    """
+    return esquema_campos(tuple(campos_do_tipo(tipo)))
+
+
+@lru_cache(maxsize=None)
+def esquema_campos(campos):
+    """Esquema de resposta com os `campos` (tupla), todos strings e obrigatórios"""
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={c: types.Schema(type=types.Type.STRING) for c in campos},
+        required=list(campos),
+        property_ordering=list(campos),
+    )
+
+
+def decodificar_resposta(texto_resposta, esquema, tipo=None):
+    """
+    Decodifica a resposta: JSON puro no modo estruturado, extração no modo
+    texto. JSON malformado passa pelo reparo local; se ele não bastar (ou se
+    a resposta veio truncada no meio de um valor), lança RespostaInvalida.
+    """
+    if esquema is not None:
+        try:
+            return json.loads(texto_resposta)
+        except (TypeError, json.JSONDecodeError):
+            pass
+    try:
+        return extrair_json(texto_resposta)
+    except RespostaInvalida as e:
+        erro = e
+
+    with medir_etapa('reparo_json', tipo):
+        try:
+            resultado, reparos = reparar_json(texto_resposta)
+        except json.JSONDecodeError:
+            raise erro
+    rotulo = tipo_prompt(tipo) if tipo else ''
+    for reparo in reparos:
+        metrica_reparos_json.inc(tipo=rotulo, reparo=reparo)
+    if VALOR_TRUNCADO in reparos:
+        raise RespostaInvalida(f"Resposta do modelo truncada no meio de um valor ({erro})")
+    metrica_regeneracoes_evitadas.inc(tipo=rotulo)
+    return resultado
+
+
+def normalizar_resultado(tipo, resultado):
+    """
+    Valida o resultado contra os campos do tipo (todos strings): valores de
+    outro tipo são convertidos (listas viram listas Markdown, None vira '')
+    e campos ausentes ficam vazios.
+    """
+    if not isinstance(resultado, dict):
+        raise Exception('Resposta do modelo não veio como JSON/dicionário')
+
+    for correcao in validar_campos(resultado, campos_do_tipo(tipo)):
+        metrica_campos_corrigidos.inc(tipo=tipo_prompt(tipo), correcao=correcao)
+    return resultado
+
+
+def estimar_tokens_prompt(tipo, texto_entrada):
+    """
+    Estima os tokens do prompt (regras do template + texto de entrada) sem
+    montá-lo; o custo é constante, pois depende apenas dos tamanhos.
+    """
+    return estimar_tokens(carregar_prompt_arquivo(tipo)) + estimar_tokens(texto_entrada)
+
+
+def verificar_orcamento(tipo, texto_entrada):
+    """
+    Estima o tamanho do prompt, registra nas métricas e recusa a entrada
+    (OrcamentoExcedido) se ele ultrapassar o orçamento do tipo.
+    """
+    tokens = estimar_tokens_prompt(tipo, texto_entrada)
+    metrica_tokens_prompt.observar(tokens, tipo=tipo_prompt(tipo))
+    try:
+        return orcamento_tokens.verificar(tipo_prompt(tipo), tokens)
+    except OrcamentoExcedido:
+        metrica_orcamento_excedido.inc(tipo=tipo_prompt(tipo))
+        raise
+
+
+def preparar_entrada(tipo, texto_entrada):
+    """
+    Normaliza o texto de entrada (ver normalizacao_entrada.py) e registra a
+    economia nas métricas. Retorna (texto, relatório); o relatório é None com
+    a normalização desativada. O texto normalizado é o que vai para o prompt
+    e para a chave de cache, então variações de espaço e HTML reaproveitam a
+    mesma resposta.
+    """
+    if not ENTRADA_NORMALIZAR:
+        return texto_entrada, None
+
+    with medir_etapa('normalizar_entrada', tipo):
+        entrada = normalizar_entrada(
+            texto_entrada,
+            limiar_semelhanca=ENTRADA_LIMIAR_SEMELHANCA,
+            min_caracteres_dedup=ENTRADA_DEDUP_MIN_CARACTERES,
+        )
+    rotulo = tipo_prompt(tipo)
+    metrica_entrada_caracteres_removidos.inc(max(0, entrada.caracteres_removidos), tipo=rotulo)
+    metrica_entrada_tokens_economizados.inc(entrada.tokens_economizados, tipo=rotulo)
+    if entrada.paragrafos_duplicados:
+        metrica_entrada_paragrafos_removidos.inc(entrada.paragrafos_duplicados, tipo=rotulo, motivo='duplicado')
+    if entrada.paragrafos_semelhantes:
+        metrica_entrada_paragrafos_removidos.inc(entrada.paragrafos_semelhantes, tipo=rotulo, motivo='semelhante')
+    return entrada.texto, entrada.relatorio()
+
+
+def chave_requisicao(tipo, texto_entrada, estruturado, paralelo=False):
+    """Chave da requisição normalizada (texto, tipo, modelo, template, modo de saída e de geração)"""
+    variante = 'estruturado' if estruturado else 'texto'
+    if paralelo:
+        variante += ':paralelo'
+    return gerar_chave(tipo, texto_entrada, GEMINI_MODEL, hash_regras(tipo), variante)
+
+
+def chave_cache(tipo, texto_entrada, estruturado, paralelo=False):
+    """Chave do cache de respostas para a requisição (None se o cache estiver desativado)"""
+    if cache_respostas is None:
+        return None
+    return chave_requisicao(tipo, texto_entrada, estruturado, paralelo)
+
+
+def usar_modo_longo(texto_entrada, modo=None):
+    """
+    Indica se o texto deve ser dividido em trechos: modo 'longo' força a
+    divisão, 'unico' a impede e, sem modo, ela ocorre acima do limiar.
+    """
+    if modo == 'longo':
+        return True
+    if modo == 'unico':
+        return False
+    return bool(DOCUMENTO_LONGO_CARACTERES) and len(texto_entrada) > DOCUMENTO_LONGO_CARACTERES
+
+
+def usar_modo_paralelo(tipo, modo=None):
+    """
+    Indica se os campos devem ser gerados em grupos paralelos: modo
+    'paralelo' ativa, 'unico' impede e, sem modo, vale GERACAO_PARALELA.
+    Só se aplica a tipos com grupos de campos.
+    """
+    if tipo_prompt(tipo) not in GRUPOS_CAMPOS or modo == 'unico':
+        return False
+    return modo == 'paralelo' or (modo is None and GERACAO_PARALELA)
+
+
+def gerar_grupo_campos(tipo, texto_entrada, campos, estruturado):
+    """Gera um grupo de campos com o prompt reduzido às regras deles"""
+    with medir_etapa('criar_prompt', tipo):
+        prompt = criar_prompt_campos(tipo, texto_entrada, campos, estruturado)
+    novos = chamar_modelo(
+        tipo, texto_entrada, estruturado, estimar_tokens(prompt),
+        prompt_pronto=prompt, esquema=esquema_campos(tuple(campos)) if estruturado else None,
+    )
+    if not isinstance(novos, dict):
+        raise Exception('Resposta do modelo não veio como JSON/dicionário')
+    return {campo: novos.get(campo, '') for campo in campos}
+
+
+async def gerar_grupo_campos_async(tipo, texto_entrada, campos, estruturado):
+    """Versão assíncrona de gerar_grupo_campos"""
+    with medir_etapa('criar_prompt', tipo):
+        prompt = criar_prompt_campos(tipo, texto_entrada, campos, estruturado)
+    novos = await chamar_modelo_async(
+        tipo, texto_entrada, estruturado, estimar_tokens(prompt),
+        prompt_pronto=prompt, esquema=esquema_campos(tuple(campos)) if estruturado else None,
+    )
+    if not isinstance(novos, dict):
+        raise Exception('Resposta do modelo não veio como JSON/dicionário')
+    return {campo: novos.get(campo, '') for campo in campos}
+
+
+def iniciar_grupos_campos(tipo, texto_entrada, estruturado):
+    """Dispara a geração de cada grupo de campos em paralelo e retorna os futures"""
+    grupos = GRUPOS_CAMPOS[tipo_prompt(tipo)]
+    metrica_grupos_campos.observar(len(grupos), tipo=tipo_prompt(tipo))
+    # Cada grupo roda com uma cópia do contexto (mantém a prioridade da chamada)
+    return [
+        executor_campos.submit(contextvars.copy_context().run, gerar_grupo_campos, tipo, texto_entrada, g, estruturado)
+        for g in grupos
+    ]
+
+
+def gerar_em_grupos(tipo, texto_entrada, estruturado):
+    """Gera todos os campos em grupos paralelos e reúne o resultado (latência do grupo mais lento)"""
+    futuros = iniciar_grupos_campos(tipo, texto_entrada, estruturado)
+    try:
+        parciais = [f.result() for f in futuros]
+    finally:
+        # Se um grupo falhou, os que ainda não começaram não precisam rodar
+        for f in futuros:
+            f.cancel()
+    resultado = {}
+    for parcial in parciais:
+        resultado.update(parcial)
+    return resultado
+
+
+async def gerar_em_grupos_async(tipo, texto_entrada, estruturado):
+    """Versão assíncrona de gerar_em_grupos"""
+    grupos = GRUPOS_CAMPOS[tipo_prompt(tipo)]
+    metrica_grupos_campos.observar(len(grupos), tipo=tipo_prompt(tipo))
+    parciais = await asyncio.gather(*(
+        gerar_grupo_campos_async(tipo, texto_entrada, g, estruturado) for g in grupos
+    ))
+    resultado = {}
+    for parcial in parciais:
+        resultado.update(parcial)
+    return resultado
+
+
+def trechos_anotados(tipo, texto_entrada):
+    """
+    Divide o texto em trechos e anota cada um com sua posição no documento.
+    Recusa o documento (OrcamentoExcedido) se a soma dos prompts estimados
+    dos trechos ultrapassar DOCUMENTO_LONGO_ORCAMENTO_TOKENS.
+    """
+    trechos = dividir_em_trechos(texto_entrada, DOCUMENTO_LONGO_TRECHO)
+    metrica_trechos.observar(len(trechos), tipo=tipo_prompt(tipo))
+    if len(trechos) <= 1:
+        return [texto_entrada]
+    anotados = [anotar_trecho(t, i, len(trechos)) for i, t in enumerate(trechos, 1)]
+
+    # O orçamento de cada trecho não limita quantas chamadas um documento enorme gera
+    tokens = sum(estimar_tokens_prompt(tipo, t) for t in anotados)
+    if DOCUMENTO_LONGO_ORCAMENTO_TOKENS and tokens > DOCUMENTO_LONGO_ORCAMENTO_TOKENS:
+        metrica_orcamento_excedido.inc(tipo=tipo_prompt(tipo))
+        raise OrcamentoExcedido(tipo_prompt(tipo), tokens, DOCUMENTO_LONGO_ORCAMENTO_TOKENS)
+    return anotados
+
+
+def executar_pipeline(tipo, texto_entrada, estruturado=None, modo=None):
+    """
+    Executa o fluxo completo (prompt -> Gemini -> normalização) para um texto.
+    Retorna a tupla (resultado, veio_do_cache).
+    """
+    if usar_modo_longo(texto_entrada, modo):
+        return executar_pipeline_longo(tipo, texto_entrada, estruturado)
+
+    if estruturado is None:
+        estruturado = GEMINI_SAIDA_ESTRUTURADA
+    paralelo = usar_modo_paralelo(tipo, modo)
+
+    chave = chave_cache(tipo, texto_entrada, estruturado, paralelo)
+    if chave is not None:
+        with medir_etapa('cache_respostas', tipo):
+            resultado = cache_respostas.obter(chave)
+        if resultado is not None:
+            return resultado, True
+
+    def gerar_resultado():
+        # Recusa entradas acima do orçamento antes de qualquer chamada ao modelo
+        tokens = verificar_orcamento(tipo, texto_entrada)
+
+        with registro_modelos_resposta() as modelos:
+            if paralelo:
+                # Um grupo de campos por chamada, em paralelo
+                resultado = gerar_em_grupos(tipo, texto_entrada, estruturado)
+            else:
+                # Processa com o modelo escolhido pelo roteador (com fallback entre modelos)
+                resultado = chamar_modelo(tipo, texto_entrada, estruturado, tokens)
+
+        # Normaliza campos dependendo do tipo
+        with medir_etapa('normalizacao', tipo):
+            resultado = normalizar_resultado(tipo, resultado)
+
+        if chave is not None and pode_gravar_cache(modelos):
+            cache_respostas.gravar(chave, resultado)
+        return resultado
+
+    if coalescencia is None:
+        return gerar_resultado(), False
+
+    # Duplicatas simultâneas aguardam esta chamada em vez de repetir a ida ao modelo
+    resultado, _ = coalescencia.executar(
+        chave or chave_requisicao(tipo, texto_entrada, estruturado, paralelo), gerar_resultado
+    )
+    return resultado, False
+
+
+def validar_campos_parciais(tipo, campos, anteriores):
+    """
+    Valida o pedido de reprocessamento parcial e retorna (campos, anteriores)
+    normalizados. Lança ValueError com a mensagem para o cliente.
+    """
+    validos = campos_do_tipo(tipo)
+    if not isinstance(campos, list) or not campos or not all(isinstance(c, str) for c in campos):
+        raise ValueError('"campos" deve ser uma lista com os nomes dos campos a regenerar')
+    desconhecidos = [c for c in campos if c not in validos]
+    if desconhecidos:
+        raise ValueError(f"Campos desconhecidos para {tipo_prompt(tipo)}: {', '.join(desconhecidos)}")
+    if anteriores is None:
+        anteriores = {}
+    if not isinstance(anteriores, dict):
+        raise ValueError('"anteriores" deve ser um objeto {campo: valor} com o resultado gerado antes')
+    # Ordem do template, sem repetições
+    return [c for c in validos if c in campos], {c: v for c, v in anteriores.items() if c in validos}
+
+
+def executar_pipeline_parcial(tipo, texto_entrada, campos, anteriores, estruturado=None):
+    """
+    Regenera apenas `campos`, com o prompt reduzido às regras desses campos,
+    e devolve o resultado completo: os valores novos sobre os `anteriores`.
+    Não usa o cache de respostas nem a coalescência: o editor pede uma nova
+    versão justamente porque a anterior não serviu.
+    """
+    if estruturado is None:
+        estruturado = GEMINI_SAIDA_ESTRUTURADA
+    prompt, tokens = preparar_prompt_parcial(tipo, texto_entrada, campos, anteriores, estruturado)
+    novos = chamar_modelo(
+        tipo, texto_entrada, estruturado, tokens,
+        prompt_pronto=prompt, esquema=esquema_campos(tuple(campos)) if estruturado else None,
+    )
+    return combinar_parcial(tipo, campos, anteriores, novos), tokens
+
+
+async def executar_pipeline_parcial_async(tipo, texto_entrada, campos, anteriores, estruturado=None):
+    """Versão assíncrona de executar_pipeline_parcial"""
+    if estruturado is None:
+        estruturado = GEMINI_SAIDA_ESTRUTURADA
+    prompt, tokens = preparar_prompt_parcial(tipo, texto_entrada, campos, anteriores, estruturado)
+    novos = await chamar_modelo_async(
+        tipo, texto_entrada, estruturado, tokens,
+        prompt_pronto=prompt, esquema=esquema_campos(tuple(campos)) if estruturado else None,
+    )
+    return combinar_parcial(tipo, campos, anteriores, novos), tokens
+
+
+def preparar_prompt_parcial(tipo, texto_entrada, campos, anteriores, estruturado):
+    """Monta o prompt reduzido e verifica o orçamento sobre ele; retorna (prompt, tokens)"""
+    with medir_etapa('criar_prompt', tipo):
+        prompt = criar_prompt_parcial(tipo, texto_entrada, campos, anteriores, estruturado)
+
+    # O orçamento vale para o prompt reduzido que será de fato enviado
+    tokens = estimar_tokens(prompt)
+    metrica_tokens_prompt.observar(tokens, tipo=tipo_prompt(tipo))
+    try:
+        orcamento_tokens.verificar(tipo_prompt(tipo), tokens)
+    except OrcamentoExcedido:
+        metrica_orcamento_excedido.inc(tipo=tipo_prompt(tipo))
+        raise
+    return prompt, tokens
+
+
+def combinar_parcial(tipo, campos, anteriores, novos):
+    """Resultado completo: os valores novos dos `campos` sobre os `anteriores`"""
+    if not isinstance(novos, dict):
+        raise Exception('Resposta do modelo não veio como JSON/dicionário')
+
+    with medir_etapa('normalizacao', tipo):
+        resultado = dict(anteriores)
+        for campo in campos:
+            resultado[campo] = novos.get(campo, '')
+            metrica_campos_reprocessados.inc(tipo=tipo_prompt(tipo), campo=campo)
+        return normalizar_resultado(tipo, resultado)
+
+
+def executar_pipeline_longo(tipo, texto_entrada, estruturado=None):
+    """
+    Processa um texto longo em trechos (map-reduce): cada trecho passa pelo
+    fluxo completo em paralelo e os resultados são mesclados campo a campo.
+    Retorna (resultado, veio_do_cache), com cache apenas se todos os trechos
+    vieram do cache.
+    """
+    trechos = trechos_anotados(tipo, texto_entrada)
+    # Cada trecho roda com uma cópia do contexto (mantém a prioridade da chamada)
+    contextos = [contextvars.copy_context() for _ in trechos]
+    parciais = list(executor_trechos.map(
+        lambda ctx, trecho: ctx.run(executar_pipeline, tipo, trecho, estruturado, 'unico'),
+        contextos, trechos
+    ))
+
+    with medir_etapa('mesclagem', tipo):
+        resultado = mesclar_resultados([r for r, _ in parciais], campos_do_tipo(tipo))
+    return resultado, all(em_cache for _, em_cache in parciais)
+
+
+def evento_campo(campo, valor):
+    """Evento 'campo' do streaming, com o valor já convertido para texto (como no resultado final)"""
+    return 'campo', {'campo': campo, 'valor': converter_valor(valor)}
+
+
+def executar_pipeline_stream(tipo, texto_entrada, estruturado=None, modo=None):
+    """
+    Versão em streaming de executar_pipeline. Gera tuplas (evento, dados):
+    ('campo', {campo, valor}) para cada campo assim que o modelo o conclui e,
+    ao final, ('fim', {resultado, cache}). Textos longos só têm os campos
+    enviados depois da mesclagem dos trechos.
+    """
+    if usar_modo_longo(texto_entrada, modo):
+        resultado, em_cache = executar_pipeline_longo(tipo, texto_entrada, estruturado)
+        for campo, valor in resultado.items():
+            yield 'campo', {'campo': campo, 'valor': valor}
+        yield 'fim', {'resultado': resultado, 'cache': em_cache}
+        return
+
+    if estruturado is None:
+        estruturado = GEMINI_SAIDA_ESTRUTURADA
+    paralelo = usar_modo_paralelo(tipo, modo)
+
+    chave = chave_cache(tipo, texto_entrada, estruturado, paralelo)
+    if chave is not None:
+        resultado = cache_respostas.obter(chave)
+        if resultado is not None:
+            for campo, valor in resultado.items():
+                yield 'campo', {'campo': campo, 'valor': valor}
+            yield 'fim', {'resultado': resultado, 'cache': True}
+            return
+
+    tokens = verificar_orcamento(tipo, texto_entrada)
+
+    voo = None
+    if coalescencia is not None:
+        # Duplicatas simultâneas (duplo clique, dois editores com o mesmo texto) aguardam a
+        # chamada original, em streaming ou não, em vez de repetir a ida ao modelo
+        chave_voo = chave or chave_requisicao(tipo, texto_entrada, estruturado, paralelo)
+        voo, lider = coalescencia.entrar(chave_voo)
+        if not lider:
+            resultado = coalescencia.aguardar(voo)
+            for campo, valor in resultado.items():
+                yield 'campo', {'campo': campo, 'valor': valor}
+            yield 'fim', {'resultado': resultado, 'cache': False}
+            return
+
+    try:
+        with registro_modelos_resposta() as modelos:
+            resultado = yield from gerar_campos_stream(tipo, texto_entrada, estruturado, paralelo, tokens)
+        if chave is not None and pode_gravar_cache(modelos):
+            cache_respostas.gravar(chave, resultado)
+    except BaseException as e:
+        if voo is not None:
+            # GeneratorExit: o cliente desconectou antes do fim; quem aguarda recebe um erro
+            erro = e if isinstance(e, Exception) else Exception('Requisição original interrompida antes do fim')
+            coalescencia.concluir(chave_voo, voo, erro=erro)
+        raise
+    if voo is not None:
+        coalescencia.concluir(chave_voo, voo, resultado)
+    yield 'fim', {'resultado': resultado, 'cache': False}
+
+
+def gerar_campos_stream(tipo, texto_entrada, estruturado, paralelo, tokens):
+    """
+    Gera os eventos 'campo' à medida que o modelo conclui cada campo e
+    retorna (valor do `yield from`) o resultado normalizado.
+    """
+    if paralelo:
+        # Os campos de cada grupo são enviados assim que o grupo termina
+        futuros = iniciar_grupos_campos(tipo, texto_entrada, estruturado)
+        resultado = {}
+        try:
+            for futuro in as_completed(futuros):
+                for campo, valor in futuro.result().items():
+                    resultado[campo] = valor
+                    yield evento_campo(campo, valor)
+        finally:
+            for futuro in futuros:
+                futuro.cancel()
+        return normalizar_resultado(tipo, resultado)
+
+    extrator = ExtratorJSONIncremental()
+    trechos = chamar_modelo_stream(tipo, texto_entrada, estruturado, tokens)
+    recebidos = []
+    malformado = False
+
+    for trecho in trechos:
+        recebidos.append(trecho)
+        try:
+            concluidos = extrator.alimentar(trecho)
+        except json.JSONDecodeError:
+            # O extrator não continua depois de um par malformado: o restante é reparado no fim
+            malformado = True
+            recebidos.extend(trechos)
+            break
+        for campo, valor in concluidos:
+            yield evento_campo(campo, valor)
+        if extrator.concluido:
+            break
+
+    if malformado or not extrator.concluido:
+        # JSON malformado ou truncado: reparo local e, se ele não bastar, nova chamada
+        # (sem streaming), que já conta como a primeira das RESPOSTA_REGENERACOES
+        try:
+            objeto = decodificar_resposta(''.join(recebidos), None, tipo)
+        except RespostaInvalida:
+            if RESPOSTA_REGENERACOES < 1:
+                raise
+            metrica_regeneracoes.inc(tipo=tipo_prompt(tipo))
+            objeto = chamar_modelo(
+                tipo, texto_entrada, estruturado, tokens, regeneracoes=RESPOSTA_REGENERACOES - 1
+            )
+        if not isinstance(objeto, dict):
+            raise Exception('Resposta do modelo não veio como JSON/dicionário')
+        for campo, valor in objeto.items():
+            if campo not in extrator.objeto or converter_valor(extrator.objeto[campo]) != converter_valor(valor):
+                yield evento_campo(campo, valor)
+    else:
+        objeto = extrator.objeto
+
+    return normalizar_resultado(tipo, objeto)
+
+
+def formatar_evento_sse(evento, dados, retry=None):
+    """
+    Serializa um evento no formato Server-Sent Events. `retry` (ms) indica ao
+    EventSource quanto esperar antes de reconectar quando a conexão fechar.
+    """
+    prefixo = f"retry: {int(retry)}\n" if retry is not None else ''
+    return f"{prefixo}event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+def processar_item_lote(item):
+    """Processa um item {id, tipo, texto[, modo]} do lote sem propagar exceções"""
+    item_id = item.get('id') if isinstance(item, dict) else None
+    # Itens de lote cedem a vez ao tráfego interativo no limitador de taxa
+    prioridade = prioridade_chamada.set('lote')
+    try:
+        if not isinstance(item, dict):
+            raise ValueError('Item do lote deve ser um objeto {id, tipo, texto}')
+
+        tipo = item.get('tipo', 'servico')
+        texto_entrada, _ = preparar_entrada(tipo, item.get('texto') or '')
+        if not texto_entrada.strip():
+            raise ValueError('Nenhum texto foi fornecido')
+
+        resultado, em_cache = executar_pipeline(tipo, texto_entrada, modo=item.get('modo'))
+        return {
+            'id': item_id,
+            'sucesso': True,
+            'resultado': resultado,
+            'cache': em_cache
+        }
+    except Exception as e:
+        return {
+            'id': item_id,
+            'sucesso': False,
+            'erro': str(e)
+        }
+    finally:
+        prioridade_chamada.reset(prioridade)
+
+
+def processar_lote(itens):
+    """Processa os itens em paralelo (limitado por LOTE_MAX_CONCORRENCIA), preservando a ordem"""
+    return list(executor_lote.map(processar_item_lote, itens))
+
+
+async def executar_pipeline_async(tipo, texto_entrada, estruturado=None, modo=None):
+    """
+    Versão assíncrona de executar_pipeline. O acesso ao cache (SQLite) roda
+    em uma thread auxiliar para não bloquear o event loop.
+    """
+    if usar_modo_longo(texto_entrada, modo):
+        return await executar_pipeline_longo_async(tipo, texto_entrada, estruturado)
+
+    if estruturado is None:
+        estruturado = GEMINI_SAIDA_ESTRUTURADA
+    paralelo = usar_modo_paralelo(tipo, modo)
+
+    chave = chave_cache(tipo, texto_entrada, estruturado, paralelo)
+    if chave is not None:
+        with medir_etapa('cache_respostas', tipo):
+            resultado = await asyncio.to_thread(cache_respostas.obter, chave)
+        if resultado is not None:
+            return resultado, True
+
+    async def gerar_resultado():
+        tokens = verificar_orcamento(tipo, texto_entrada)
+        with registro_modelos_resposta() as modelos:
+            if paralelo:
+                resultado = await gerar_em_grupos_async(tipo, texto_entrada, estruturado)
+            else:
+                resultado = await chamar_modelo_async(tipo, texto_entrada, estruturado, tokens)
+        with medir_etapa('normalizacao', tipo):
+            resultado = normalizar_resultado(tipo, resultado)
+
+        if chave is not None and pode_gravar_cache(modelos):
+            await asyncio.to_thread(cache_respostas.gravar, chave, resultado)
+        return resultado
+
+    if coalescencia is None:
+        return await gerar_resultado(), False
+
+    resultado, _ = await coalescencia.executar_async(
+        chave or chave_requisicao(tipo, texto_entrada, estruturado, paralelo), gerar_resultado
+    )
+    return resultado, False
+
+
+async def executar_pipeline_longo_async(tipo, texto_entrada, estruturado=None):
+    """Versão assíncrona de executar_pipeline_longo (trechos em paralelo no event loop)"""
+    trechos = trechos_anotados(tipo, texto_entrada)
+    parciais = await asyncio.gather(*(
+        executar_pipeline_async(tipo, trecho, estruturado, modo='unico') for trecho in trechos
+    ))
+
+    with medir_etapa('mesclagem', tipo):
+        resultado = mesclar_resultados([r for r, _ in parciais], campos_do_tipo(tipo))
+    return resultado, all(em_cache for _, em_cache in parciais)
+
+
+async def processar_item_lote_async(item):
+    """Versão assíncrona de processar_item_lote"""
+    item_id = item.get('id') if isinstance(item, dict) else None
+    prioridade = prioridade_chamada.set('lote')
+    try:
+        if not isinstance(item, dict):
+            raise ValueError('Item do lote deve ser um objeto {id, tipo, texto}')
+
+        tipo = item.get('tipo', 'servico')
+        texto_entrada, _ = preparar_entrada(tipo, item.get('texto') or '')
+        if not texto_entrada.strip():
+            raise ValueError('Nenhum texto foi fornecido')
+
+        resultado, em_cache = await executar_pipeline_async(tipo, texto_entrada, modo=item.get('modo'))
+        return {
+            'id': item_id,
+            'sucesso': True,
+            'resultado': resultado,
+            'cache': em_cache
+        }
+    except Exception as e:
+        return {
+            'id': item_id,
+            'sucesso': False,
+            'erro': str(e)
+        }
+    finally:
+        prioridade_chamada.reset(prioridade)
+
+
+async def processar_lote_async(itens, concorrencia=None):
+    """Versão assíncrona de processar_lote, limitada por um semáforo"""
+    semaforo = asyncio.Semaphore(concorrencia or LOTE_MAX_CONCORRENCIA)
+
+    async def processar_limitado(item):
+        async with semaforo:
+            return await processar_item_lote_async(item)
+
+    return await asyncio.gather(*(processar_limitado(item) for item in itens))
+
+
+def processar_job(dados):
+    """Executa o fluxo de /processar para um job da fila"""
+    # Jobs rodam em segundo plano: cedem a vez ao tráfego interativo no limitador de taxa
+    prioridade = prioridade_chamada.set('lote')
+    try:
+        tipo = dados.get('tipo', 'servico')
+        texto_entrada, _ = preparar_entrada(tipo, dados['texto'])
+        if not texto_entrada.strip():
+            raise ValueError('Nenhum texto foi fornecido')
+        return executar_pipeline(tipo, texto_entrada, dados.get('estruturado'), dados.get('modo'))
+    finally:
+        prioridade_chamada.reset(prioridade)
+
+
+# Fila de jobs em segundo plano: workers no processo web (JOBS_WORKERS, 0 para
+# nenhum) ou em processo separado com `python fila_jobs.py --workers N`
+JOBS_ARQUIVO = os.getenv('JOBS_ARQUIVO', str(BASE_DIR / 'jobs.sqlite3'))
+JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', '2'))
+JOBS_PRAZO = int(os.getenv('JOBS_PRAZO', '1800'))
+JOBS_INTERVALO_EVENTOS = float(os.getenv('JOBS_INTERVALO_EVENTOS', '0.5'))
+# Duração máxima de uma conexão de /jobs/<id>/eventos: depois dela o cliente reconecta
+# (ou consulta GET /jobs/<id>), sem prender um worker web até o fim do job
+JOBS_EVENTOS_DURACAO_MAXIMA = float(os.getenv('JOBS_EVENTOS_DURACAO_MAXIMA', '25'))
+JOBS_EVENTOS_RECONEXAO_MS = int(os.getenv('JOBS_EVENTOS_RECONEXAO_MS', '1000'))
+
+fila_jobs = FilaJobs(JOBS_ARQUIVO, processar_job, prazo_processamento=JOBS_PRAZO)
+_workers_jobs_iniciados = False
+_lock_workers_jobs = threading.Lock()
+
+
+def iniciar_workers_jobs():
+    """
+    Inicia os JOBS_WORKERS workers deste processo, uma única vez. Chamado
+    pelos pontos de entrada web e no primeiro POST /jobs, nunca na
+    importação: scripts que importam a aplicação (catálogo, benchmark) não
+    devem reivindicar jobs do servidor web e encerrar no meio deles.
+    """
+    global _workers_jobs_iniciados
+    with _lock_workers_jobs:
+        if _workers_jobs_iniciados or JOBS_WORKERS <= 0:
+            return
+        fila_jobs.iniciar_workers(JOBS_WORKERS)
+        _workers_jobs_iniciados = True
+
+
+def coletar_metricas_caches():
+    """Expõe os contadores dos caches, da resiliência, do limitador, da coalescência e da fila de jobs"""
+    prompts = registro_prompts.estatisticas()
+    coletadas = [(
+        'servicosclean_cache_prompts_total', 'counter',
+        'Consultas ao registro de templates de prompt por resultado',
+        [({'resultado': 'acerto'}, prompts['acertos']), ({'resultado': 'falha'}, prompts['falhas'])]
+    )]
+    compilador = compilador_prompts.estatisticas()
+    coletadas.append((
+        'servicosclean_compilador_prompts_total', 'counter',
+        'Compilações de templates e subconjuntos de campos montados pelo compilador de prompts',
+        [({'evento': 'compilacao'}, compilador['compilacoes']),
+         ({'evento': 'subconjunto'}, compilador['subconjuntos'])]
+    ))
+    chamadas = estatisticas_resiliencia()
+    eventos = (('retentativa', 'retentativas'), ('circuito_aberto', 'aberturas_circuito'),
+               ('recusada_circuito', 'recusadas_circuito'), ('tentativas_esgotadas', 'tentativas_esgotadas'),
+               ('prazo_esgotado', 'prazos_esgotados'))
+    coletadas.append((
+        'servicosclean_resiliencia_total', 'counter',
+        'Retentativas, recusas do disjuntor e falhas definitivas das chamadas ao modelo',
+        [({'modelo': modelo, 'evento': evento}, valores[chave])
+         for modelo, valores in chamadas.items() for evento, chave in eventos]
+    ))
+    coletadas.append((
+        'servicosclean_circuito_aberto', 'gauge',
+        'Estado do disjuntor das chamadas ao modelo (1 = aberto ou em teste)',
+        [({'modelo': modelo}, 0 if valores['circuito'] == Disjuntor.FECHADO else 1)
+         for modelo, valores in chamadas.items()]
+    ))
+    if especulacao is not None:
+        especulativas = especulacao.estatisticas()
+        coletadas.append((
+            'servicosclean_especulacao_total', 'counter',
+            'Chamadas especulativas disparadas, vencedoras e recusadas por falta de orçamento',
+            [({'evento': 'disparada'}, especulativas['disparadas']),
+             ({'evento': 'vencedora'}, especulativas['vencedoras']),
+             ({'evento': 'recusada_orcamento'}, especulativas['recusadas_orcamento'])]
+        ))
+    roteamento = roteador_modelos.estatisticas()
+    coletadas.append((
+        'servicosclean_roteador_rebaixamentos_total', 'counter',
+        'Vezes em que o roteador passou o modelo principal para o fim da fila por erros ou circuito aberto',
+        [({}, roteamento['rebaixamentos'])]
+    ))
+    jobs = fila_jobs.estatisticas()
+    coletadas.append((
+        'servicosclean_jobs', 'gauge',
+        'Jobs na fila por situação',
+        [({'status': 'pendente'}, jobs['pendentes']), ({'status': 'processando'}, jobs['processando'])]
+    ))
+    coletadas.append((
+        'servicosclean_jobs_finalizados_total', 'counter',
+        'Jobs finalizados pelos workers deste processo',
+        [({'resultado': 'sucesso'}, jobs['executados']), ({'resultado': 'erro'}, jobs['falhas'])]
+    ))
+    if limitador_taxa is not None:
+        limite = limitador_taxa.estatisticas()
+        coletadas.append((
+            'servicosclean_limite_taxa_fila', 'gauge',
+            'Chamadas aguardando ficha no limitador de taxa, por classe de prioridade',
+            [({'classe': classe}, valor) for classe, valor in limite['fila'].items()]
+        ))
+        coletadas.append((
+            'servicosclean_limite_taxa_recusadas_total', 'counter',
+            'Chamadas que desistiram da fila do limitador por exceder a espera máxima',
+            [({'classe': classe}, valor) for classe, valor in limite['recusadas'].items()]
+        ))
+    if coalescencia is not None:
+        coalescidas = coalescencia.estatisticas()
+        coletadas.append((
+            'servicosclean_coalescencia_total', 'counter',
+            'Chamadas ao modelo executadas e economizadas por requisições idênticas simultâneas',
+            [({'resultado': 'executada'}, coalescidas['executadas']),
+             ({'resultado': 'economizada'}, coalescidas['economizadas'])]
+        ))
+    if cache_contexto is not None:
+        contexto = cache_contexto.estatisticas()
+        coletadas.append((
+            'servicosclean_cache_contexto_total', 'counter',
+            'Registros e usos do cache de contexto das regras no provedor',
+            [({'evento': 'criacao'}, contexto['criacoes']), ({'evento': 'uso'}, contexto['usos']),
+             ({'evento': 'erro'}, contexto['erros'])]
+        ))
+    if cache_respostas is not None:
+        respostas = cache_respostas.estatisticas()
+        coletadas.append((
+            'servicosclean_cache_respostas_total', 'counter',
+            'Consultas ao cache de respostas por resultado',
+            [({'resultado': 'acerto'}, respostas['acertos']), ({'resultado': 'falha'}, respostas['falhas'])]
+        ))
+    return coletadas
+
+
+metricas.registrar_coletor(coletar_metricas_caches)
+
 
 @app.route('/')
 def index():
@@ -172,50 +1812,218 @@ def informacao():
     return render_template('informacao.html')
 
 
+@app.route('/metrics')
+def metrics():
+    """Métricas no formato de texto do Prometheus"""
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/status')
+def status():
+    """Contadores internos (caches, etc.)"""
+    return jsonify({
+        'backend': backend_llm.nome,
+        'prompts': registro_prompts.estatisticas(),
+        'compilador_prompts': compilador_prompts.estatisticas(),
+        'cache_respostas': cache_respostas.estatisticas() if cache_respostas else None,
+        'cache_contexto': cache_contexto.estatisticas() if cache_contexto else None,
+        'coalescencia': coalescencia.estatisticas() if coalescencia else None,
+        'resiliencia': estatisticas_resiliencia(),
+        'roteador': roteador_modelos.estatisticas(),
+        'especulacao': especulacao.estatisticas() if especulacao else None,
+        'limite_taxa': limitador_taxa.estatisticas() if limitador_taxa else None,
+        'jobs': fila_jobs.estatisticas(),
+    })
+
+
 @app.route('/processar', methods=['POST'])
 def processar():
     """Endpoint para processar o texto"""
+    tipo = 'servico'
+    with metrica_requisicoes_em_andamento.em_andamento(rota='/processar'):
+        try:
+            data = request.get_json()
+            texto_entrada = data.get('texto', '')
+            tipo = data.get('tipo', 'servico') # 'servico' ou 'informacao'
+
+            with medir_etapa('total', tipo):
+                texto_entrada, normalizacao = preparar_entrada(tipo, texto_entrada)
+                if not texto_entrada.strip():
+                    resposta = jsonify({
+                        'sucesso': False,
+                        'erro': 'Nenhum texto foi fornecido'
+                    }), 400
+                elif data.get('campos') is not None:
+                    # Reprocessamento parcial: só os campos pedidos são regenerados
+                    try:
+                        campos, anteriores = validar_campos_parciais(tipo, data.get('campos'), data.get('anteriores'))
+                    except ValueError as e:
+                        resposta = jsonify({
+                            'sucesso': False,
+                            'erro': str(e)
+                        }), 400
+                    else:
+                        resultado, tokens = executar_pipeline_parcial(
+                            tipo, texto_entrada, campos, anteriores, data.get('estruturado')
+                        )
+                        with medir_etapa('jsonify', tipo):
+                            resposta = jsonify({
+                                'sucesso': True,
+                                'resultado': resultado,
+                                'cache': False,
+                                'campos_regenerados': campos,
+                                'tokens_prompt_estimados': tokens,
+                                'normalizacao': normalizacao
+                            })
+                else:
+                    resultado, em_cache = executar_pipeline(
+                        tipo, texto_entrada, data.get('estruturado'), data.get('modo')
+                    )
+
+                    with medir_etapa('jsonify', tipo):
+                        resposta = jsonify({
+                            'sucesso': True,
+                            'resultado': resultado,
+                            'cache': em_cache,
+                            'tokens_prompt_estimados': estimar_tokens_prompt(tipo, texto_entrada),
+                            'normalizacao': normalizacao
+                        })
+
+        except OrcamentoExcedido as e:
+            resposta = jsonify({
+                'sucesso': False,
+                'erro': str(e),
+                'tokens_prompt_estimados': e.tokens,
+                'limite_tokens': e.limite
+            }), 413
+
+        except ModeloIndisponivel as e:
+            resposta = jsonify({
+                'sucesso': False,
+                'erro': str(e)
+            }), e.status_http, {'Retry-After': str(e.repetir_apos)} if e.repetir_apos else {}
+
+        except Exception as e:
+            resposta = jsonify({
+                'sucesso': False,
+                'erro': str(e)
+            }), 500
+
+    status = resposta[1] if isinstance(resposta, tuple) else 200
+    metrica_requisicoes.inc(rota='/processar', tipo=tipo_prompt(tipo), status=status)
+    return resposta
+
+
+@app.route('/processar/stream', methods=['POST'])
+def processar_stream():
+    """Endpoint para processar o texto enviando os campos via Server-Sent Events"""
+    data = request.get_json(silent=True) or {}
+    texto_entrada = data.get('texto', '')
+    tipo = data.get('tipo', 'servico') # 'servico' ou 'informacao'
+
+    texto_entrada, normalizacao = preparar_entrada(tipo, texto_entrada)
+    if not texto_entrada.strip():
+        metrica_requisicoes.inc(rota='/processar/stream', tipo=tipo_prompt(tipo), status=400)
+        return jsonify({
+            'sucesso': False,
+            'erro': 'Nenhum texto foi fornecido'
+        }), 400
+
+    def gerar():
+        # A requisição dura até o último evento (ou até o cliente desconectar)
+        try:
+            with metrica_requisicoes_em_andamento.em_andamento(rota='/processar/stream'), \
+                    medir_etapa('total', tipo):
+                try:
+                    if normalizacao is not None:
+                        yield formatar_evento_sse('normalizacao', normalizacao)
+                    for evento, dados in executar_pipeline_stream(
+                        tipo, texto_entrada, data.get('estruturado'), data.get('modo')
+                    ):
+                        yield formatar_evento_sse(evento, dados)
+                except Exception as e:
+                    yield formatar_evento_sse('erro', {'erro': str(e)})
+        finally:
+            metrica_requisicoes.inc(rota='/processar/stream', tipo=tipo_prompt(tipo), status=200)
+
+    return Response(
+        stream_with_context(gerar()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/processar/lote', methods=['POST'])
+def processar_lote_endpoint():
+    """Endpoint para processar vários textos em uma única requisição"""
+    # Um lote mistura tipos: as métricas da requisição ficam sem tipo
+    with metrica_requisicoes_em_andamento.em_andamento(rota='/processar/lote'), medir_etapa('total', None):
+        try:
+            data = request.get_json()
+            itens = data.get('itens') if isinstance(data, dict) else None
+
+            if not isinstance(itens, list) or not itens:
+                resposta = jsonify({
+                    'sucesso': False,
+                    'erro': 'Nenhum item foi fornecido (esperado: {"itens": [{id, tipo, texto}, ...]})'
+                }), 400
+
+            elif len(itens) > LOTE_MAX_ITENS:
+                resposta = jsonify({
+                    'sucesso': False,
+                    'erro': f'Lote excede o limite de {LOTE_MAX_ITENS} itens'
+                }), 413
+
+            else:
+                resultados = processar_lote(itens)
+
+                resposta = jsonify({
+                    'sucesso': True,
+                    'total': len(resultados),
+                    'falhas': sum(1 for r in resultados if not r['sucesso']),
+                    'resultados': resultados
+                })
+
+        except Exception as e:
+            resposta = jsonify({
+                'sucesso': False,
+                'erro': str(e)
+            }), 500
+
+    status = resposta[1] if isinstance(resposta, tuple) else 200
+    metrica_requisicoes.inc(rota='/processar/lote', tipo='', status=status)
+    return resposta
+
+
+@app.route('/jobs', methods=['POST'])
+def criar_job():
+    """Enfileira o processamento do texto e responde imediatamente com o id do job"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         texto_entrada = data.get('texto', '')
-        tipo = data.get('tipo', 'servico') # 'servico' ou 'informacao'
-        
-        if not texto_entrada.strip():
+
+        if not isinstance(texto_entrada, str) or not texto_entrada.strip():
             return jsonify({
                 'sucesso': False,
                 'erro': 'Nenhum texto foi fornecido'
             }), 400
-        
-        # Cria o prompt apropriado
-        prompt = criar_prompt(tipo, texto_entrada)
-        
-        # Processa com Gemini
-        resultado = processar_com_gemini(prompt)
-
-        # Garante que retornamos um dicionário
-        if not isinstance(resultado, dict):
-            raise Exception('Resposta do modelo não veio como JSON/dicionário')
 
-        # Normaliza campos dependendo do tipo
-        if tipo == 'informacao':
-            campos = ['o_que_e', 'como_funciona', 'publico_alvo', 'informacoes_importantes']
-        else:
-            campos = [
-                'descricao_resumida', 'descricao_completa', 'servico_nao_cobre',
-                'tempo_atendimento', 'custo', 'resultado_solicitacao',
-                'documentos_necessarios', 'instrucoes_solicitante',
-                'canais_digitais', 'canais_presenciais', 'legislacao_relacionada'
-            ]
-            
-        for c in campos:
-            if c not in resultado:
-                resultado[c] = ''
+        iniciar_workers_jobs()
+        job_id = fila_jobs.enfileirar({
+            'tipo': data.get('tipo', 'servico'),
+            'texto': texto_entrada,
+            'estruturado': data.get('estruturado'),
+            'modo': data.get('modo'),
+        })
 
         return jsonify({
             'sucesso': True,
-            'resultado': resultado
-        })
-        
+            'job_id': job_id,
+            'status': 'pendente',
+            'url': url_for('consultar_job', job_id=job_id),
+            'eventos': url_for('eventos_job', job_id=job_id)
+        }), 202
+
     except Exception as e:
         return jsonify({
             'sucesso': False,
@@ -223,6 +2031,64 @@ def processar():
         }), 500
 
 
+@app.route('/jobs/<job_id>')
+def consultar_job(job_id):
+    """Situação do job e, quando concluído, o resultado"""
+    job = fila_jobs.obter(job_id)
+    if job is None:
+        return jsonify({
+            'sucesso': False,
+            'erro': 'Job não encontrado'
+        }), 404
+    return jsonify({'sucesso': True, **job})
+
+
+@app.route('/jobs/<job_id>/eventos')
+def eventos_job(job_id):
+    """
+    Acompanha o job via Server-Sent Events: 'status' a cada mudança e 'fim' ou
+    'erro' ao terminar. Após JOBS_EVENTOS_DURACAO_MAXIMA a conexão é fechada
+    com um 'status' ({status, reconectar: true}) e a dica `retry:`; o
+    EventSource reconecta sozinho e recebe o status atual.
+    """
+    if fila_jobs.obter(job_id) is None:
+        return jsonify({
+            'sucesso': False,
+            'erro': 'Job não encontrado'
+        }), 404
+
+    def gerar():
+        status_anterior = None
+        inicio = time.monotonic()
+        while True:
+            job = fila_jobs.obter(job_id)
+            if job is None:
+                yield formatar_evento_sse('erro', {'erro': 'Job não encontrado'})
+                return
+            if job['status'] != status_anterior:
+                status_anterior = job['status']
+                yield formatar_evento_sse('status', {'status': job['status']})
+            if job['status'] == CONCLUIDO:
+                yield formatar_evento_sse('fim', {'resultado': job['resultado'], 'cache': job['cache']})
+                return
+            if job['status'] == ERRO:
+                yield formatar_evento_sse('erro', {'erro': job['erro']})
+                return
+            if time.monotonic() - inicio + JOBS_INTERVALO_EVENTOS > JOBS_EVENTOS_DURACAO_MAXIMA:
+                yield formatar_evento_sse(
+                    'status', {'status': job['status'], 'reconectar': True}, retry=JOBS_EVENTOS_RECONEXAO_MS
+                )
+                return
+            time.sleep(JOBS_INTERVALO_EVENTOS)
+
+    return Response(
+        stream_with_context(gerar()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 if __name__ == '__main__':
+    iniciar_workers_jobs()
     app.run(debug=True)
 
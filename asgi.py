@@ -0,0 +1,187 @@
+"""
+Ponto de entrada ASGI da aplicação.
+
+As rotas POST /processar e /processar/lote são atendidas de forma assíncrona
+(cliente `client.aio` do Gemini), permitindo dezenas de chamadas simultâneas
+ao modelo em um único processo. As demais rotas são encaminhadas para a
+aplicação Flask (WSGI) existente.
+
+Uso:
+    uvicorn asgi:application
+"""
+
+import functools
+import json
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (
+    app, estimar_tokens_prompt, executar_pipeline_async, executar_pipeline_parcial_async, iniciar_workers_jobs,
+    medir_etapa, metrica_requisicoes, metrica_requisicoes_em_andamento, preparar_entrada, processar_lote_async,
+    tipo_prompt, validar_campos_parciais, LOTE_MAX_ITENS
+)
+from orcamento_tokens import OrcamentoExcedido
+from resiliencia import ModeloIndisponivel
+
+aplicacao_wsgi = WsgiToAsgi(app)
+
+
+async def ler_json(receive):
+    """Lê o corpo da requisição e decodifica o JSON (None se inválido)"""
+    corpo = b''
+    while True:
+        mensagem = await receive()
+        corpo += mensagem.get('body', b'')
+        if not mensagem.get('more_body'):
+            break
+    try:
+        return json.loads(corpo or b'null')
+    except ValueError:
+        return None
+
+
+async def responder_json(send, dados, status=200, cabecalhos=None):
+    """Envia uma resposta JSON (`cabecalhos`: dict de cabeçalhos extras)"""
+    corpo = json.dumps(dados).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(corpo)).encode()),
+        ] + [(nome.lower().encode(), str(valor).encode()) for nome, valor in (cabecalhos or {}).items()],
+    })
+    await send({'type': 'http.response.body', 'body': corpo})
+
+
+def instrumentada(rota, por_tipo=True):
+    """
+    Aplica às rotas assíncronas as mesmas métricas das rotas Flask:
+    requisições em andamento, etapa 'total' e contagem por status.
+    Com `por_tipo=False` (lotes, que misturam tipos) o rótulo de tipo fica vazio.
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        async def executar(data):
+            tipo = None
+            if por_tipo:
+                tipo = data.get('tipo', 'servico') if isinstance(data, dict) else 'servico'
+            with metrica_requisicoes_em_andamento.em_andamento(rota=rota), medir_etapa('total', tipo):
+                resposta = await funcao(data)
+            metrica_requisicoes.inc(rota=rota, tipo=tipo_prompt(tipo) if tipo else '', status=resposta[1])
+            return resposta
+        return executar
+    return decorador
+
+
+@instrumentada('/processar')
+async def processar(data):
+    """Equivalente assíncrono do endpoint /processar"""
+    try:
+        texto_entrada = data.get('texto', '')
+        tipo = data.get('tipo', 'servico')
+
+        texto_entrada, normalizacao = preparar_entrada(tipo, texto_entrada)
+        if not texto_entrada.strip():
+            return {'sucesso': False, 'erro': 'Nenhum texto foi fornecido'}, 400
+
+        if data.get('campos') is not None:
+            # Reprocessamento parcial: só os campos pedidos são regenerados
+            try:
+                campos, anteriores = validar_campos_parciais(tipo, data.get('campos'), data.get('anteriores'))
+            except ValueError as e:
+                return {'sucesso': False, 'erro': str(e)}, 400
+            resultado, tokens = await executar_pipeline_parcial_async(
+                tipo, texto_entrada, campos, anteriores, data.get('estruturado')
+            )
+            return {
+                'sucesso': True,
+                'resultado': resultado,
+                'cache': False,
+                'campos_regenerados': campos,
+                'tokens_prompt_estimados': tokens,
+                'normalizacao': normalizacao
+            }, 200
+
+        resultado, em_cache = await executar_pipeline_async(
+            tipo, texto_entrada, data.get('estruturado'), data.get('modo')
+        )
+        return {
+            'sucesso': True,
+            'resultado': resultado,
+            'cache': em_cache,
+            'tokens_prompt_estimados': estimar_tokens_prompt(tipo, texto_entrada),
+            'normalizacao': normalizacao
+        }, 200
+
+    except OrcamentoExcedido as e:
+        return {
+            'sucesso': False,
+            'erro': str(e),
+            'tokens_prompt_estimados': e.tokens,
+            'limite_tokens': e.limite
+        }, 413
+
+    except ModeloIndisponivel as e:
+        return {'sucesso': False, 'erro': str(e)}, e.status_http, \
+            {'Retry-After': str(e.repetir_apos)} if e.repetir_apos else {}
+
+    except Exception as e:
+        return {'sucesso': False, 'erro': str(e)}, 500
+
+
+@instrumentada('/processar/lote', por_tipo=False)
+async def processar_lote(data):
+    """Equivalente assíncrono do endpoint /processar/lote"""
+    try:
+        itens = data.get('itens') if isinstance(data, dict) else None
+
+        if not isinstance(itens, list) or not itens:
+            return {
+                'sucesso': False,
+                'erro': 'Nenhum item foi fornecido (esperado: {"itens": [{id, tipo, texto}, ...]})'
+            }, 400
+
+        if len(itens) > LOTE_MAX_ITENS:
+            return {'sucesso': False, 'erro': f'Lote excede o limite de {LOTE_MAX_ITENS} itens'}, 413
+
+        resultados = await processar_lote_async(itens)
+        return {
+            'sucesso': True,
+            'total': len(resultados),
+            'falhas': sum(1 for r in resultados if not r['sucesso']),
+            'resultados': resultados
+        }, 200
+
+    except Exception as e:
+        return {'sucesso': False, 'erro': str(e)}, 500
+
+
+ROTAS_ASSINCRONAS = {
+    '/processar': processar,
+    '/processar/lote': processar_lote,
+}
+
+
+async def application(scope, receive, send):
+    """Aplicação ASGI"""
+    if scope['type'] == 'lifespan':
+        while True:
+            mensagem = await receive()
+            if mensagem['type'] == 'lifespan.startup':
+                # Workers da fila de jobs no processo web (JOBS_WORKERS)
+                iniciar_workers_jobs()
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensagem['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    rota = ROTAS_ASSINCRONAS.get(scope.get('path'))
+    if scope['type'] == 'http' and scope['method'] == 'POST' and rota is not None:
+        data = await ler_json(receive)
+        # As rotas retornam (dados, status) ou (dados, status, cabeçalhos), como no Flask
+        dados, status, *cabecalhos = await rota(data if data is not None else {})
+        await responder_json(send, dados, status, *cabecalhos)
+        return
+
+    await aplicacao_wsgi(scope, receive, send)
@@ -0,0 +1,334 @@
+"""
+Backends de modelo de linguagem usados por processar_com_gemini.
+
+- BackendGemini: chamadas reais à API do Gemini (google-genai).
+- BackendLocal: substituto determinístico, sem rede, com latência, variação
+  (jitter), taxa de falha e resposta JSON configuráveis. Usado em testes de
+  carga e benchmarks do fluxo completo sem gastar cota da API.
+
+O backend ativo é escolhido pela variável LLM_BACKEND (gemini | local).
+
+Backends com cache de contexto (suporta_cache_contexto) recebem em
+`contexto` o nome de um prefixo já registrado com criar_cache_contexto; o
+`prompt` passado é então apenas o sufixo. `timeout` (segundos) limita a
+duração da requisição; ao estourar, o erro tem código 504.
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from orcamento_tokens import estimar_tokens
+
+
+@dataclass
+class RespostaLLM:
+    """Texto gerado pelo modelo e contagem de tokens (quando disponível)"""
+    texto: str
+    modelo: str
+    tokens_entrada: Optional[int] = None
+    tokens_saida: Optional[int] = None
+    tokens_cache: Optional[int] = None
+
+
+# Classes base dos erros de transporte dos clientes HTTP (httpx, aiohttp), comparadas
+# pelo nome para não importar os clientes
+_ERROS_TRANSPORTE = ('TransportError', 'ClientConnectionError')
+
+
+class ErroBackend(Exception):
+    """
+    Falha ao chamar o backend. `codigo` segue os códigos HTTP (429, 500, 503...)
+    quando o erro vem do provedor.
+    """
+
+    def __init__(self, mensagem, codigo=None):
+        super().__init__(mensagem)
+        self.codigo = codigo
+
+
+class BackendLLM:
+    """Interface comum aos backends"""
+
+    nome = 'base'
+    suporta_cache_contexto = False
+
+    def gerar(self, prompt, modelo, esquema=None, contexto=None, timeout=None):
+        """Gera a resposta completa e retorna um RespostaLLM"""
+        raise NotImplementedError
+
+    def gerar_stream(self, prompt, modelo, esquema=None, contexto=None, timeout=None):
+        """Gera os trechos de texto da resposta à medida que ficam prontos"""
+        raise NotImplementedError
+
+    async def gerar_async(self, prompt, modelo, esquema=None, contexto=None, timeout=None):
+        """Versão assíncrona de gerar"""
+        return await asyncio.to_thread(self.gerar, prompt, modelo, esquema, contexto, timeout)
+
+    def criar_cache_contexto(self, prefixo, modelo, ttl_segundos, nome_exibicao=None, timeout=None):
+        """
+        Registra `prefixo` no cache de contexto do provedor e retorna o nome
+        do cache. `timeout` (segundos) limita a espera pelo provedor.
+        """
+        raise NotImplementedError
+
+    def remover_cache_contexto(self, nome, timeout=None):
+        """Remove um cache de contexto registrado"""
+
+
+class BackendGemini(BackendLLM):
+    """Backend que usa a API do Gemini"""
+
+    nome = 'gemini'
+    suporta_cache_contexto = True
+
+    def __init__(self, api_key):
+        from google import genai
+        from google.genai import types
+
+        self._types = types
+        self.client = genai.Client(api_key=api_key) if api_key else None
+
+    def gerar(self, prompt, modelo, esquema=None, contexto=None, timeout=None):
+        response = self._chamar(
+            lambda: self._cliente().models.generate_content(
+                model=modelo,
+                contents=prompt,
+                config=self._configuracao(esquema, contexto, timeout)
+            )
+        )
+        return self._resposta(response, modelo)
+
+    def gerar_stream(self, prompt, modelo, esquema=None, contexto=None, timeout=None):
+        chunks = self._chamar(
+            lambda: self._cliente().models.generate_content_stream(
+                model=modelo,
+                contents=prompt,
+                config=self._configuracao(esquema, contexto, timeout)
+            )
+        )
+        try:
+            for chunk in chunks:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            raise self._converter_erro(e)
+
+    async def gerar_async(self, prompt, modelo, esquema=None, contexto=None, timeout=None):
+        try:
+            response = await self._cliente().aio.models.generate_content(
+                model=modelo,
+                contents=prompt,
+                config=self._configuracao(esquema, contexto, timeout)
+            )
+        except Exception as e:
+            raise self._converter_erro(e)
+        return self._resposta(response, modelo)
+
+    def criar_cache_contexto(self, prefixo, modelo, ttl_segundos, nome_exibicao=None, timeout=None):
+        cache = self._chamar(
+            lambda: self._cliente().caches.create(
+                model=modelo,
+                config=self._types.CreateCachedContentConfig(
+                    contents=[prefixo],
+                    ttl=f'{int(ttl_segundos)}s',
+                    display_name=nome_exibicao,
+                    http_options=self._http_options(timeout),
+                )
+            )
+        )
+        return cache.name
+
+    def remover_cache_contexto(self, nome, timeout=None):
+        self._chamar(
+            lambda: self._cliente().caches.delete(
+                name=nome,
+                config=self._types.DeleteCachedContentConfig(http_options=self._http_options(timeout)),
+            )
+        )
+
+    def _cliente(self):
+        if not self.client:
+            raise ValueError("Cliente Gemini não configurado (verifique GEMINI_API_KEY)")
+        return self.client
+
+    def _configuracao(self, esquema, contexto=None, timeout=None):
+        """JSON direto (structured output) quando há esquema; prefixo em cache quando há contexto"""
+        parametros = {}
+        if esquema is not None:
+            parametros.update(response_mime_type='application/json', response_schema=esquema)
+        if contexto is not None:
+            parametros['cached_content'] = contexto
+        if timeout is not None:
+            parametros['http_options'] = self._http_options(timeout)
+        if not parametros:
+            return None
+        return self._types.GenerateContentConfig(**parametros)
+
+    def _http_options(self, timeout):
+        """Tempo limite (segundos) no formato do SDK, que usa milissegundos"""
+        if timeout is None:
+            return None
+        return self._types.HttpOptions(timeout=max(1, int(timeout * 1000)))
+
+    def _chamar(self, chamada):
+        try:
+            return chamada()
+        except Exception as e:
+            raise self._converter_erro(e)
+
+    def _converter_erro(self, erro):
+        if isinstance(erro, (ErroBackend, ValueError)):
+            return erro
+        # Timeouts do cliente HTTP (httpx) não trazem código
+        if isinstance(erro, TimeoutError) or 'Timeout' in type(erro).__name__:
+            return ErroBackend(f"Tempo limite da requisição esgotado: {str(erro)}", 504)
+        # Falhas de transporte (conexão recusada ou reiniciada, DNS) também não trazem
+        # código: são indisponibilidade do provedor, tratadas como 503 (retentável)
+        if isinstance(erro, OSError) or any(c.__name__ in _ERROS_TRANSPORTE for c in type(erro).__mro__):
+            return ErroBackend(f"Falha de conexão com o provedor: {str(erro)}", 503)
+        return ErroBackend(str(erro), getattr(erro, 'code', None))
+
+    def _resposta(self, response, modelo):
+        uso = getattr(response, 'usage_metadata', None)
+        return RespostaLLM(
+            texto=response.text,
+            modelo=modelo,
+            tokens_entrada=getattr(uso, 'prompt_token_count', None),
+            tokens_saida=getattr(uso, 'candidates_token_count', None),
+            tokens_cache=getattr(uso, 'cached_content_token_count', None),
+        )
+
+
+class BackendLocal(BackendLLM):
+    """
+    Backend local determinístico para testes de carga e benchmarks.
+
+    Sem `resposta` configurada, devolve um JSON com as chaves pedidas: as do
+    esquema (modo estruturado) ou as citadas entre crases nas instruções de
+    saída do prompt. Com `semente`, latências e falhas são reproduzíveis.
+    Com `taxa_lentidao`, essa fração das chamadas demora `fator_lentidao`
+    vezes mais (cauda de latência).
+    Com `cache_contexto`, simula o cache de contexto do provedor (prefixos
+    guardados em memória).
+    """
+
+    nome = 'local'
+
+    def __init__(self, latencia=0.5, jitter=0.0, taxa_falha=0.0, resposta=None,
+                 tamanho_campo=200, trechos_stream=8, codigos_falha=(429, 503), semente=None,
+                 cache_contexto=False, taxa_lentidao=0.0, fator_lentidao=10.0):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.taxa_falha = taxa_falha
+        self.resposta = resposta
+        self.tamanho_campo = tamanho_campo
+        self.trechos_stream = max(1, trechos_stream)
+        self.codigos_falha = tuple(codigos_falha)
+        self.suporta_cache_contexto = cache_contexto
+        self.taxa_lentidao = taxa_lentidao
+        self.fator_lentidao = fator_lentidao
+        self._aleatorio = random.Random(semente)
+        self._contextos = {}
+        self.chamadas = 0
+
+    def gerar(self, prompt, modelo, esquema=None, contexto=None, timeout=None):
+        atraso, falha = self._sortear(timeout)
+        time.sleep(atraso)
+        if falha:
+            raise falha
+        return self._resposta(prompt, modelo, esquema, contexto)
+
+    def gerar_stream(self, prompt, modelo, esquema=None, contexto=None, timeout=None):
+        atraso, falha = self._sortear(timeout)
+        texto = self._resposta(prompt, modelo, esquema, contexto).texto
+        passo = max(1, -(-len(texto) // self.trechos_stream))
+
+        for inicio in range(0, len(texto), passo):
+            time.sleep(atraso / self.trechos_stream)
+            if falha:
+                raise falha
+            yield texto[inicio:inicio + passo]
+
+    async def gerar_async(self, prompt, modelo, esquema=None, contexto=None, timeout=None):
+        atraso, falha = self._sortear(timeout)
+        await asyncio.sleep(atraso)
+        if falha:
+            raise falha
+        return self._resposta(prompt, modelo, esquema, contexto)
+
+    def criar_cache_contexto(self, prefixo, modelo, ttl_segundos, nome_exibicao=None, timeout=None):
+        if not self.suporta_cache_contexto:
+            raise NotImplementedError('Cache de contexto desativado no backend local')
+        nome = f'cachedContents/local-{len(self._contextos) + 1}'
+        self._contextos[nome] = prefixo
+        return nome
+
+    def remover_cache_contexto(self, nome, timeout=None):
+        self._contextos.pop(nome, None)
+
+    def _sortear(self, timeout=None):
+        """
+        Sorteia a latência e, conforme a taxa de falha, o erro da chamada.
+        Latência acima do timeout vira erro 504 ao fim do timeout.
+        """
+        self.chamadas += 1
+        atraso = max(0.0, self.latencia + self._aleatorio.uniform(-self.jitter, self.jitter))
+        if self.taxa_lentidao and self._aleatorio.random() < self.taxa_lentidao:
+            atraso *= self.fator_lentidao
+        falha = None
+        if self.taxa_falha and self._aleatorio.random() < self.taxa_falha:
+            codigo = self._aleatorio.choice(self.codigos_falha)
+            falha = ErroBackend(f"Falha simulada pelo backend local ({codigo})", codigo)
+        if timeout is not None and atraso > timeout:
+            atraso = timeout
+            falha = ErroBackend(f"Tempo limite da requisição esgotado ({timeout:.1f}s)", 504)
+        return atraso, falha
+
+    def _resposta(self, prompt, modelo, esquema, contexto=None):
+        prefixo = ''
+        if contexto is not None:
+            if contexto not in self._contextos:
+                raise ErroBackend(f"Cache de contexto não encontrado: {contexto}", 404)
+            prefixo = self._contextos[contexto]
+            prompt = prefixo + prompt
+
+        if self.resposta is not None:
+            texto = self.resposta if isinstance(self.resposta, str) else json.dumps(self.resposta, ensure_ascii=False)
+        else:
+            campos = self._campos_pedidos(prompt, esquema)
+            texto = json.dumps(
+                {c: self._valor_campo(c) for c in campos},
+                ensure_ascii=False
+            )
+            if esquema is None:
+                texto = f"```json\n{texto}\n```"
+
+        return RespostaLLM(
+            texto=texto,
+            modelo=modelo,
+            tokens_entrada=estimar_tokens(prompt),
+            tokens_saida=estimar_tokens(texto),
+            tokens_cache=estimar_tokens(prefixo) if prefixo else None,
+        )
+
+    def _campos_pedidos(self, prompt, esquema):
+        propriedades = getattr(esquema, 'properties', None)
+        if propriedades:
+            return list(propriedades)
+
+        # Chaves citadas após a última menção a JSON no prompt (instruções de saída)
+        instrucoes = prompt[prompt.rfind('JSON'):] if 'JSON' in prompt else ''
+        campos = []
+        for campo in re.findall(r'`([a-z_]+)`', instrucoes):
+            if campo not in campos:
+                campos.append(campo)
+        return campos
+
+    def _valor_campo(self, campo):
+        base = f"Conteúdo gerado localmente para {campo}. "
+        return (base * (self.tamanho_campo // len(base) + 1))[:self.tamanho_campo].strip()
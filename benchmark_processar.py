@@ -0,0 +1,303 @@
+"""
+Benchmark de ponta a ponta do fluxo de /processar.
+
+Executa a aplicação Flask contra o backend local (sem rede nem cota da API)
+e mede latência (p50/p95/p99) e vazão (req/s) por cenário:
+
+- tipo: servico x informacao
+- tamanho do texto de entrada: pequeno x grande
+- cache de prompts: frio (templates relidos a cada requisição) x quente
+
+Com --especulacao, cada cenário é repetido com as requisições especulativas
+(hedged requests) ativas, e o relatório mostra a variação do p99 em relação
+às chamadas extras feitas ao modelo. Use --taxa-lentidao para simular a cauda
+de latência do modelo.
+
+O resultado é gravado em JSON para comparar execuções entre commits e
+detectar regressões em criar_prompt, extração do JSON e normalização.
+
+Uso:
+    python benchmark_processar.py --requisicoes 200 --concorrencia 8
+    python benchmark_processar.py --servidor --saida depois.json --comparar antes.json
+    python benchmark_processar.py --latencia 0.2 --taxa-lentidao 0.03 --especulacao
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+
+TAMANHOS = {'pequeno': 700, 'grande': 20000}
+
+
+def configurar_ambiente(latencia, jitter, taxa_falha, taxa_lentidao=0.0, fator_lentidao=10.0):
+    """Configura o backend local antes de importar a aplicação"""
+    os.environ['LLM_BACKEND'] = 'local'
+    os.environ['LLM_LOCAL_LATENCIA'] = str(latencia)
+    os.environ['LLM_LOCAL_JITTER'] = str(jitter)
+    os.environ['LLM_LOCAL_TAXA_FALHA'] = str(taxa_falha)
+    os.environ['LLM_LOCAL_TAXA_LENTIDAO'] = str(taxa_lentidao)
+    os.environ['LLM_LOCAL_FATOR_LENTIDAO'] = str(fator_lentidao)
+    os.environ.setdefault('LLM_LOCAL_SEMENTE', '42')
+    # O cache de respostas transformaria todas as requisições repetidas em acertos
+    os.environ['CACHE_RESPOSTAS'] = '0'
+    # O texto sintético repete o exemplo: a normalização o reduziria ao exemplo original
+    os.environ['ENTRADA_NORMALIZAR'] = '0'
+
+
+def gerar_texto(tamanho):
+    """Texto de entrada sintético a partir do exemplo do projeto"""
+    base = (BASE_DIR / 'exemplos' / 'exemplo_entrada.txt').read_text(encoding='utf-8')
+    repeticoes = tamanho // len(base) + 1
+    return '\n\n'.join(f"{base}\n(trecho {i})" for i in range(repeticoes))[:tamanho]
+
+
+def percentil(valores, p):
+    """Percentil por interpolação linear (valores já ordenados)"""
+    if not valores:
+        return 0.0
+    posicao = (len(valores) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(valores) - 1)
+    return valores[inferior] + (valores[superior] - valores[inferior]) * (posicao - inferior)
+
+
+class ClienteTeste:
+    """Envia requisições pelo test client do Flask"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def post(self, corpo):
+        with self.app.test_client() as cliente:
+            resposta = cliente.post('/processar', json=corpo)
+            return resposta.status_code
+
+
+class ClienteServidor:
+    """Envia requisições HTTP a um servidor WSGI real (werkzeug) em uma thread"""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+
+        self.servidor = make_server('127.0.0.1', 0, app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.servidor.server_port}/processar"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def post(self, corpo):
+        requisicao = urllib.request.Request(
+            self.url,
+            data=json.dumps(corpo).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(requisicao) as resposta:
+                resposta.read()
+                return resposta.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def encerrar(self):
+        self.servidor.shutdown()
+
+
+def executar_cenario(app_modulo, cliente, tipo, tamanho, cache_prompts, requisicoes, concorrencia, aquecimento=1):
+    """Executa um cenário e retorna as métricas de latência e vazão"""
+    texto = gerar_texto(TAMANHOS[tamanho])
+    corpo = {'tipo': tipo, 'texto': texto}
+
+    def uma_requisicao(_):
+        if cache_prompts == 'frio':
+            app_modulo.registro_prompts.limpar()
+            app_modulo.compilador_prompts.limpar()
+        inicio = time.perf_counter()
+        status = cliente.post(corpo)
+        return time.perf_counter() - inicio, status
+
+    # Aquecimento (não entra na medição)
+    for _ in range(aquecimento):
+        uma_requisicao(None)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        medicoes = list(executor.map(uma_requisicao, range(requisicoes)))
+    duracao = time.perf_counter() - inicio
+
+    latencias = sorted(m[0] * 1000 for m in medicoes)
+    return {
+        'tipo': tipo,
+        'tamanho': tamanho,
+        'cache_prompts': cache_prompts,
+        'requisicoes': requisicoes,
+        'erros': sum(1 for m in medicoes if m[1] != 200),
+        'p50_ms': round(percentil(latencias, 50), 3),
+        'p95_ms': round(percentil(latencias, 95), 3),
+        'p99_ms': round(percentil(latencias, 99), 3),
+        'req_s': round(requisicoes / duracao, 2),
+    }
+
+
+def executar_com_especulacao(app_modulo, cliente, base, requisicoes, concorrencia):
+    """
+    Repete o cenário com as requisições especulativas ativas e retorna a
+    variação de p95/p99 e as chamadas extras em relação à execução `base`.
+    """
+    from especulacao import Especulacao
+
+    especulacao = Especulacao(
+        percentil=app_modulo.GEMINI_ESPECULACAO_PERCENTIL,
+        orcamento=app_modulo.GEMINI_ESPECULACAO_ORCAMENTO,
+        min_amostras=app_modulo.GEMINI_ESPECULACAO_MIN_AMOSTRAS,
+    )
+    app_modulo.especulacao = especulacao
+    try:
+        # O aquecimento acumula as amostras de latência necessárias para o percentil
+        cenario = executar_cenario(
+            app_modulo, cliente, base['tipo'], base['tamanho'], base['cache_prompts'],
+            requisicoes, concorrencia, aquecimento=especulacao.min_amostras
+        )
+        disparadas = especulacao.estatisticas()['disparadas']
+        vencedoras = especulacao.estatisticas()['vencedoras']
+    finally:
+        app_modulo.especulacao = None
+
+    def variacao(chave):
+        return round((cenario[chave] / base[chave] - 1) * 100, 1) if base[chave] else 0.0
+
+    return {
+        'p95_ms': cenario['p95_ms'],
+        'p99_ms': cenario['p99_ms'],
+        'req_s': cenario['req_s'],
+        'erros': cenario['erros'],
+        'variacao_p95_pct': variacao('p95_ms'),
+        'variacao_p99_pct': variacao('p99_ms'),
+        'chamadas_extras': disparadas,
+        'chamadas_extras_pct': round(disparadas / (requisicoes + especulacao.min_amostras) * 100, 1),
+        'extras_vencedoras': vencedoras,
+    }
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def comparar(resultado, caminho_anterior):
+    """Imprime a variação de p95 e req/s em relação a uma execução anterior"""
+    with open(caminho_anterior, 'r', encoding='utf-8') as f:
+        anterior = json.load(f)
+
+    def chave(c):
+        return c['tipo'], c['tamanho'], c['cache_prompts']
+
+    anteriores = {chave(c): c for c in anterior['cenarios']}
+    print(f"\nComparação com {caminho_anterior} (commit {anterior.get('commit')}):")
+    for cenario in resultado['cenarios']:
+        base = anteriores.get(chave(cenario))
+        if not base:
+            continue
+        delta_p95 = (cenario['p95_ms'] / base['p95_ms'] - 1) * 100 if base['p95_ms'] else 0.0
+        delta_rps = (cenario['req_s'] / base['req_s'] - 1) * 100 if base['req_s'] else 0.0
+        print(f"  {'/'.join(chave(cenario)):<28} p95 {delta_p95:+6.1f}%  req/s {delta_rps:+6.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do fluxo de /processar com o backend local')
+    parser.add_argument('--requisicoes', type=int, default=100, help='Requisições por cenário')
+    parser.add_argument('--concorrencia', type=int, default=4, help='Requisições simultâneas')
+    parser.add_argument('--latencia', type=float, default=0.0,
+                        help='Latência simulada do modelo, em segundos (0 mede só o overhead da aplicação)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Variação da latência simulada')
+    parser.add_argument('--taxa-falha', type=float, default=0.0, help='Fração de chamadas que falham')
+    parser.add_argument('--taxa-lentidao', type=float, default=0.0,
+                        help='Fração de chamadas muito lentas (cauda de latência do modelo)')
+    parser.add_argument('--fator-lentidao', type=float, default=10.0,
+                        help='Quantas vezes as chamadas lentas demoram mais que a latência simulada')
+    parser.add_argument('--especulacao', action='store_true',
+                        help='Repete cada cenário com requisições especulativas e compara p99 e chamadas extras')
+    parser.add_argument('--servidor', action='store_true',
+                        help='Usa um servidor WSGI real em vez do test client do Flask')
+    parser.add_argument('--saida', default='benchmark_resultados.json', help='Arquivo JSON de saída')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior para comparação')
+    args = parser.parse_args(argv)
+
+    configurar_ambiente(args.latencia, args.jitter, args.taxa_falha, args.taxa_lentidao, args.fator_lentidao)
+    sys.path.insert(0, str(BASE_DIR))
+    import app as app_modulo
+
+    # A execução de referência de cada cenário é sempre sem especulação
+    app_modulo.especulacao = None
+    if args.especulacao:
+        # Sem coalescência, cada requisição faz a própria chamada ao modelo (o corpo é sempre o mesmo)
+        app_modulo.coalescencia = None
+
+    cliente = ClienteServidor(app_modulo.app) if args.servidor else ClienteTeste(app_modulo.app)
+
+    cenarios = []
+    print(f"{'cenário':<30} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>9} {'erros':>6}")
+    try:
+        for tipo in ('servico', 'informacao'):
+            for tamanho in TAMANHOS:
+                for cache_prompts in ('frio', 'quente'):
+                    cenario = executar_cenario(
+                        app_modulo, cliente, tipo, tamanho, cache_prompts,
+                        args.requisicoes, args.concorrencia
+                    )
+                    cenarios.append(cenario)
+                    nome = f"{tipo}/{tamanho}/{cache_prompts}"
+                    print(f"{nome:<30} {cenario['p50_ms']:>9.2f} {cenario['p95_ms']:>9.2f} "
+                          f"{cenario['p99_ms']:>9.2f} {cenario['req_s']:>9.1f} {cenario['erros']:>6}")
+                    if args.especulacao:
+                        hedge = executar_com_especulacao(
+                            app_modulo, cliente, cenario, args.requisicoes, args.concorrencia
+                        )
+                        cenario['especulacao'] = hedge
+                        print(f"{'  + especulação':<30} {'':>9} {hedge['p95_ms']:>9.2f} {hedge['p99_ms']:>9.2f} "
+                              f"{hedge['req_s']:>9.1f} {hedge['erros']:>6}  p99 {hedge['variacao_p99_pct']:+.1f}% "
+                              f"com {hedge['chamadas_extras']} chamadas extras ({hedge['chamadas_extras_pct']:.1f}%)")
+    finally:
+        if args.servidor:
+            cliente.encerrar()
+
+    resultado = {
+        'commit': commit_atual(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'configuracao': {
+            'requisicoes': args.requisicoes,
+            'concorrencia': args.concorrencia,
+            'latencia': args.latencia,
+            'jitter': args.jitter,
+            'taxa_falha': args.taxa_falha,
+            'taxa_lentidao': args.taxa_lentidao,
+            'fator_lentidao': args.fator_lentidao,
+            'especulacao': args.especulacao,
+            'cliente': 'servidor' if args.servidor else 'test_client',
+        },
+        'cenarios': cenarios,
+    }
+
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em {args.saida}")
+
+    if args.comparar:
+        comparar(resultado, args.comparar)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Cache de contexto do prefixo estático dos prompts no provedor do modelo.
+
+As regras de cada tipo (prompts/{tipo}.md) abrem todos os prompts e são
+idênticas entre requisições. Em vez de reenviá-las a cada chamada, o prefixo
+é registrado uma vez no cache de contexto do provedor e as chamadas enviam
+apenas o sufixo (texto de entrada + instruções de saída).
+
+O registro é refeito quando o template muda (hash diferente) ou perto de
+expirar. Se o backend não oferece o recurso, ou o registro falha, obter()
+retorna None e o chamador envia o prompt completo.
+
+O registro chama o provedor com tempo limite e fora do lock: enquanto um
+(modelo, tipo) está sendo registrado, as requisições desse par seguem com o
+prompt completo em vez de esperar, e os demais pares não são afetados.
+
+Os caches ocupam armazenamento pago no provedor até expirar: limpar() os
+remove e é chamado no encerramento do processo.
+"""
+
+import threading
+import time
+
+# Registro renovado quando faltar menos que isto para expirar
+MARGEM_RENOVACAO_SEGUNDOS = 60
+
+# Após uma falha de registro, nova tentativa só depois deste intervalo
+ESPERA_APOS_FALHA_SEGUNDOS = 300
+
+
+class CacheContexto:
+    """Nomes dos caches de contexto registrados no backend, por (modelo, tipo)"""
+
+    def __init__(self, backend, ttl_segundos=3600, timeout=10.0):
+        self.backend = backend
+        self.ttl_segundos = ttl_segundos
+        self.timeout = timeout
+        self._entradas = {}  # (modelo, tipo) -> (hash, nome, expira_em, prefixo)
+        self._falhas = {}  # (modelo, tipo) -> momento da última falha
+        self._registrando = set()  # (modelo, tipo) com registro em andamento
+        self._lock = threading.Lock()
+        self.criacoes = 0
+        self.erros = 0
+        self.usos = 0
+
+    def obter(self, tipo, modelo, hash_prefixo, prefixo):
+        """
+        Nome do cache de contexto com `prefixo` para o tipo/modelo, registrando-o
+        se necessário. Retorna None quando o recurso não está disponível.
+        """
+        if not self.backend.suporta_cache_contexto:
+            return None
+
+        chave = (modelo, tipo)
+        agora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada and entrada[0] == hash_prefixo and entrada[2] - agora > MARGEM_RENOVACAO_SEGUNDOS:
+                self.usos += 1
+                return entrada[1]
+
+            falha = self._falhas.get(chave)
+            if falha and agora - falha < ESPERA_APOS_FALHA_SEGUNDOS:
+                return None
+
+            # Uma única requisição registra o par; as simultâneas não criam caches
+            # duplicados nem esperam: enviam o prompt completo
+            if chave in self._registrando:
+                return None
+            self._registrando.add(chave)
+
+        try:
+            nome = self.backend.criar_cache_contexto(
+                prefixo, modelo, self.ttl_segundos, f'servicosclean-{tipo}', timeout=self.timeout
+            )
+        except Exception as e:
+            with self._lock:
+                self._registrando.discard(chave)
+                self.erros += 1
+                self._falhas[chave] = time.time()
+            print(f"AVISO: cache de contexto indisponível para {tipo} ({modelo}): {str(e)}")
+            return None
+
+        with self._lock:
+            self._registrando.discard(chave)
+            self._falhas.pop(chave, None)
+            self._entradas[chave] = (hash_prefixo, nome, agora + self.ttl_segundos, prefixo)
+            self.criacoes += 1
+            self.usos += 1
+
+        # O cache anterior (template antigo) deixa de ser usado
+        if entrada and entrada[1] != nome:
+            self._remover(entrada[1])
+        return nome
+
+    def descartar(self, nome):
+        """
+        Esquece o cache `nome` (ex.: expirado no provedor) para que seja
+        recriado. Retorna o prefixo que ele continha (None se desconhecido).
+        """
+        prefixo = None
+        with self._lock:
+            for chave, entrada in list(self._entradas.items()):
+                if entrada[1] == nome:
+                    prefixo = entrada[3]
+                    del self._entradas[chave]
+        self._remover(nome)
+        return prefixo
+
+    def limpar(self):
+        """Remove os caches registrados no backend"""
+        with self._lock:
+            nomes = [entrada[1] for entrada in self._entradas.values()]
+            self._entradas.clear()
+            self._falhas.clear()
+        for nome in nomes:
+            self._remover(nome)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'ativos': len(self._entradas),
+                'criacoes': self.criacoes,
+                'usos': self.usos,
+                'erros': self.erros,
+            }
+
+    def _remover(self, nome):
+        try:
+            self.backend.remover_cache_contexto(nome, timeout=self.timeout)
+        except Exception:
+            pass
@@ -0,0 +1,131 @@
+"""
+Cache persistente (SQLite) dos resultados de /processar.
+
+A chave é um hash de (tipo, texto normalizado, modelo, hash do template de
+prompt). Alterar o arquivo em prompts/ muda o hash do template e, portanto,
+as entradas antigas deixam de ser encontradas e saem pela expiração/LRU.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def normalizar_texto(texto):
+    """Colapsa espaços em branco para que variações triviais usem a mesma chave"""
+    return ' '.join(texto.split())
+
+
+def gerar_chave(tipo, texto, modelo, hash_prompt, variante=''):
+    """
+    Hash SHA-256 que identifica uma requisição de processamento.
+    `variante` distingue modos que geram prompts diferentes para o mesmo template.
+    """
+    partes = [tipo, normalizar_texto(texto), modelo, hash_prompt, variante]
+    return hashlib.sha256('\x1f'.join(partes).encode('utf-8')).hexdigest()
+
+
+class CacheRespostas:
+    """
+    Armazena resultados em SQLite com expiração (TTL) e remoção LRU.
+
+    Cada thread usa sua própria conexão; o arquivo pode ser compartilhado por
+    vários processos (workers do servidor WSGI).
+    """
+
+    def __init__(self, caminho, ttl_segundos=7 * 24 * 3600, max_entradas=5000):
+        self.caminho = str(caminho)
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+        with self._conexao() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS respostas (
+                    chave TEXT PRIMARY KEY,
+                    resultado TEXT NOT NULL,
+                    criado_em REAL NOT NULL,
+                    ultimo_acesso REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_respostas_acesso ON respostas (ultimo_acesso)"
+            )
+
+    def obter(self, chave):
+        """Retorna o resultado em cache ou None se ausente/expirado"""
+        agora = time.time()
+        with self._conexao() as conn:
+            linha = conn.execute(
+                "SELECT resultado, criado_em FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+
+            if linha is None or agora - linha[1] > self.ttl_segundos:
+                if linha is not None:
+                    conn.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                self._contar(acerto=False)
+                return None
+
+            conn.execute(
+                "UPDATE respostas SET ultimo_acesso = ? WHERE chave = ?", (agora, chave)
+            )
+
+        self._contar(acerto=True)
+        return json.loads(linha[0])
+
+    def gravar(self, chave, resultado):
+        """Grava o resultado e aplica a política de expiração/LRU"""
+        agora = time.time()
+        with self._conexao() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO respostas (chave, resultado, criado_em, ultimo_acesso) "
+                "VALUES (?, ?, ?, ?)",
+                (chave, json.dumps(resultado, ensure_ascii=False), agora, agora),
+            )
+            conn.execute(
+                "DELETE FROM respostas WHERE criado_em < ?", (agora - self.ttl_segundos,)
+            )
+            conn.execute(
+                "DELETE FROM respostas WHERE chave IN ("
+                "SELECT chave FROM respostas ORDER BY ultimo_acesso DESC LIMIT -1 OFFSET ?)",
+                (self.max_entradas,),
+            )
+
+    def limpar(self):
+        """Remove todas as entradas e zera os contadores"""
+        with self._conexao() as conn:
+            conn.execute("DELETE FROM respostas")
+        with self._lock:
+            self.acertos = 0
+            self.falhas = 0
+
+    def estatisticas(self):
+        """Contadores de acerto/falha e quantidade de entradas"""
+        with self._conexao() as conn:
+            entradas = conn.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+        with self._lock:
+            return {
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'entradas': entradas,
+            }
+
+    def _contar(self, acerto):
+        with self._lock:
+            if acerto:
+                self.acertos += 1
+            else:
+                self.falhas += 1
+
+    def _conexao(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
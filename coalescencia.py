@@ -0,0 +1,117 @@
+"""
+Coalescência de requisições idênticas simultâneas (single-flight).
+
+Enquanto uma chamada para uma chave está em andamento, as demais chamadas
+com a mesma chave não repetem o trabalho: aguardam a primeira e recebem o
+mesmo resultado (ou a mesma exceção).
+
+Quem não consegue entregar o trabalho como uma função (ex.: o streaming, que
+envia os campos enquanto gera) usa as etapas separadas: entrar(), e então
+aguardar() (seguidor) ou concluir() (líder).
+"""
+
+import asyncio
+import threading
+
+
+class _Voo:
+    """Chamada em andamento para uma chave"""
+
+    __slots__ = ('evento', 'resultado', 'erro')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class Coalescencia:
+    """Agrupa chamadas simultâneas com a mesma chave em uma única execução"""
+
+    def __init__(self):
+        self._voos = {}
+        self._voos_async = {}
+        self._lock = threading.Lock()
+        self.executadas = 0
+        self.economizadas = 0
+
+    def executar(self, chave, funcao):
+        """
+        Executa funcao() uma única vez por chave entre as chamadas simultâneas.
+        Retorna (resultado, compartilhado), com compartilhado=True para quem
+        aproveitou a execução de outra chamada.
+        """
+        voo, lider = self.entrar(chave)
+        if not lider:
+            return self.aguardar(voo), True
+
+        try:
+            resultado = funcao()
+        except BaseException as e:
+            self.concluir(chave, voo, erro=e)
+            raise
+        self.concluir(chave, voo, resultado)
+        return resultado, False
+
+    def entrar(self, chave):
+        """
+        Registra uma chamada para a chave e retorna (voo, lider). O líder
+        deve chamar concluir(); os demais, aguardar(voo).
+        """
+        with self._lock:
+            voo = self._voos.get(chave)
+            if voo is not None:
+                self.economizadas += 1
+                return voo, False
+            voo = self._voos[chave] = _Voo()
+            return voo, True
+
+    def aguardar(self, voo):
+        """Aguarda o líder e retorna o resultado dele (ou lança a mesma exceção)"""
+        voo.evento.wait()
+        if voo.erro is not None:
+            raise voo.erro
+        return voo.resultado
+
+    def concluir(self, chave, voo, resultado=None, erro=None):
+        """Publica o resultado (ou o erro) do líder e libera quem aguarda"""
+        voo.resultado, voo.erro = resultado, erro
+        with self._lock:
+            del self._voos[chave]
+            self.executadas += 1
+        voo.evento.set()
+
+    async def executar_async(self, chave, funcao):
+        """Versão assíncrona de executar; `funcao` retorna uma corrotina"""
+        voo = self._voos_async.get(chave)
+        if voo is not None:
+            with self._lock:
+                self.economizadas += 1
+            # shield: o cancelamento de quem espera não cancela a chamada original
+            return await asyncio.shield(voo), True
+
+        voo = self._voos_async[chave] = asyncio.get_running_loop().create_future()
+        try:
+            resultado = await funcao()
+        except asyncio.CancelledError:
+            voo.cancel()
+            raise
+        except BaseException as e:
+            voo.set_exception(e)
+            voo.exception()  # evita o aviso de exceção não recuperada sem seguidores
+            raise
+        else:
+            voo.set_result(resultado)
+        finally:
+            del self._voos_async[chave]
+            with self._lock:
+                self.executadas += 1
+        return resultado, False
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'em_andamento': len(self._voos) + len(self._voos_async),
+                'executadas': self.executadas,
+                'economizadas': self.economizadas,
+            }
@@ -0,0 +1,145 @@
+"""
+Compilador dos templates de prompt (prompts/*.md).
+
+Cada template é analisado uma única vez por versão (hash do conteúdo): as
+regras gerais e as seções "### `campo`" ficam indexadas, e as variantes das
+regras são montadas na compilação e guardadas como strings prontas:
+
+- completo: o template inteiro, como está no arquivo;
+- compacto: sem blocos de código (exemplos e modelos de saída) e sem linhas
+  em branco repetidas;
+- subconjuntos de campos: regras gerais + seções dos campos pedidos, na
+  ordem do template, montados no primeiro uso e reaproveitados.
+
+Quando o arquivo muda, o registro de prompts entrega a nova versão e ela é
+compilada de novo; as requisições nunca reanalisam o markdown.
+"""
+
+import hashlib
+import re
+import threading
+from dataclasses import dataclass, field
+
+from secoes_prompt import dividir_secoes
+
+VARIANTES = ('completo', 'compacto')
+
+_BLOCO_CODIGO = re.compile(r'^```.*?^```[ \t]*\n?', re.MULTILINE | re.DOTALL)
+_LINHAS_EM_BRANCO = re.compile(r'\n{3,}')
+
+
+def compactar(texto):
+    """Remove blocos de código e linhas em branco repetidas"""
+    texto = _BLOCO_CODIGO.sub('', texto)
+    texto = '\n'.join(linha.rstrip() for linha in texto.split('\n'))
+    return _LINHAS_EM_BRANCO.sub('\n\n', texto).strip()
+
+
+@dataclass(frozen=True)
+class PromptCompilado:
+    """Template indexado por campo, com as variantes prontas"""
+    tipo: str
+    hash: str
+    gerais: str
+    secoes: dict
+    variantes: dict
+    hashes: dict
+    subconjuntos: dict = field(default_factory=dict, compare=False)
+
+    @property
+    def campos(self):
+        """Campos com seção própria no template, na ordem do arquivo"""
+        return list(self.secoes)
+
+
+class CompiladorPrompts:
+    """Compila os templates do registro e serve as variantes das regras"""
+
+    def __init__(self, registro):
+        self.registro = registro
+        self._compilados = {}
+        self._lock = threading.Lock()
+        self.compilacoes = 0
+        self.subconjuntos_montados = 0
+
+    def compilar(self, tipo):
+        """PromptCompilado da versão atual do template (compila só se ela mudou)"""
+        template = self.registro.obter_template(tipo)
+        with self._lock:
+            compilado = self._compilados.get(tipo)
+            if compilado is not None and compilado.hash == template.hash:
+                return compilado
+
+        gerais, secoes = dividir_secoes(template.conteudo)
+        variantes = {'completo': template.conteudo, 'compacto': compactar(template.conteudo)}
+        # O hash do completo é o do arquivo, para não invalidar as chaves já gravadas
+        hashes = {
+            'completo': template.hash,
+            'compacto': hashlib.sha256(variantes['compacto'].encode('utf-8')).hexdigest(),
+        }
+        compilado = PromptCompilado(tipo, template.hash, gerais, secoes, variantes, hashes)
+        with self._lock:
+            self._compilados[tipo] = compilado
+            self.compilacoes += 1
+        return compilado
+
+    def regras(self, tipo, variante='completo'):
+        """Regras do tipo na variante pedida"""
+        return self.compilar(tipo).variantes[self._validar(variante)]
+
+    def hash(self, tipo, variante='completo'):
+        """Hash das regras do tipo na variante (identifica a versão nas chaves de cache)"""
+        return self.compilar(tipo).hashes[self._validar(variante)]
+
+    def regras_campos(self, tipo, campos, variante='completo'):
+        """
+        Regras gerais + seções dos `campos`. Sem seções por campo no
+        template, retorna as regras completas da variante.
+        """
+        compilado = self.compilar(tipo)
+        variante = self._validar(variante)
+        if not compilado.secoes:
+            return compilado.variantes[variante]
+
+        chave = (variante, frozenset(campos))
+        with self._lock:
+            texto = compilado.subconjuntos.get(chave)
+        if texto is not None:
+            return texto
+
+        partes = [compilado.gerais] if compilado.gerais else []
+        partes.extend(secao for campo, secao in compilado.secoes.items() if campo in chave[1])
+        texto = '\n\n'.join(partes)
+        if variante == 'compacto':
+            texto = compactar(texto)
+        with self._lock:
+            compilado.subconjuntos[chave] = texto
+            self.subconjuntos_montados += 1
+        return texto
+
+    def limpar(self):
+        """Descarta as compilações e zera os contadores"""
+        with self._lock:
+            self._compilados.clear()
+            self.compilacoes = 0
+            self.subconjuntos_montados = 0
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'compilacoes': self.compilacoes,
+                'subconjuntos': self.subconjuntos_montados,
+                'tipos': {
+                    tipo: {
+                        'campos': len(c.secoes),
+                        'caracteres': {v: len(t) for v, t in c.variantes.items()},
+                    }
+                    for tipo, c in sorted(self._compilados.items())
+                },
+            }
+
+    @staticmethod
+    def _validar(variante):
+        if variante not in VARIANTES:
+            raise ValueError(f"Variante de prompt desconhecida: {variante}")
+        return variante
@@ -0,0 +1,117 @@
+"""
+Processamento de textos muito longos em trechos (map-reduce).
+
+O texto de entrada é dividido em limites de seção (títulos, perguntas como
+"O que é?", parágrafos); cada trecho é processado separadamente, em
+paralelo, e os resultados parciais são combinados campo a campo de forma
+determinística (na ordem dos trechos).
+"""
+
+import re
+
+# Linha que abre uma seção: título Markdown, "Pergunta?" ou "Rótulo:" curtos
+_INICIO_SECAO = re.compile(r'^\s*(#{1,6}\s+\S.*|[^\n.!]{2,80}[?:])\s*$')
+
+# Campos curtos em que apenas o primeiro valor não vazio é mantido
+CAMPOS_VALOR_UNICO = {'descricao_resumida'}
+
+
+def _dividir_bloco(bloco, max_caracteres):
+    """Divide um bloco maior que o limite em frases (ou, em último caso, em cortes fixos)"""
+    partes, atual = [], ''
+    for frase in re.split(r'(?<=[.!?;])\s+', bloco):
+        while len(frase) > max_caracteres:
+            if atual:
+                partes.append(atual)
+                atual = ''
+            partes.append(frase[:max_caracteres])
+            frase = frase[max_caracteres:]
+        if atual and len(atual) + len(frase) + 1 > max_caracteres:
+            partes.append(atual)
+            atual = frase
+        else:
+            atual = f'{atual} {frase}' if atual else frase
+    if atual:
+        partes.append(atual)
+    return partes
+
+
+def dividir_em_trechos(texto, max_caracteres):
+    """
+    Divide o texto em trechos de até `max_caracteres`, quebrando de
+    preferência no início de seções e, na falta delas, entre parágrafos.
+    """
+    blocos = [b.strip() for b in re.split(r'\n\s*\n', texto) if b.strip()]
+
+    # Agrupa os parágrafos em seções (cada seção começa em um título)
+    secoes = []
+    for bloco in blocos:
+        primeira_linha = bloco.split('\n', 1)[0]
+        if not secoes or _INICIO_SECAO.match(primeira_linha):
+            secoes.append([bloco])
+        else:
+            secoes[-1].append(bloco)
+
+    trechos, atual = [], ''
+    for secao in secoes:
+        texto_secao = '\n\n'.join(secao)
+
+        # Seção inteira cabe no trecho atual
+        if len(atual) + len(texto_secao) + 2 <= max_caracteres:
+            atual = f'{atual}\n\n{texto_secao}' if atual else texto_secao
+            continue
+
+        if atual:
+            trechos.append(atual)
+            atual = ''
+
+        if len(texto_secao) <= max_caracteres:
+            atual = texto_secao
+            continue
+
+        # Seção maior que o limite: quebra entre parágrafos (ou frases)
+        for bloco in secao:
+            for parte in ([bloco] if len(bloco) <= max_caracteres else _dividir_bloco(bloco, max_caracteres)):
+                if atual and len(atual) + len(parte) + 2 > max_caracteres:
+                    trechos.append(atual)
+                    atual = ''
+                atual = f'{atual}\n\n{parte}' if atual else parte
+
+    if atual:
+        trechos.append(atual)
+    return trechos
+
+
+def anotar_trecho(trecho, indice, total):
+    """Acrescenta ao trecho a indicação de que ele é parte de um documento maior"""
+    return (
+        f"[Trecho {indice} de {total} de um documento longo. "
+        f"Extraia apenas as informações presentes neste trecho; "
+        f"deixe vazios os campos sem informação aqui.]\n\n{trecho}"
+    )
+
+
+def mesclar_resultados(parciais, campos):
+    """
+    Combina os resultados parciais campo a campo, na ordem dos trechos:
+    valores vazios e repetidos são descartados; os demais são unidos por
+    parágrafo (ou, em CAMPOS_VALOR_UNICO, fica apenas o primeiro).
+    """
+    resultado = {}
+    for campo in campos:
+        valores, vistos = [], set()
+        for parcial in parciais:
+            valor = parcial.get(campo, '')
+            if not isinstance(valor, str):
+                valor = '\n'.join(str(v) for v in valor) if isinstance(valor, list) else str(valor or '')
+            valor = valor.strip()
+            chave = ' '.join(valor.split()).lower()
+            if valor and chave not in vistos:
+                vistos.add(chave)
+                valores.append(valor)
+
+        if campo in CAMPOS_VALOR_UNICO:
+            resultado[campo] = valores[0] if valores else ''
+        else:
+            resultado[campo] = '\n\n'.join(valores)
+    return resultado
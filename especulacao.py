@@ -0,0 +1,229 @@
+"""
+Requisições especulativas (hedged requests) para reduzir a latência de cauda.
+
+Se a chamada ao modelo ainda não respondeu depois de um percentil da latência
+recente (ex.: p95 das últimas chamadas do mesmo modelo e tipo), uma segunda
+chamada idêntica é disparada e vale a primeira resposta bem-sucedida.
+
+O gasto extra é limitado: o total de chamadas especulativas não passa de uma
+fração (orçamento) das chamadas feitas, e nada é disparado enquanto não houver
+amostras suficientes para estimar o percentil.
+
+Na versão síncrona a chamada só sai da thread do chamador quando uma cópia
+poderia ser disparada: com o orçamento esgotado, ou sem thread livre no pool
+(limitado e compartilhado), ela roda diretamente, sem especulação. Threads
+não podem ser interrompidas: a cópia perdedora consulta copia_descartada()
+antes de chamar o modelo e desiste se a outra já respondeu.
+"""
+
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturoTimeout
+
+# Evento da execução à qual a cópia atual pertence; sinalizado quando ela termina
+_decidida = contextvars.ContextVar('especulacao_decidida', default=None)
+
+
+class CopiaDescartada(Exception):
+    """A outra cópia da chamada já respondeu; esta não precisa ir ao modelo"""
+
+
+def copia_descartada():
+    """Indica, dentro de uma cópia executada no pool, se a execução já terminou"""
+    decidida = _decidida.get()
+    return decidida is not None and decidida.is_set()
+
+
+class Especulacao:
+    """Dispara uma segunda chamada quando a primeira passa do percentil de latência"""
+
+    def __init__(self, percentil=95, orcamento=0.05, min_amostras=20, janela=200, atraso_minimo=0.05,
+                 max_threads=16):
+        """
+        `orcamento`: fração máxima de chamadas extras em relação às chamadas
+        feitas (0.05 = no máximo 5% a mais de chamadas ao modelo).
+        `max_threads`: tamanho do pool das chamadas síncronas acompanhadas.
+        """
+        self.percentil = percentil
+        self.orcamento = orcamento
+        self.min_amostras = min_amostras
+        self.janela = janela
+        self.atraso_minimo = atraso_minimo
+        self._latencias = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='especulacao')
+        self._vagas = threading.BoundedSemaphore(max_threads)
+        self.chamadas = 0
+        self.disparadas = 0
+        self.vencedoras = 0
+        self.recusadas_orcamento = 0
+
+    def atraso(self, chave):
+        """Tempo de espera antes da chamada especulativa (None sem amostras suficientes)"""
+        with self._lock:
+            latencias = sorted(self._latencias.get(chave, ()))
+        if len(latencias) < self.min_amostras:
+            return None
+        # Posição pelo método do posto mais próximo (nearest rank)
+        posicao = max(0, math.ceil(len(latencias) * self.percentil / 100) - 1)
+        return max(self.atraso_minimo, latencias[posicao])
+
+    def executar(self, chave, funcao, timeout=None):
+        """
+        Executa funcao(timeout) e, se ela demorar além do percentil da `chave`,
+        uma segunda cópia com o tempo restante. Retorna o primeiro resultado
+        bem-sucedido; se as duas falharem, lança o erro da primeira.
+        """
+        atraso = self.atraso(chave)
+        with self._lock:
+            self.chamadas += 1
+        inicio = time.monotonic()
+        # A primeira chamada roda no pool para que a espera possa ser interrompida, mas
+        # só se uma cópia puder de fato ser disparada e houver thread livre
+        if atraso is None or (timeout is not None and atraso >= timeout) \
+                or not self._cabe_no_orcamento() or not self._vagas.acquire(blocking=False):
+            resultado = funcao(timeout)
+            self.registrar(chave, time.monotonic() - inicio)
+            return resultado
+
+        decidida = threading.Event()
+        try:
+            primeira = self._iniciar(funcao, timeout, decidida)
+            primeira.add_done_callback(lambda futuro: self._registrar_futuro(chave, inicio, futuro))
+            try:
+                return primeira.result(timeout=atraso)
+            except FuturoTimeout:
+                pass
+
+            if not self._vagas.acquire(blocking=False):
+                return primeira.result()
+            if not self._reservar():
+                self._vagas.release()
+                return primeira.result()
+            segunda = self._iniciar(
+                funcao, None if timeout is None else timeout - (time.monotonic() - inicio), decidida
+            )
+
+            erro = None
+            pendentes = {primeira, segunda}
+            while pendentes:
+                concluidas, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                # A chamada perdedora já em andamento segue em segundo plano e só alimenta a latência
+                for futuro in sorted(concluidas, key=lambda f: f is segunda):
+                    if futuro.exception() is None:
+                        if futuro is segunda:
+                            with self._lock:
+                                self.vencedoras += 1
+                        return futuro.result()
+                    if futuro is primeira or erro is None:
+                        erro = futuro.exception()
+            raise erro
+        finally:
+            # A cópia que ainda não chamou o modelo (ex.: aguardando cota) desiste
+            decidida.set()
+
+    async def executar_async(self, chave, funcao, timeout=None):
+        """Versão assíncrona de executar; funcao(timeout) retorna uma corrotina"""
+        atraso = self.atraso(chave)
+        with self._lock:
+            self.chamadas += 1
+        inicio = time.monotonic()
+        if atraso is None or (timeout is not None and atraso >= timeout):
+            resultado = await funcao(timeout)
+            self.registrar(chave, time.monotonic() - inicio)
+            return resultado
+
+        primeira = asyncio.ensure_future(funcao(timeout))
+        segunda = None
+        try:
+            concluidas, _ = await asyncio.wait({primeira}, timeout=atraso)
+            if concluidas or not self._reservar():
+                resultado = await primeira
+                self.registrar(chave, time.monotonic() - inicio)
+                return resultado
+
+            segunda = asyncio.ensure_future(
+                funcao(None if timeout is None else timeout - (time.monotonic() - inicio))
+            )
+            erro = None
+            pendentes = {primeira, segunda}
+            while pendentes:
+                concluidas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                for tarefa in sorted(concluidas, key=lambda t: t is segunda):
+                    if tarefa.exception() is None:
+                        if tarefa is segunda:
+                            with self._lock:
+                                self.vencedoras += 1
+                        # Se a primeira perdeu, ela é cancelada: demorou pelo menos até aqui
+                        self.registrar(chave, time.monotonic() - inicio)
+                        return tarefa.result()
+                    if tarefa is primeira or erro is None:
+                        erro = tarefa.exception()
+            raise erro
+        finally:
+            # A chamada perdedora (ou as duas, se esta for cancelada) não precisa terminar
+            primeira.cancel()
+            if segunda is not None:
+                segunda.cancel()
+
+    def registrar(self, chave, segundos):
+        """Acrescenta a latência de uma chamada bem-sucedida à janela da chave"""
+        with self._lock:
+            latencias = self._latencias.get(chave)
+            if latencias is None:
+                latencias = self._latencias[chave] = deque(maxlen=self.janela)
+            latencias.append(segundos)
+
+    def estatisticas(self):
+        with self._lock:
+            chaves = list(self._latencias)
+            dados = {
+                'chamadas': self.chamadas,
+                'disparadas': self.disparadas,
+                'vencedoras': self.vencedoras,
+                'recusadas_orcamento': self.recusadas_orcamento,
+            }
+        dados['atraso_ms'] = {
+            chave: round(atraso * 1000, 1) if atraso is not None else None
+            for chave, atraso in ((chave, self.atraso(chave)) for chave in chaves)
+        }
+        return dados
+
+    def _cabe_no_orcamento(self):
+        """Indica se uma chamada extra ainda caberia no orçamento (sem reservá-la)"""
+        with self._lock:
+            return self.disparadas + 1 <= self.orcamento * self.chamadas
+
+    def _reservar(self):
+        """Reserva uma chamada extra se ela couber no orçamento"""
+        with self._lock:
+            if self.disparadas + 1 > self.orcamento * self.chamadas:
+                self.recusadas_orcamento += 1
+                return False
+            self.disparadas += 1
+            return True
+
+    def _registrar_futuro(self, chave, inicio, futuro):
+        if not futuro.cancelled() and futuro.exception() is None:
+            self.registrar(chave, time.monotonic() - inicio)
+
+    def _iniciar(self, funcao, timeout, decidida):
+        """
+        Executa funcao(timeout) no pool, no contexto atual, e retorna o Future.
+        O chamador já adquiriu uma vaga em `_vagas` (liberada ao terminar), então
+        a chamada nunca espera na fila do pool.
+        """
+        contexto = contextvars.copy_context()
+        contexto.run(_decidida.set, decidida)
+        try:
+            futuro = self._executor.submit(contexto.run, funcao, timeout)
+        except BaseException:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        return futuro
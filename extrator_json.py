@@ -0,0 +1,129 @@
+"""
+Extração incremental do objeto JSON gerado pelo modelo.
+
+O texto da resposta é consumido em trechos (como chegam do streaming) em uma
+única passada. O extrator ignora o que vier antes do primeiro `{` (cercas
+```json, texto livre), acompanha o aninhamento de chaves/colchetes e strings
+e devolve cada par chave/valor do objeto de nível superior assim que ele é
+fechado. Chaves dentro de strings ou de valores aninhados não confundem a
+extração, e cada trecho do texto é examinado uma única vez.
+"""
+
+import json
+import re
+
+# Caracteres relevantes fora e dentro de strings
+_ESPECIAIS_FORA = re.compile(r'[\"{}\[\],]')
+_ESPECIAIS_STRING = re.compile(r'[\"\\]')
+
+
+class ExtratorJSONIncremental:
+    """
+    Consome o texto do modelo trecho a trecho e devolve os pares
+    (chave, valor) do primeiro objeto JSON de nível superior.
+    """
+
+    def __init__(self):
+        self.objeto = {}
+        self.iniciado = False
+        self.concluido = False
+        self._membro = []
+        self._profundidade = 0
+        self._em_string = False
+        self._escape = False
+
+    def alimentar(self, trecho):
+        """
+        Processa mais um trecho do texto e retorna a lista de pares
+        (chave, valor) concluídos neste trecho.
+        """
+        concluidos = []
+        if self.concluido or not trecho:
+            return concluidos
+
+        pos = 0
+        if not self.iniciado:
+            inicio = trecho.find('{')
+            if inicio == -1:
+                return concluidos
+            self.iniciado = True
+            self._profundidade = 1
+            pos = inicio + 1
+
+        tamanho = len(trecho)
+        while pos < tamanho:
+            if self._escape:
+                # Caractere escapado dentro de string (pode ter vindo no trecho seguinte)
+                self._membro.append(trecho[pos])
+                self._escape = False
+                pos += 1
+                continue
+
+            if self._em_string:
+                achado = _ESPECIAIS_STRING.search(trecho, pos)
+                if achado is None:
+                    self._membro.append(trecho[pos:])
+                    break
+                fim = achado.end()
+                self._membro.append(trecho[pos:fim])
+                if achado.group() == '\\':
+                    self._escape = True
+                else:
+                    self._em_string = False
+                pos = fim
+                continue
+
+            achado = _ESPECIAIS_FORA.search(trecho, pos)
+            if achado is None:
+                self._membro.append(trecho[pos:])
+                break
+
+            caractere = achado.group()
+            inicio = achado.start()
+            self._membro.append(trecho[pos:inicio])
+            pos = inicio + 1
+
+            if caractere == '"':
+                self._em_string = True
+            elif caractere in '{[':
+                self._profundidade += 1
+            elif caractere in '}]':
+                self._profundidade -= 1
+                if self._profundidade == 0:
+                    self._fechar_membro(concluidos)
+                    self.concluido = True
+                    break
+            elif self._profundidade == 1:
+                # Vírgula no nível superior: fim de um par chave/valor
+                self._fechar_membro(concluidos)
+                continue
+
+            self._membro.append(caractere)
+
+        return concluidos
+
+    def _fechar_membro(self, concluidos):
+        texto = ''.join(self._membro).strip()
+        self._membro = []
+        if not texto:
+            return
+
+        membro = json.loads('{' + texto + '}')
+        for chave, valor in membro.items():
+            self.objeto[chave] = valor
+            concluidos.append((chave, valor))
+
+
+def extrair_objeto(texto):
+    """
+    Extrai o primeiro objeto JSON de nível superior de um texto completo.
+    Lança json.JSONDecodeError se não houver objeto ou se ele estiver incompleto.
+    """
+    extrator = ExtratorJSONIncremental()
+    extrator.alimentar(texto or '')
+
+    if not extrator.iniciado:
+        raise json.JSONDecodeError('Nenhum objeto JSON encontrado', texto or '', 0)
+    if not extrator.concluido:
+        raise json.JSONDecodeError('Objeto JSON incompleto', texto, len(texto))
+    return extrator.objeto
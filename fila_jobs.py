@@ -0,0 +1,236 @@
+"""
+Fila de jobs em segundo plano (SQLite) para limpezas demoradas.
+
+POST /jobs grava o job e responde imediatamente com o id; um pool de workers
+executa o fluxo de /processar e grava o resultado, que o cliente consulta em
+GET /jobs/<id> ou acompanha via Server-Sent Events em GET /jobs/<id>/eventos.
+
+Os workers podem rodar dentro do processo web (JOBS_WORKERS) ou em um
+processo separado, com quantidade própria, compartilhando o mesmo arquivo:
+
+    JOBS_WORKERS=0 (no servidor web)
+    python fila_jobs.py --workers 4
+
+Jobs que ficaram em processamento por mais que o prazo (ex.: worker
+encerrado no meio) voltam a ser executados.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+PENDENTE = 'pendente'
+PROCESSANDO = 'processando'
+CONCLUIDO = 'concluido'
+ERRO = 'erro'
+
+
+class FilaJobs:
+    """Jobs persistidos em SQLite e executados por um pool de threads"""
+
+    def __init__(self, caminho, processar, prazo_processamento=1800, retencao=24 * 3600,
+                 intervalo_consulta=1.0):
+        """
+        `processar(dados)` recebe o dicionário enviado em enfileirar() e
+        retorna (resultado, veio_do_cache).
+        """
+        self.caminho = str(caminho)
+        self.processar = processar
+        self.prazo_processamento = prazo_processamento
+        self.retencao = retencao
+        self.intervalo_consulta = intervalo_consulta
+        self._local = threading.local()
+        self._novo_job = threading.Event()
+        self._parar = threading.Event()
+        self._workers = []
+        self._lock = threading.Lock()
+        self.executados = 0
+        self.falhas = 0
+
+        conn = self._conexao()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                dados TEXT NOT NULL,
+                status TEXT NOT NULL,
+                resultado TEXT,
+                erro TEXT,
+                cache INTEGER,
+                criado_em REAL NOT NULL,
+                iniciado_em REAL,
+                concluido_em REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, criado_em)")
+
+    def enfileirar(self, dados):
+        """Grava um job pendente e retorna seu id"""
+        job_id = uuid.uuid4().hex
+        agora = time.time()
+        conn = self._conexao()
+        conn.execute(
+            "INSERT INTO jobs (id, dados, status, criado_em) VALUES (?, ?, ?, ?)",
+            (job_id, json.dumps(dados, ensure_ascii=False), PENDENTE, agora),
+        )
+        # Jobs concluídos antigos deixam de ser consultáveis
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND concluido_em < ?",
+            (CONCLUIDO, ERRO, agora - self.retencao),
+        )
+        self._novo_job.set()
+        return job_id
+
+    def obter(self, job_id):
+        """Situação do job (dicionário) ou None se ele não existir"""
+        linha = self._conexao().execute(
+            "SELECT status, resultado, erro, cache, criado_em, iniciado_em, concluido_em "
+            "FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if linha is None:
+            return None
+
+        status, resultado, erro, cache, criado_em, iniciado_em, concluido_em = linha
+        job = {'job_id': job_id, 'status': status, 'criado_em': criado_em}
+        if status == PENDENTE:
+            job['posicao'] = self._conexao().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND criado_em <= ?", (PENDENTE, criado_em)
+            ).fetchone()[0]
+        if iniciado_em is not None:
+            job['iniciado_em'] = iniciado_em
+        if status == CONCLUIDO:
+            job.update(resultado=json.loads(resultado), cache=bool(cache), concluido_em=concluido_em)
+        elif status == ERRO:
+            job.update(erro=erro, concluido_em=concluido_em)
+        return job
+
+    def reivindicar(self):
+        """
+        Marca como em processamento o job pendente mais antigo (ou um job
+        abandonado além do prazo) e retorna (id, dados), ou None se não houver.
+        """
+        conn = self._conexao()
+        agora = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            linha = conn.execute(
+                "SELECT id, dados FROM jobs WHERE status = ? OR (status = ? AND iniciado_em < ?) "
+                "ORDER BY criado_em LIMIT 1",
+                (PENDENTE, PROCESSANDO, agora - self.prazo_processamento),
+            ).fetchone()
+            if linha is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, iniciado_em = ? WHERE id = ?",
+                    (PROCESSANDO, agora, linha[0]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return None if linha is None else (linha[0], json.loads(linha[1]))
+
+    def executar_proximo(self):
+        """Executa um job pendente, se houver. Retorna True se executou algum"""
+        reivindicado = self.reivindicar()
+        if reivindicado is None:
+            return False
+
+        job_id, dados = reivindicado
+        try:
+            resultado, em_cache = self.processar(dados)
+        except Exception as e:
+            self._finalizar(job_id, ERRO, erro=str(e))
+            with self._lock:
+                self.falhas += 1
+        else:
+            self._finalizar(
+                job_id, CONCLUIDO, resultado=json.dumps(resultado, ensure_ascii=False), cache=int(bool(em_cache))
+            )
+            with self._lock:
+                self.executados += 1
+        return True
+
+    def iniciar_workers(self, quantidade):
+        """Inicia `quantidade` threads de worker (daemon)"""
+        for i in range(quantidade):
+            worker = threading.Thread(target=self._loop_worker, name=f'job-{i + 1}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def parar(self, timeout=None):
+        """Sinaliza o fim dos workers e aguarda o término dos jobs em andamento"""
+        self._parar.set()
+        self._novo_job.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def estatisticas(self):
+        contagens = dict(self._conexao().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ).fetchall())
+        with self._lock:
+            return {
+                'workers': len(self._workers),
+                'pendentes': contagens.get(PENDENTE, 0),
+                'processando': contagens.get(PROCESSANDO, 0),
+                'executados': self.executados,
+                'falhas': self.falhas,
+            }
+
+    def _loop_worker(self):
+        while not self._parar.is_set():
+            try:
+                if self.executar_proximo():
+                    continue
+            except Exception as e:
+                print(f"AVISO: erro no worker de jobs: {str(e)}")
+            # Sem jobs: aguarda um novo enfileiramento (ou consulta periódica, para
+            # jobs enfileirados por outros processos)
+            self._novo_job.wait(self.intervalo_consulta)
+            self._novo_job.clear()
+
+    def _finalizar(self, job_id, status, resultado=None, erro=None, cache=None):
+        self._conexao().execute(
+            "UPDATE jobs SET status = ?, resultado = ?, erro = ?, cache = ?, concluido_em = ? WHERE id = ?",
+            (status, resultado, erro, cache, time.time(), job_id),
+        )
+
+    def _conexao(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: autocommit, com transação explícita ao reivindicar
+            conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Executa os workers da fila de jobs fora do servidor web')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('JOBS_WORKERS', '2')) or 2,
+                        help='Quantidade de workers')
+    args = parser.parse_args(argv)
+
+    # Os workers deste processo são iniciados aqui, não na importação da aplicação
+    os.environ['JOBS_WORKERS'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_modulo
+
+    app_modulo.fila_jobs.iniciar_workers(args.workers)
+    print(f"{args.workers} workers processando {app_modulo.fila_jobs.caminho} (Ctrl+C para encerrar)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("Encerrando após os jobs em andamento...")
+        app_modulo.fila_jobs.parar()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,7 +24,10 @@ os.environ['FLASK_ENV'] = 'production'
 # são carregadas automaticamente do arquivo .env pelo load_dotenv()
 
 # Importar a aplicação Flask (instância `app` definida em `app.py`)
-from app import app
+from app import app, iniciar_workers_jobs
+
+# Workers da fila de jobs no processo web (JOBS_WORKERS)
+iniciar_workers_jobs()
 
 # Compatibilidade: exponha `application` (WSGI) e `app` (uso local)
 application = app
@@ -0,0 +1,162 @@
+"""
+Limitador de taxa (token bucket) das chamadas ao modelo, com prioridades.
+
+O balde fica em SQLite, compartilhado pelas threads e pelos processos
+(workers do servidor, CLI de reprocessamento) que usam o mesmo arquivo, de
+modo que a cota da API é dividida entre todos.
+
+Há duas classes de prioridade: 'interativo' (usuários em /processar) e
+'lote' (lotes, catálogo, jobs). O lote só consome fichas enquanto o balde
+tiver mais que a reserva do interativo e, no mesmo processo, cede a vez
+enquanto houver chamadas interativas na fila. Sem ficha disponível a chamada
+aguarda na fila em vez de falhar com erro de limite de taxa.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from resiliencia import ModeloIndisponivel
+
+CLASSES = ('interativo', 'lote')
+
+
+class FilaEsgotada(ModeloIndisponivel):
+    """A chamada esperou na fila do limitador além do tempo máximo"""
+
+
+class LimitadorTaxa:
+    """Token bucket compartilhado (SQLite) com classes de prioridade"""
+
+    def __init__(self, caminho, por_minuto, rajada=None, reserva_interativo=0.25, nome='gemini'):
+        self.caminho = str(caminho)
+        self.nome = nome
+        self.taxa = por_minuto / 60.0
+        # Sem rajada configurada, o balde comporta 5 segundos de chamadas
+        self.capacidade = float(rajada or max(1.0, self.taxa * 5))
+        self.reserva = reserva_interativo * self.capacidade
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._fila = {classe: 0 for classe in CLASSES}
+        self._atendidas = {classe: 0 for classe in CLASSES}
+        self._recusadas = {classe: 0 for classe in CLASSES}
+
+        self._conexao().execute("""
+            CREATE TABLE IF NOT EXISTS baldes (
+                nome TEXT PRIMARY KEY,
+                fichas REAL NOT NULL,
+                atualizado_em REAL NOT NULL
+            )
+        """)
+
+    def adquirir(self, classe='interativo', espera_maxima=None):
+        """
+        Aguarda uma ficha para a classe e retorna o tempo de espera, em
+        segundos. Lança FilaEsgotada se a espera ultrapassar `espera_maxima`.
+        """
+        inicio = time.monotonic()
+        with self._na_fila(classe):
+            while True:
+                espera = self._tentar(classe)
+                if not espera:
+                    return self._atender(classe, inicio)
+                self._verificar_espera(classe, inicio, espera, espera_maxima)
+                time.sleep(espera)
+
+    async def adquirir_async(self, classe='interativo', espera_maxima=None):
+        """Versão assíncrona de adquirir"""
+        inicio = time.monotonic()
+        with self._na_fila(classe):
+            while True:
+                espera = await asyncio.to_thread(self._tentar, classe)
+                if not espera:
+                    return self._atender(classe, inicio)
+                self._verificar_espera(classe, inicio, espera, espera_maxima)
+                await asyncio.sleep(espera)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'por_minuto': round(self.taxa * 60, 3),
+                'capacidade': self.capacidade,
+                'fila': dict(self._fila),
+                'atendidas': dict(self._atendidas),
+                'recusadas': dict(self._recusadas),
+            }
+
+    def _tentar(self, classe):
+        """
+        Tenta retirar uma ficha do balde. Retorna 0 em caso de sucesso ou o
+        tempo estimado até haver ficha para a classe.
+        """
+        if classe == 'lote':
+            with self._lock:
+                interativos_na_fila = self._fila['interativo']
+            if interativos_na_fila:
+                return 1 / self.taxa if self.taxa else 1.0
+
+        minimo = 1.0 + (self.reserva if classe == 'lote' else 0.0)
+        conn = self._conexao()
+        agora = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            linha = conn.execute(
+                "SELECT fichas, atualizado_em FROM baldes WHERE nome = ?", (self.nome,)
+            ).fetchone()
+            fichas = self.capacidade if linha is None else min(
+                self.capacidade, linha[0] + max(0.0, agora - linha[1]) * self.taxa
+            )
+
+            espera = 0.0
+            if fichas >= minimo:
+                fichas -= 1.0
+            else:
+                espera = (minimo - fichas) / self.taxa if self.taxa else 1.0
+
+            conn.execute(
+                "INSERT OR REPLACE INTO baldes (nome, fichas, atualizado_em) VALUES (?, ?, ?)",
+                (self.nome, fichas, agora),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return espera
+
+    def _verificar_espera(self, classe, inicio, espera, espera_maxima):
+        decorrido = time.monotonic() - inicio
+        if espera_maxima is not None and decorrido + espera > espera_maxima:
+            with self._lock:
+                self._recusadas[classe] += 1
+            raise FilaEsgotada(
+                f"Limite de chamadas ao modelo atingido: a fila ({classe}) excederia {espera_maxima:g}s de espera",
+                repetir_apos=max(1, round(espera)),
+            )
+
+    def _atender(self, classe, inicio):
+        with self._lock:
+            self._atendidas[classe] += 1
+        return time.monotonic() - inicio
+
+    @contextmanager
+    def _na_fila(self, classe):
+        if classe not in self._fila:
+            raise ValueError(f"Classe de prioridade desconhecida: {classe}")
+        with self._lock:
+            self._fila[classe] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._fila[classe] -= 1
+
+    def _conexao(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: transações controladas explicitamente (BEGIN IMMEDIATE)
+            conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,192 @@
+"""
+Métricas da aplicação no formato de texto do Prometheus.
+
+Implementação mínima (sem dependências) de contadores, gauges e histogramas
+com rótulos, mais um registro que gera o texto exposto em /metrics.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatar_rotulos(nomes, valores, extra=None):
+    pares = list(zip(nomes, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+
+def _formatar_numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class _Metrica:
+    tipo = ''
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos):
+        return tuple(str(rotulos.get(r, '')) for r in self.rotulos)
+
+    def linhas(self):
+        yield f'# HELP {self.nome} {self.ajuda}'
+        yield f'# TYPE {self.nome} {self.tipo}'
+        with self._lock:
+            itens = sorted(self._valores.items())
+        for chave, valor in itens:
+            yield from self._linhas_valor(chave, valor)
+
+    def _linhas_valor(self, chave, valor):
+        yield f'{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(valor)}'
+
+
+class Contador(_Metrica):
+    """Valor que só aumenta"""
+
+    tipo = 'counter'
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos):
+        with self._lock:
+            return self._valores.get(self._chave(rotulos), 0)
+
+
+class Gauge(_Metrica):
+    """Valor que sobe e desce (ex.: requisições em andamento)"""
+
+    tipo = 'gauge'
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def dec(self, valor=1, **rotulos):
+        self.inc(-valor, **rotulos)
+
+    def definir(self, valor, **rotulos):
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+    def valor(self, **rotulos):
+        with self._lock:
+            return self._valores.get(self._chave(rotulos), 0)
+
+    @contextmanager
+    def em_andamento(self, **rotulos):
+        """Incrementa durante a execução do bloco"""
+        self.inc(**rotulos)
+        try:
+            yield
+        finally:
+            self.dec(**rotulos)
+
+
+class Histograma(_Metrica):
+    """Distribuição de valores (ex.: latências) em buckets cumulativos"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            estado = self._valores.get(chave)
+            if estado is None:
+                estado = self._valores[chave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    estado[0][i] += 1
+            estado[1] += valor
+            estado[2] += 1
+
+    def contagem(self, **rotulos):
+        with self._lock:
+            estado = self._valores.get(self._chave(rotulos))
+            return estado[2] if estado else 0
+
+    @contextmanager
+    def medir(self, **rotulos):
+        """Observa a duração do bloco, em segundos"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def _linhas_valor(self, chave, valor):
+        contagens, soma, total = valor
+        for limite, contagem in zip(self.buckets, contagens):
+            rotulos = _formatar_rotulos(self.rotulos, chave, ('le', _formatar_numero(limite)))
+            yield f'{self.nome}_bucket{rotulos} {contagem}'
+        rotulos = _formatar_rotulos(self.rotulos, chave)
+        yield f'{self.nome}_sum{rotulos} {_formatar_numero(soma)}'
+        yield f'{self.nome}_count{rotulos} {total}'
+
+
+class RegistroMetricas:
+    """Conjunto de métricas expostas em /metrics"""
+
+    def __init__(self):
+        self._metricas = []
+        self._coletores = []
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._adicionar(Contador(nome, ajuda, rotulos))
+
+    def gauge(self, nome, ajuda, rotulos=()):
+        return self._adicionar(Gauge(nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        return self._adicionar(Histograma(nome, ajuda, rotulos, buckets))
+
+    def registrar_coletor(self, coletor):
+        """
+        Registra uma função chamada a cada exportação, que retorna uma lista
+        de (nome, tipo, ajuda, [(rotulos_dict, valor), ...]). Útil para expor
+        contadores mantidos por outros componentes (caches, filas).
+        """
+        self._coletores.append(coletor)
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus"""
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.linhas())
+        for coletor in self._coletores:
+            for nome, tipo, ajuda, amostras in coletor():
+                linhas.append(f'# HELP {nome} {ajuda}')
+                linhas.append(f'# TYPE {nome} {tipo}')
+                for rotulos, valor in amostras:
+                    rotulos_txt = _formatar_rotulos(tuple(rotulos), tuple(rotulos.values()))
+                    linhas.append(f'{nome}{rotulos_txt} {_formatar_numero(valor)}')
+        return '\n'.join(linhas) + '\n'
+
+    def _adicionar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
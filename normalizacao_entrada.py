@@ -0,0 +1,179 @@
+"""
+Normalização do texto de entrada antes da montagem do prompt.
+
+Textos colados do portal antigo costumam trazer restos de HTML, sequências
+enormes de espaços e parágrafos repetidos (cabeçalhos, avisos padrão), que
+só aumentam o prompt. A normalização é determinística:
+
+1. remove marcação HTML (tags, comentários, scripts/estilos) e decodifica
+   entidades, preservando quebras de parágrafo e itens de lista. Só nomes de
+   tags HTML conhecidos são removidos: autolinks (<https://...>) e marcadores
+   como <RG> ou <CPF> são conteúdo e ficam no texto;
+2. colapsa espaços e linhas em branco repetidas, mantendo a estrutura de
+   linhas e parágrafos;
+3. descarta parágrafos idênticos a um parágrafo anterior, mantendo a
+   primeira ocorrência. Opcionalmente, também os quase idênticos (semelhança
+   de Jaccard entre trigramas de palavras), mas nunca quando os números
+   diferem: valores, prazos e endereços costumam variar só em um número, e
+   essa diferença é informação. Parágrafos curtos (títulos, itens) nunca
+   são descartados, pois podem se repetir legitimamente em seções diferentes.
+"""
+
+import html
+import re
+from dataclasses import dataclass
+
+from orcamento_tokens import estimar_tokens
+
+_NOMES_TAGS = (
+    'a', 'abbr', 'address', 'article', 'aside', 'b', 'blockquote', 'body', 'br', 'button', 'caption',
+    'center', 'cite', 'code', 'col', 'colgroup', 'dd', 'del', 'details', 'div', 'dl', 'dt', 'em',
+    'figcaption', 'figure', 'font', 'footer', 'form', 'h[1-6]', 'head', 'header', 'hr', 'html', 'i',
+    'iframe', 'img', 'input', 'ins', 'label', 'li', 'link', 'main', 'mark', 'meta', 'nav', 'noscript',
+    'ol', 'option', 'p', 'picture', 'pre', 'q', 's', 'script', 'section', 'select', 'small', 'source',
+    'span', 'strike', 'strong', 'style', 'sub', 'summary', 'sup', 'svg', 'table', 'tbody', 'td',
+    'template', 'textarea', 'tfoot', 'th', 'thead', 'time', 'title', 'tr', 'u', 'ul', 'wbr',
+)
+_TAG = re.compile(r'</?(?:%s)(?=[\s/>])[^<>]*>' % '|'.join(_NOMES_TAGS), re.IGNORECASE)
+_BLOCOS_IGNORADOS = re.compile(r'<(script|style)\b[^>]*>.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_COMENTARIO = re.compile(r'<!--.*?-->', re.DOTALL)
+_QUEBRA_LINHA = re.compile(r'<br\s*/?>', re.IGNORECASE)
+_FIM_BLOCO = re.compile(r'</(p|div|h[1-6]|ul|ol|table|tr|section|article|blockquote)\s*>', re.IGNORECASE)
+_ITEM_LISTA = re.compile(r'<li\b[^>]*>', re.IGNORECASE)
+_ESPACOS = re.compile(r'[ \t\f\v\u00a0\u2000-\u200a\u202f\u205f\u3000]+')
+_INVISIVEIS = re.compile(r'[\u200b-\u200d\u2060\ufeff]')
+_PARAGRAFOS = re.compile(r'\n\s*\n')
+_PALAVRAS = re.compile(r'\w+')
+_NUMEROS = re.compile(r'\d+(?:[.,]\d+)*')
+
+
+@dataclass(frozen=True)
+class EntradaNormalizada:
+    """Texto normalizado e o que foi removido dele"""
+    texto: str
+    caracteres_originais: int
+    tokens_originais: int
+    paragrafos_duplicados: int
+    paragrafos_semelhantes: int
+    html_removido: bool
+
+    @property
+    def caracteres_removidos(self):
+        return self.caracteres_originais - len(self.texto)
+
+    @property
+    def tokens_economizados(self):
+        return max(0, self.tokens_originais - estimar_tokens(self.texto))
+
+    def relatorio(self):
+        """Resumo para a resposta da API"""
+        return {
+            'caracteres_originais': self.caracteres_originais,
+            'caracteres_removidos': self.caracteres_removidos,
+            'tokens_economizados': self.tokens_economizados,
+            'paragrafos_duplicados': self.paragrafos_duplicados,
+            'paragrafos_semelhantes': self.paragrafos_semelhantes,
+            'html_removido': self.html_removido,
+        }
+
+
+def remover_html(texto):
+    """Converte HTML em texto simples, mantendo parágrafos e itens de lista"""
+    texto = _BLOCOS_IGNORADOS.sub('', texto)
+    texto = _COMENTARIO.sub('', texto)
+    texto = _QUEBRA_LINHA.sub('\n', texto)
+    texto = _FIM_BLOCO.sub('\n\n', texto)
+    texto = _ITEM_LISTA.sub('\n- ', texto)
+    texto = _TAG.sub('', texto)
+    return html.unescape(texto)
+
+
+def colapsar_espacos(texto):
+    """
+    Colapsa espaços dentro das linhas e linhas em branco repetidas. O recuo
+    inicial (listas aninhadas) é mantido, limitado a 8 espaços.
+    """
+    texto = _INVISIVEIS.sub('', texto.replace('\r\n', '\n').replace('\r', '\n'))
+    linhas = []
+    for linha in texto.split('\n'):
+        conteudo = linha.lstrip()
+        recuo = min(len(linha[:len(linha) - len(conteudo)].replace('\t', '    ')), 8)
+        conteudo = _ESPACOS.sub(' ', conteudo).rstrip()
+        linhas.append(' ' * recuo + conteudo if conteudo else '')
+    return _PARAGRAFOS.sub('\n\n', '\n'.join(linhas)).strip()
+
+
+def _trigramas(paragrafo):
+    palavras = _PALAVRAS.findall(paragrafo.lower())
+    if len(palavras) < 3:
+        return frozenset([tuple(palavras)])
+    return frozenset(zip(palavras, palavras[1:], palavras[2:]))
+
+
+def normalizar_entrada(texto, limiar_semelhanca=1.0, min_caracteres_dedup=40):
+    """
+    Normaliza o texto de entrada e retorna EntradaNormalizada.
+    `limiar_semelhanca` (0 a 1; 1, o padrão, desativa os quase duplicados)
+    é a semelhança a partir da qual um parágrafo é considerado repetição;
+    parágrafos com números diferentes nunca são repetição um do outro.
+
+    Autolinks e marcadores entre < > não são tratados como HTML
+    (verificável com `python -m doctest normalizacao_entrada.py`):
+
+    >>> normalizar_entrada('Solicite em <https://carioca.rio/servicos/poda> ou pelo 1746.').texto
+    'Solicite em <https://carioca.rio/servicos/poda> ou pelo 1746.'
+    >>> normalizar_entrada('Documentos: <RG> e <CPF> do requerente.').texto
+    'Documentos: <RG> e <CPF> do requerente.'
+    >>> normalizar_entrada('<p>Documentos: <RG> e <CPF>, no <a href="/x">portal</a>.</p>').texto
+    'Documentos: <RG> e <CPF>, no portal.'
+    """
+    original, tokens_originais = len(texto), estimar_tokens(texto)
+    tem_html = bool(_TAG.search(texto) or _COMENTARIO.search(texto))
+    if tem_html:
+        texto = remover_html(texto)
+    texto = colapsar_espacos(texto)
+
+    mantidos = []
+    vistos = set()
+    assinaturas = []
+    duplicados = semelhantes = 0
+    for paragrafo in texto.split('\n\n'):
+        if len(paragrafo) < min_caracteres_dedup:
+            mantidos.append(paragrafo)
+            continue
+
+        chave = ' '.join(_PALAVRAS.findall(paragrafo.lower()))
+        if chave in vistos:
+            duplicados += 1
+            continue
+
+        if limiar_semelhanca < 1:
+            assinatura = (tuple(_NUMEROS.findall(paragrafo)), _trigramas(paragrafo))
+            if any(_semelhante(assinatura, outra, limiar_semelhanca) for outra in assinaturas):
+                semelhantes += 1
+                continue
+            assinaturas.append(assinatura)
+
+        vistos.add(chave)
+        mantidos.append(paragrafo)
+
+    return EntradaNormalizada(
+        texto='\n\n'.join(mantidos),
+        caracteres_originais=original,
+        tokens_originais=tokens_originais,
+        paragrafos_duplicados=duplicados,
+        paragrafos_semelhantes=semelhantes,
+        html_removido=tem_html,
+    )
+
+
+def _semelhante(assinatura_a, assinatura_b, limiar):
+    (numeros_a, a), (numeros_b, b) = assinatura_a, assinatura_b
+    # Números diferentes (taxa, prazo, endereço) são informação, não repetição
+    if numeros_a != numeros_b:
+        return False
+    # Jaccard >= limiar exige tamanhos próximos: descarta a comparação antes da interseção
+    menor, maior = sorted((len(a), len(b)))
+    if not maior or menor / maior < limiar:
+        return False
+    return len(a & b) / len(a | b) >= limiar
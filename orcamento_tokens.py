@@ -0,0 +1,47 @@
+"""
+Estimativa de tokens e orçamento de contexto por tipo de prompt.
+
+A estimativa é feita antes da chamada ao modelo, para que entradas grandes
+demais sejam recusadas (ou divididas) sem gastar uma ida à API.
+"""
+
+import os
+
+# Proporção média de caracteres por token para texto em português
+CARACTERES_POR_TOKEN = float(os.getenv('CARACTERES_POR_TOKEN', '4'))
+
+
+def estimar_tokens(texto):
+    """Estimativa de tokens a partir do tamanho do texto"""
+    return max(1, int(len(texto or '') / CARACTERES_POR_TOKEN))
+
+
+class OrcamentoExcedido(Exception):
+    """O prompt estimado ultrapassa o orçamento de tokens do tipo"""
+
+    def __init__(self, tipo, tokens, limite):
+        super().__init__(
+            f"Texto de entrada muito grande para o tipo '{tipo}': "
+            f"~{tokens} tokens estimados no prompt (limite: {limite})"
+        )
+        self.tipo = tipo
+        self.tokens = tokens
+        self.limite = limite
+
+
+class OrcamentoTokens:
+    """Limite de tokens do prompt por tipo"""
+
+    def __init__(self, limites, limite_padrao):
+        self.limites = dict(limites)
+        self.limite_padrao = limite_padrao
+
+    def limite(self, tipo):
+        return self.limites.get(tipo, self.limite_padrao)
+
+    def verificar(self, tipo, tokens):
+        """Lança OrcamentoExcedido se `tokens` ultrapassar o limite do tipo"""
+        limite = self.limite(tipo)
+        if limite and tokens > limite:
+            raise OrcamentoExcedido(tipo, tokens, limite)
+        return tokens
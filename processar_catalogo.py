@@ -0,0 +1,160 @@
+"""
+Reprocessamento offline do catálogo de serviços, sem passar pelo Flask.
+
+Lê um arquivo JSONL ou CSV (campos `id`, `tipo`, `texto`) como fluxo,
+processa os registros com um pool de workers reutilizando o mesmo pipeline
+de /processar (criar_prompt + processar_com_gemini) e grava os resultados
+incrementalmente em um JSONL de saída, na ordem da entrada.
+
+Linhas do JSONL que não podem ser decodificadas viram uma falha na saída
+({id: null, sucesso: false, erro}) em vez de interromper o processamento.
+
+O progresso é salvo em um arquivo de checkpoint; se o processo for
+interrompido, basta executar o mesmo comando novamente para continuar de onde
+parou.
+
+Uso:
+    python processar_catalogo.py catalogo.jsonl saida.jsonl --workers 8
+    python processar_catalogo.py catalogo.csv saida.jsonl --tipo informacao
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+
+import app
+
+
+@dataclass(frozen=True)
+class LinhaInvalida:
+    """Linha do JSONL que não pôde ser decodificada"""
+    numero: int
+    erro: str
+
+
+def ler_registros(caminho, formato):
+    """
+    Gera os registros do arquivo de entrada um a um. Linhas de JSONL
+    inválidas são geradas como LinhaInvalida, para que ocupem sua posição
+    na saída e no checkpoint.
+    """
+    with open(caminho, 'r', encoding='utf-8', newline='') as f:
+        if formato == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for numero, linha in enumerate(f, 1):
+                linha = linha.strip()
+                if not linha:
+                    continue
+                try:
+                    registro = json.loads(linha)
+                except json.JSONDecodeError as e:
+                    registro = LinhaInvalida(numero, str(e))
+                yield registro
+
+
+def carregar_checkpoint(caminho):
+    """Lê o checkpoint ({processados, bytes_saida}) ou retorna o estado inicial"""
+    if not os.path.exists(caminho):
+        return {'processados': 0, 'bytes_saida': 0}
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def salvar_checkpoint(caminho, processados, bytes_saida):
+    """Grava o checkpoint de forma atômica"""
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump({'processados': processados, 'bytes_saida': bytes_saida}, f)
+    os.replace(temporario, caminho)
+
+
+def processar_registro(registro, tipo_padrao):
+    """Processa um registro do catálogo no mesmo formato de /processar/lote"""
+    if isinstance(registro, LinhaInvalida):
+        return {
+            'id': None,
+            'sucesso': False,
+            'erro': f'Linha {registro.numero} não é um JSON válido: {registro.erro}'
+        }
+    if isinstance(registro, dict) and not registro.get('tipo'):
+        registro = {**registro, 'tipo': tipo_padrao}
+    return app.processar_item_lote(registro)
+
+
+def processar_catalogo(entrada, saida, formato, workers, tipo_padrao, checkpoint):
+    """
+    Processa o catálogo mantendo no máximo `2 * workers` registros em memória.
+    Retorna a tupla (processados, falhas) desta execução.
+    """
+    estado = carregar_checkpoint(checkpoint)
+    if not os.path.exists(saida):
+        estado = {'processados': 0, 'bytes_saida': 0}
+    ja_processados = estado['processados']
+
+    # Descarta qualquer linha gravada depois do último checkpoint
+    with open(saida, 'r+b' if os.path.exists(saida) else 'wb') as arquivo_saida:
+        arquivo_saida.truncate(estado['bytes_saida'])
+        arquivo_saida.seek(estado['bytes_saida'])
+
+        registros = islice(ler_registros(entrada, formato), ja_processados, None)
+        processados = falhas = 0
+        pendentes = deque()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def gravar_proximo():
+                nonlocal processados, falhas
+                resultado = pendentes.popleft().result()
+                linha = json.dumps(resultado, ensure_ascii=False) + '\n'
+                arquivo_saida.write(linha.encode('utf-8'))
+                arquivo_saida.flush()
+                os.fsync(arquivo_saida.fileno())
+
+                processados += 1
+                if not resultado['sucesso']:
+                    falhas += 1
+                salvar_checkpoint(checkpoint, ja_processados + processados, arquivo_saida.tell())
+
+            for registro in registros:
+                pendentes.append(executor.submit(processar_registro, registro, tipo_padrao))
+                if len(pendentes) >= 2 * workers:
+                    gravar_proximo()
+
+            while pendentes:
+                gravar_proximo()
+
+    return processados, falhas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reprocessa o catálogo de serviços com o Gemini')
+    parser.add_argument('entrada', help='Arquivo JSONL ou CSV com os campos id, tipo e texto')
+    parser.add_argument('saida', help='Arquivo JSONL de saída (um resultado por linha)')
+    parser.add_argument('--formato', choices=['jsonl', 'csv'],
+                        help='Formato da entrada (padrão: pela extensão do arquivo)')
+    parser.add_argument('--workers', type=int, default=app.LOTE_MAX_CONCORRENCIA,
+                        help='Quantidade de registros processados em paralelo')
+    parser.add_argument('--tipo', default='servico', choices=['servico', 'informacao'],
+                        help='Tipo usado quando o registro não informa o seu')
+    parser.add_argument('--checkpoint',
+                        help='Arquivo de checkpoint (padrão: <saida>.checkpoint)')
+    args = parser.parse_args(argv)
+
+    formato = args.formato or ('csv' if args.entrada.lower().endswith('.csv') else 'jsonl')
+    checkpoint = args.checkpoint or f'{args.saida}.checkpoint'
+
+    processados, falhas = processar_catalogo(
+        args.entrada, args.saida, formato, args.workers, args.tipo, checkpoint
+    )
+    print(f"Processados: {processados} | Falhas: {falhas} | Saída: {args.saida}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Registro em memória dos templates de prompt (prompts/*.md).
+
+Os arquivos são lidos uma única vez na inicialização e só voltam a ser lidos
+do disco quando o mtime ou o tamanho do arquivo mudam.
+"""
+
+import hashlib
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(frozen=True)
+class TemplatePrompt:
+    """Conteúdo de um template junto com a assinatura do arquivo lido"""
+    conteudo: str
+    mtime_ns: int
+    tamanho: int
+    hash: str
+
+
+class RegistroPrompts:
+    """
+    Mantém os templates de prompt em memória.
+
+    A cada consulta apenas o `stat` do arquivo é verificado; o conteúdo só é
+    relido quando mtime ou tamanho diferem da versão em memória.
+    """
+
+    def __init__(self, diretorio):
+        self.diretorio = Path(diretorio)
+        self._templates = {}
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def carregar_todos(self):
+        """Carrega todos os arquivos .md do diretório de prompts"""
+        for arquivo in sorted(self.diretorio.glob('*.md')):
+            self._ler(arquivo.stem, arquivo, arquivo.stat())
+
+    def obter(self, tipo):
+        """Retorna o template do tipo, relendo o arquivo apenas se ele mudou"""
+        return self.obter_template(tipo).conteudo
+
+    def obter_template(self, tipo):
+        """Retorna o TemplatePrompt do tipo, relendo o arquivo apenas se ele mudou"""
+        arquivo = self._caminho(tipo)
+        try:
+            stat = arquivo.stat()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Arquivo de prompt não encontrado: {arquivo}")
+
+        with self._lock:
+            template = self._templates.get(tipo)
+            if (template is not None
+                    and template.mtime_ns == stat.st_mtime_ns
+                    and template.tamanho == stat.st_size):
+                self.acertos += 1
+                return template
+            self.falhas += 1
+
+        return self._ler(tipo, arquivo, stat)
+
+    def hash(self, tipo):
+        """Hash SHA-256 do conteúdo atual do template"""
+        return self.obter_template(tipo).hash
+
+    def limpar(self):
+        """Descarta os templates em memória e zera os contadores"""
+        with self._lock:
+            self._templates.clear()
+            self.acertos = 0
+            self.falhas = 0
+
+    def estatisticas(self):
+        """Contadores de acerto/falha e tipos carregados"""
+        with self._lock:
+            return {
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'tipos': sorted(self._templates),
+            }
+
+    def _caminho(self, tipo):
+        # Impede que o tipo vindo da requisição aponte para fora de prompts/
+        if not tipo or Path(tipo).name != tipo:
+            raise FileNotFoundError(f"Tipo de prompt inválido: {tipo}")
+        return self.diretorio / f'{tipo}.md'
+
+    def _ler(self, tipo, arquivo, stat):
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            conteudo = f.read().strip()
+
+        template = TemplatePrompt(
+            conteudo,
+            stat.st_mtime_ns,
+            stat.st_size,
+            hashlib.sha256(conteudo.encode('utf-8')).hexdigest(),
+        )
+        with self._lock:
+            self._templates[tipo] = template
+        return template
@@ -0,0 +1,177 @@
+"""
+Reparo e validação da resposta do modelo.
+
+Uma vírgula sobrando ou uma quebra de linha sem escape bastam para o JSON
+gerado não ser decodificado, e refazer a chamada custa segundos. Antes disso
+a resposta passa por um reparo local, em uma única passada sobre o texto:
+
+- vírgulas antes de `}` ou `]` são removidas;
+- quebras de linha, tabulações e outros caracteres de controle dentro de
+  strings são escapados;
+- chaves e colchetes que ficaram abertos no fim do texto são fechados.
+
+Se o texto terminou no meio de um valor (string aberta ou par incompleto), o
+conteúdo foi perdido e o reparo é recusado (RespostaInvalida): nesse caso só
+uma nova chamada recupera a resposta.
+
+Depois de decodificado, o resultado é validado contra os campos do tipo
+(todos strings): valores de outro tipo são convertidos e campos ausentes
+ficam vazios.
+"""
+
+import json
+
+# Nomes dos reparos, usados nas métricas
+VIRGULA_FINAL = 'virgula_final'
+CARACTERE_CONTROLE = 'caractere_controle'
+FECHAMENTO = 'fechamento'
+VALOR_TRUNCADO = 'valor_truncado'
+
+_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t', '\b': '\\b', '\f': '\\f'}
+_FECHAMENTOS = {'{': '}', '[': ']'}
+
+
+class RespostaInvalida(Exception):
+    """Resposta do modelo sem JSON aproveitável, nem depois do reparo local"""
+
+
+def reparar_json(texto):
+    """
+    Repara e decodifica o primeiro objeto JSON do texto. Retorna a tupla
+    (objeto, reparos), com os nomes dos reparos aplicados. Lança
+    json.JSONDecodeError se o texto não tiver conserto.
+    """
+    texto = texto or ''
+    inicio = texto.find('{')
+    if inicio == -1:
+        raise json.JSONDecodeError('Nenhum objeto JSON encontrado', texto, 0)
+
+    saida = []
+    pilha = []
+    reparos = set()
+    em_string = escape = fechado = False
+    # Último ponto (fora de strings) em que o texto até ali é um prefixo completo
+    corte = None
+
+    for caractere in texto[inicio:]:
+        if em_string:
+            if escape:
+                escape = False
+            elif caractere == '\\':
+                escape = True
+            elif caractere == '"':
+                em_string = False
+            elif caractere < ' ':
+                caractere = _ESCAPES.get(caractere) or f'\\u{ord(caractere):04x}'
+                reparos.add(CARACTERE_CONTROLE)
+            saida.append(caractere)
+            continue
+
+        if caractere == '"':
+            em_string = True
+        elif caractere in _FECHAMENTOS:
+            pilha.append(_FECHAMENTOS[caractere])
+        elif caractere in '}]':
+            if _remover_virgula_final(saida):
+                reparos.add(VIRGULA_FINAL)
+            # Fechamento trocado (`]` no lugar de `}`) usa o esperado
+            esperado = pilha.pop()
+            if esperado != caractere:
+                reparos.add(FECHAMENTO)
+            saida.append(esperado)
+            if not pilha:
+                fechado = True
+                break
+            continue
+        elif caractere == ',':
+            corte = (len(saida), list(pilha))
+        saida.append(caractere)
+
+    if fechado:
+        return _decodificar(''.join(saida), texto), sorted(reparos)
+
+    # Texto truncado: fecha o que ficou aberto
+    reparos.add(FECHAMENTO)
+    if not em_string:
+        completo = list(saida)
+        _remover_virgula_final(completo)
+        try:
+            return _decodificar(''.join(completo) + ''.join(reversed(pilha)), texto), sorted(reparos)
+        except json.JSONDecodeError:
+            pass
+
+    # Terminou no meio de um valor: volta à última vírgula, descartando o par incompleto
+    reparos.add(VALOR_TRUNCADO)
+    if corte is None:
+        raise json.JSONDecodeError('Objeto JSON truncado antes do primeiro campo', texto, len(texto))
+    posicao, pilha = corte
+    return _decodificar(''.join(saida[:posicao]) + ''.join(reversed(pilha)), texto), sorted(reparos)
+
+
+def _remover_virgula_final(saida):
+    """Remove a vírgula (e os espaços depois dela) do fim da saída; retorna se havia"""
+    posicao = len(saida)
+    while posicao and saida[posicao - 1].isspace():
+        posicao -= 1
+    if posicao and saida[posicao - 1] == ',':
+        del saida[posicao - 1:]
+        return True
+    return False
+
+
+def _decodificar(reparado, original):
+    objeto = json.loads(reparado)
+    if not isinstance(objeto, dict):
+        raise json.JSONDecodeError('Resposta não é um objeto JSON', original, 0)
+    return objeto
+
+
+def converter_valor(valor):
+    """
+    Converte um valor para o texto esperado nos campos: listas viram listas
+    Markdown, objetos viram linhas "chave: valor" e None vira ''.
+    """
+    if valor is None:
+        return ''
+    if isinstance(valor, str):
+        return valor
+    if isinstance(valor, bool):
+        return 'Sim' if valor else 'Não'
+    if isinstance(valor, list):
+        itens = (converter_valor(item) for item in valor)
+        return '\n'.join(f'- {item}' for item in itens if item)
+    if isinstance(valor, dict):
+        return '\n'.join(f'{chave}: {converter_valor(item)}' for chave, item in valor.items())
+    return str(valor)
+
+
+def validar_campos(resultado, campos):
+    """
+    Valida `resultado` (dict) contra os `campos`, todos strings: converte os
+    valores de outro tipo e preenche os ausentes com ''. Altera o dicionário
+    e retorna a lista de correções feitas ('ausente', 'nulo', 'lista', ...).
+    """
+    correcoes = []
+    for campo in campos:
+        if campo not in resultado:
+            resultado[campo] = ''
+            correcoes.append('ausente')
+            continue
+        valor = resultado[campo]
+        if isinstance(valor, str):
+            continue
+        correcoes.append(_nome_tipo(valor))
+        resultado[campo] = converter_valor(valor)
+    return correcoes
+
+
+def _nome_tipo(valor):
+    if valor is None:
+        return 'nulo'
+    if isinstance(valor, bool):
+        return 'booleano'
+    if isinstance(valor, list):
+        return 'lista'
+    if isinstance(valor, dict):
+        return 'objeto'
+    return 'numero'
@@ -0,0 +1,249 @@
+"""
+Retentativas, prazo e disjuntor (circuit breaker) das chamadas ao modelo.
+
+- Prazo: cada chamada (somando as retentativas) tem um tempo máximo; o
+  tempo restante é repassado ao backend como timeout da requisição.
+- Retentativas: erros transitórios (limite de taxa, 5xx, timeout) são
+  repetidos com espera exponencial e variação aleatória (full jitter).
+- Disjuntor: após falhas consecutivas o circuito abre e as chamadas falham
+  imediatamente, sem ocupar workers, até o fim do intervalo de abertura;
+  então uma chamada de teste decide se ele fecha ou volta a abrir.
+
+As falhas viram exceções ModeloIndisponivel com o status HTTP adequado
+(503 ou 504), em vez de um erro genérico.
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+# Códigos (HTTP) de erros transitórios, que valem nova tentativa
+CODIGOS_RETENTAVEIS = (408, 429, 500, 502, 503, 504)
+
+
+class ModeloIndisponivel(Exception):
+    """O modelo não respondeu a tempo ou está indisponível"""
+
+    status_http = 503
+
+    def __init__(self, mensagem, repetir_apos=None):
+        super().__init__(mensagem)
+        self.repetir_apos = repetir_apos
+
+
+class CircuitoAberto(ModeloIndisponivel):
+    """Chamada recusada sem tentativa: o disjuntor está aberto"""
+
+
+class TentativasEsgotadas(ModeloIndisponivel):
+    """Todas as tentativas falharam com erros transitórios"""
+
+
+class PrazoEsgotado(ModeloIndisponivel):
+    """A chamada (com as retentativas) ultrapassou o prazo"""
+
+    status_http = 504
+
+
+def codigo_erro(erro):
+    """Código HTTP associado ao erro do backend (None se desconhecido)"""
+    return getattr(erro, 'codigo', None)
+
+
+class Disjuntor:
+    """Disjuntor por falhas consecutivas (fechado -> aberto -> meio aberto)"""
+
+    FECHADO = 'fechado'
+    ABERTO = 'aberto'
+    MEIO_ABERTO = 'meio_aberto'
+
+    def __init__(self, limiar_falhas=5, tempo_aberto=30.0, relogio=time.monotonic):
+        self.limiar_falhas = limiar_falhas
+        self.tempo_aberto = tempo_aberto
+        self._relogio = relogio
+        self._estado = self.FECHADO
+        self._falhas = 0
+        self._aberto_em = 0.0
+        self._teste_em_andamento = False
+        self._lock = threading.Lock()
+        self.aberturas = 0
+        self.recusadas = 0
+
+    @property
+    def estado(self):
+        with self._lock:
+            return self._estado_atual()
+
+    def permitir(self):
+        """Lança CircuitoAberto se a chamada não puder ser feita agora"""
+        if not self.limiar_falhas:
+            return
+        with self._lock:
+            estado = self._estado_atual()
+            if estado == self.FECHADO:
+                return
+            if estado == self.MEIO_ABERTO and not self._teste_em_andamento:
+                # Apenas uma chamada de teste por vez
+                self._teste_em_andamento = True
+                return
+            self.recusadas += 1
+            restante = max(0.0, self._aberto_em + self.tempo_aberto - self._relogio())
+        raise CircuitoAberto(
+            f"Modelo temporariamente indisponível (circuito aberto após falhas consecutivas); "
+            f"tente novamente em {restante:.0f}s",
+            repetir_apos=max(1, round(restante)),
+        )
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self._estado = self.FECHADO
+            self._falhas = 0
+            self._teste_em_andamento = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas += 1
+            estado = self._estado_atual()
+            # Falha da chamada de teste reabre; no estado fechado, abre ao atingir o limiar
+            if estado == self.MEIO_ABERTO or (
+                    estado == self.FECHADO and self.limiar_falhas and self._falhas >= self.limiar_falhas):
+                self._estado = self.ABERTO
+                self._aberto_em = self._relogio()
+                self.aberturas += 1
+            self._teste_em_andamento = False
+
+    def liberar_teste(self):
+        """Libera a vaga da chamada de teste quando ela é interrompida sem resultado"""
+        with self._lock:
+            self._teste_em_andamento = False
+
+    def _estado_atual(self):
+        if self._estado == self.ABERTO and self._relogio() - self._aberto_em >= self.tempo_aberto:
+            return self.MEIO_ABERTO
+        return self._estado
+
+
+class Resiliencia:
+    """
+    Executa chamadas ao backend com prazo, retentativas e disjuntor.
+    A função chamada recebe o tempo restante (segundos) para usar como timeout.
+    """
+
+    def __init__(self, tentativas=3, espera_base=0.5, espera_maxima=8.0, prazo=60.0,
+                 disjuntor=None, codigos_retentaveis=CODIGOS_RETENTAVEIS, semente=None):
+        self.tentativas = max(1, tentativas)
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.prazo = prazo
+        self.disjuntor = disjuntor or Disjuntor()
+        self.codigos_retentaveis = tuple(codigos_retentaveis)
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+        self.retentativas = 0
+        self.prazos_esgotados = 0
+        self.tentativas_esgotadas = 0
+
+    def executar(self, funcao):
+        """Executa funcao(timeout) aplicando prazo, retentativas e disjuntor"""
+        inicio = time.monotonic()
+        for tentativa in range(1, self.tentativas + 1):
+            restante = self._restante(inicio)
+            self.disjuntor.permitir()
+            try:
+                resultado = funcao(restante)
+            except Exception as e:
+                espera = self._tratar_falha(e, tentativa, inicio)
+                time.sleep(espera)
+                continue
+            self.disjuntor.registrar_sucesso()
+            return resultado
+
+    async def executar_async(self, funcao):
+        """Versão assíncrona de executar; funcao(timeout) retorna uma corrotina"""
+        inicio = time.monotonic()
+        for tentativa in range(1, self.tentativas + 1):
+            restante = self._restante(inicio)
+            self.disjuntor.permitir()
+            try:
+                resultado = await asyncio.wait_for(funcao(restante), restante)
+            except asyncio.CancelledError:
+                self.disjuntor.liberar_teste()
+                raise
+            except Exception as e:
+                espera = self._tratar_falha(e, tentativa, inicio)
+                await asyncio.sleep(espera)
+                continue
+            self.disjuntor.registrar_sucesso()
+            return resultado
+
+    def retentavel(self, erro):
+        """Erros transitórios: códigos da lista e timeouts"""
+        return isinstance(erro, (TimeoutError, asyncio.TimeoutError)) or codigo_erro(erro) in self.codigos_retentaveis
+
+    def espera(self, tentativa):
+        """Espera antes da próxima tentativa: exponencial com full jitter"""
+        limite = min(self.espera_maxima, self.espera_base * (2 ** (tentativa - 1)))
+        return self._aleatorio.uniform(0, limite)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'circuito': self.disjuntor.estado,
+                'aberturas_circuito': self.disjuntor.aberturas,
+                'recusadas_circuito': self.disjuntor.recusadas,
+                'retentativas': self.retentativas,
+                'tentativas_esgotadas': self.tentativas_esgotadas,
+                'prazos_esgotados': self.prazos_esgotados,
+            }
+
+    def _restante(self, inicio):
+        if not self.prazo:
+            return None
+        restante = self.prazo - (time.monotonic() - inicio)
+        if restante <= 0:
+            with self._lock:
+                self.prazos_esgotados += 1
+            raise PrazoEsgotado(f"O modelo não respondeu dentro do prazo de {self.prazo:g}s")
+        return restante
+
+    def _tratar_falha(self, erro, tentativa, inicio):
+        """
+        Registra a falha e retorna a espera antes da próxima tentativa, ou
+        lança a exceção final (o erro original, se não for transitório).
+        """
+        if not self.retentavel(erro):
+            if codigo_erro(erro) is not None:
+                # Erros da requisição (4xx) não indicam problema de saúde do backend
+                self.disjuntor.registrar_sucesso()
+            else:
+                # Erro não classificado: não conta como sucesso; só libera a vaga de teste
+                self.disjuntor.liberar_teste()
+            raise erro
+
+        self.disjuntor.registrar_falha()
+        tempo_limite = isinstance(erro, (TimeoutError, asyncio.TimeoutError)) or codigo_erro(erro) in (408, 504)
+
+        if tentativa >= self.tentativas:
+            if tempo_limite:
+                with self._lock:
+                    self.prazos_esgotados += 1
+                raise PrazoEsgotado(f"O modelo não respondeu a tempo: {str(erro) or 'timeout'}") from erro
+            with self._lock:
+                self.tentativas_esgotadas += 1
+            raise TentativasEsgotadas(
+                f"Modelo indisponível após {self.tentativas} tentativas: {str(erro)}",
+                repetir_apos=max(1, round(self.espera_maxima)),
+            ) from erro
+
+        espera = self.espera(tentativa)
+        if self.prazo and time.monotonic() - inicio + espera >= self.prazo:
+            with self._lock:
+                self.prazos_esgotados += 1
+            raise PrazoEsgotado(
+                f"O modelo não respondeu dentro do prazo de {self.prazo:g}s: {str(erro) or 'timeout'}"
+            ) from erro
+
+        with self._lock:
+            self.retentativas += 1
+        return espera
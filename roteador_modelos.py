@@ -0,0 +1,148 @@
+"""
+Roteamento entre os modelos configurados.
+
+Para cada chamada o roteador devolve os modelos candidatos, em ordem:
+
+- Tamanho e tipo: entradas pequenas (até o limite de tokens do tipo) vão
+  primeiro para o modelo leve, mais rápido; as demais, para o principal.
+  O limite é por tipo, pois a saída de informacao (4 campos curtos) é bem
+  menor que a de servico (11 campos).
+- Saúde: com base na média móvel exponencial (EWMA) de latência e taxa de
+  erro observadas por modelo e tipo, um modelo com muitos erros ou com o
+  circuito aberto vai para o fim. O modelo leve também vai para o fim se
+  ficar muito mais lento que o principal, pois só é preferido por ser mais
+  rápido; o principal nunca é comparado ao leve (naturalmente mais rápido)
+  nem ao fallback, para que não perca o lugar apenas por ser mais lento.
+  Observações antigas expiram, para que o modelo volte a ser testado.
+- Fallback: o chamador tenta o próximo candidato quando o anterior está
+  indisponível; o modelo de fallback vem depois dos preferidos saudáveis.
+"""
+
+import threading
+import time
+
+
+class EstatisticaModelo:
+    """Médias móveis de latência e erro de um modelo em um tipo"""
+
+    __slots__ = ('latencia', 'erro', 'amostras', 'atualizado_em')
+
+    def __init__(self):
+        self.latencia = None
+        self.erro = 0.0
+        self.amostras = 0
+        self.atualizado_em = 0.0
+
+
+class RoteadorModelos:
+    """Escolhe a ordem dos modelos para cada chamada"""
+
+    def __init__(self, principal, leve=None, fallback=None, limites_leve=None, alfa=0.2,
+                 limiar_erro=0.5, fator_latencia=2.0, min_amostras=5, validade=120.0, disponivel=None):
+        """
+        `limites_leve`: {tipo: máximo de tokens do prompt para usar o modelo leve}.
+        `disponivel(modelo)`: opcional, False quando o circuito do modelo está aberto.
+        """
+        self.principal = principal
+        self.leve = leve if leve and leve != principal else None
+        self.fallback = fallback if fallback and fallback != principal else None
+        self.limites_leve = dict(limites_leve or {})
+        self.alfa = alfa
+        self.limiar_erro = limiar_erro
+        self.fator_latencia = fator_latencia
+        self.min_amostras = min_amostras
+        self.validade = validade
+        self.disponivel = disponivel
+        self._estatisticas = {}
+        self._lock = threading.Lock()
+        self.rebaixamentos = 0
+
+    @property
+    def modelos(self):
+        """Todos os modelos configurados"""
+        return [m for m in (self.principal, self.leve, self.fallback) if m]
+
+    def candidatos(self, tipo, tokens_prompt):
+        """Modelos a tentar, em ordem, para o tipo e o tamanho estimado do prompt"""
+        preferidos = [self.principal]
+        if self.leve and tokens_prompt <= self.limites_leve.get(tipo, 0):
+            preferidos.insert(0, self.leve)
+
+        saudaveis, rebaixados = [], []
+        for modelo in preferidos:
+            # Só o leve tem a latência comparada (ao principal)
+            alternativas = [self.principal] if modelo == self.leve else []
+            (saudaveis if self._saudavel(modelo, tipo, alternativas) else rebaixados).append(modelo)
+
+        # O fallback passa à frente dos preferidos rebaixados, se estiver saudável
+        if self.fallback:
+            if self._saudavel(self.fallback, tipo, []):
+                saudaveis.append(self.fallback)
+            else:
+                rebaixados.append(self.fallback)
+
+        # Conta só o principal: o leve sair da frente é roteamento por tamanho, não rebaixamento
+        if self.principal in rebaixados:
+            with self._lock:
+                self.rebaixamentos += 1
+        return saudaveis + rebaixados
+
+    def registrar(self, modelo, tipo, segundos, sucesso):
+        """Atualiza as médias do modelo com o resultado de uma chamada"""
+        with self._lock:
+            estatistica = self._estatisticas.setdefault((modelo, tipo), EstatisticaModelo())
+            if self._expirada(estatistica):
+                estatistica.__init__()
+            if sucesso:
+                estatistica.latencia = segundos if estatistica.latencia is None else (
+                    self.alfa * segundos + (1 - self.alfa) * estatistica.latencia
+                )
+            estatistica.erro = self.alfa * (0.0 if sucesso else 1.0) + (1 - self.alfa) * estatistica.erro
+            estatistica.amostras += 1
+            estatistica.atualizado_em = time.monotonic()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'principal': self.principal,
+                'leve': self.leve,
+                'fallback': self.fallback,
+                'rebaixamentos': self.rebaixamentos,
+                'modelos': {
+                    f'{modelo}/{tipo}': {
+                        'latencia_ms': round(e.latencia * 1000, 1) if e.latencia is not None else None,
+                        'taxa_erro': round(e.erro, 3),
+                        'amostras': e.amostras,
+                    }
+                    for (modelo, tipo), e in sorted(self._estatisticas.items())
+                    if not self._expirada(e)
+                },
+            }
+
+    def _saudavel(self, modelo, tipo, alternativas):
+        if self.disponivel is not None and not self.disponivel(modelo):
+            return False
+
+        with self._lock:
+            estatistica = self._valida(modelo, tipo)
+            if estatistica is None:
+                return True
+            if estatistica.erro > self.limiar_erro:
+                return False
+            if estatistica.latencia is None:
+                return True
+
+            # Muito mais lento que a alternativa mais rápida com dados recentes
+            outras = [self._valida(m, tipo) for m in alternativas]
+            latencias = [e.latencia for e in outras if e is not None and e.latencia is not None]
+            return not latencias or estatistica.latencia <= self.fator_latencia * min(latencias)
+
+    def _valida(self, modelo, tipo):
+        """Estatística com amostras suficientes e recentes (None caso contrário)"""
+        estatistica = self._estatisticas.get((modelo, tipo))
+        if estatistica is None or estatistica.amostras < self.min_amostras or self._expirada(estatistica):
+            return None
+        return estatistica
+
+    def _expirada(self, estatistica):
+        return time.monotonic() - estatistica.atualizado_em > self.validade
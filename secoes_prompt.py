@@ -0,0 +1,31 @@
+"""
+Divisão dos templates de prompt em seções por campo.
+
+Em prompts/servico.md as regras de cada campo ficam em uma seção iniciada
+por "### `nome_do_campo`" e vão até a seção do próximo campo; o que vem antes
+da primeira seção vale para todos os campos. Isso permite montar prompts só
+com as regras dos campos que serão gerados (ver compilador_prompts.py).
+"""
+
+import re
+
+# Título de seção de campo: ### `nome_do_campo`
+PADRAO_SECAO_CAMPO = re.compile(r'^###\s+`([a-z_]+)`\s*$', re.MULTILINE)
+
+
+def dividir_secoes(regras):
+    """
+    Divide o template em (regras gerais, {campo: seção}). Cada seção inclui
+    o próprio título. Template sem seções de campo retorna (regras, {}).
+    """
+    titulos = list(PADRAO_SECAO_CAMPO.finditer(regras))
+    if not titulos:
+        return regras, {}
+
+    gerais = regras[:titulos[0].start()].strip()
+    secoes = {}
+    for i, titulo in enumerate(titulos):
+        fim = titulos[i + 1].start() if i + 1 < len(titulos) else len(regras)
+        secoes[titulo.group(1)] = regras[titulo.start():fim].strip()
+    return gerais, secoes
+
@@ -30,24 +30,7 @@ async function processarTexto() {
   document.querySelector(".btn-loader").style.display = "flex";
 
   try {
-    // Faz a requisição para o backend
-    const response = await fetch("/processar", {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-      },
-      body: JSON.stringify({
-        texto: textoEntrada,
-        tipo: tipoProcessamento
-      }),
-    });
-
-    const data = await response.json();
-
-    if (data.sucesso) {
-      // data.resultado agora é um objeto com vários campos
-      const resultado = data.resultado;
-
+    const exibirResultado = (resultado) => {
       // Compõe um Markdown completo a partir dos campos retornados
       const compiledMarkdown = compilarResultadoEmMarkdown(resultado, tipoProcessamento);
 
@@ -55,8 +38,17 @@ async function processarTexto() {
       textoMarkdownOriginal = compiledMarkdown;
 
       // Converte Markdown para HTML básico e exibe
-      const html = converterMarkdownParaHTML(compiledMarkdown);
-      textoSaida.innerHTML = html;
+      textoSaida.innerHTML = converterMarkdownParaHTML(compiledMarkdown);
+    };
+
+    // Com streaming, os campos são exibidos à medida que o modelo os conclui
+    const data = suportaStreaming()
+      ? await processarViaStream(textoEntrada, tipoProcessamento, exibirResultado)
+      : await processarViaJSON(textoEntrada, tipoProcessamento);
+
+    if (data.sucesso) {
+      // data.resultado é um objeto com vários campos
+      exibirResultado(data.resultado);
 
       // Mostra os botões de download
       downloadButtons.style.display = "flex";
@@ -74,6 +66,96 @@ async function processarTexto() {
   }
 }
 
+/**
+ * Verifica se o navegador permite ler a resposta como fluxo
+ */
+function suportaStreaming() {
+  return typeof ReadableStream !== "undefined" && typeof TextDecoder !== "undefined";
+}
+
+/**
+ * Processa o texto em uma única requisição JSON (/processar)
+ */
+async function processarViaJSON(texto, tipo) {
+  const response = await fetch("/processar", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ texto: texto, tipo: tipo }),
+  });
+
+  return response.json();
+}
+
+/**
+ * Processa o texto via Server-Sent Events (/processar/stream).
+ * Chama onParcial a cada campo recebido e retorna {sucesso, resultado|erro}.
+ */
+async function processarViaStream(texto, tipo, onParcial) {
+  const response = await fetch("/processar/stream", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ texto: texto, tipo: tipo }),
+  });
+
+  // Erros de validação vêm como JSON comum
+  if (!response.ok || !response.body) {
+    return response.json();
+  }
+
+  const leitor = response.body.getReader();
+  const decodificador = new TextDecoder("utf-8");
+  const parcial = {};
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await leitor.read();
+    if (done) break;
+
+    buffer += decodificador.decode(value, { stream: true });
+
+    // Eventos SSE são separados por uma linha em branco
+    let fimEvento;
+    while ((fimEvento = buffer.indexOf("\n\n")) !== -1) {
+      const bloco = buffer.slice(0, fimEvento);
+      buffer = buffer.slice(fimEvento + 2);
+
+      const evento = lerEventoSSE(bloco);
+      if (evento.tipo === "campo") {
+        parcial[evento.dados.campo] = evento.dados.valor;
+        onParcial(parcial);
+      } else if (evento.tipo === "fim") {
+        return { sucesso: true, resultado: evento.dados.resultado };
+      } else if (evento.tipo === "erro") {
+        return { sucesso: false, erro: evento.dados.erro };
+      }
+    }
+  }
+
+  return { sucesso: false, erro: "A resposta foi interrompida antes do fim. Tente novamente." };
+}
+
+/**
+ * Converte um bloco SSE ("event: ...\ndata: ...") em {tipo, dados}
+ */
+function lerEventoSSE(bloco) {
+  let tipo = "message";
+  let dados = "";
+
+  bloco.split("\n").forEach((linha) => {
+    if (linha.startsWith("event:")) {
+      tipo = linha.slice(6).trim();
+    } else if (linha.startsWith("data:")) {
+      dados += linha.slice(5).trim();
+    }
+  });
+
+  return { tipo: tipo, dados: dados ? JSON.parse(dados) : null };
+}
+
 /**
  * Converte Markdown básico para HTML
  */